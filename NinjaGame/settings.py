@@ -49,6 +49,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'gameforge.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -131,6 +132,32 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Stockage des images: disque local avec écritures atomiques, ou S3 compatible
+# (MinIO en local, via django-storages) avec MEDIA_STORAGE=s3
+MEDIA_STORAGE = os.environ.get('MEDIA_STORAGE', 'local').lower()
+STORAGES = {
+    'default': {
+        'BACKEND': 'gameforge.storage.AtomicFileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+if MEDIA_STORAGE == 's3':
+    STORAGES['default'] = {
+        'BACKEND': 'storages.backends.s3.S3Storage',
+        'OPTIONS': {
+            'bucket_name': os.environ.get('MEDIA_S3_BUCKET', 'gameforge-media'),
+            'endpoint_url': os.environ.get('MEDIA_S3_ENDPOINT_URL', 'http://localhost:9000'),
+            'access_key': os.environ.get('MEDIA_S3_ACCESS_KEY', 'minioadmin'),
+            'secret_key': os.environ.get('MEDIA_S3_SECRET_KEY', 'minioadmin'),
+            'querystring_auth': False,
+        },
+    }
+# Écriture des images dans des threads dédiés, hors du thread de la requête
+MEDIA_BACKGROUND_WRITES = os.environ.get('MEDIA_BACKGROUND_WRITES', 'True').lower() == 'true'
+MEDIA_WRITE_WORKERS = int(os.environ.get('MEDIA_WRITE_WORKERS', '2'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -145,3 +172,109 @@ LOGOUT_REDIRECT_URL = 'home'
 REMOTE_LLM_URL = os.environ.get('REMOTE_LLM_URL', 'http://localhost:80')
 USE_REMOTE_LLM = os.environ.get('USE_REMOTE_LLM', 'False').lower() == 'true'
 HUGGINGFACE_TOKEN = os.environ.get('HUGGINGFACE_TOKEN', '')
+
+# Backends d'IA factices pour les tests de performance (aucun modèle ni réseau requis)
+AI_STUB_BACKEND = os.environ.get('AI_STUB_BACKEND', 'False').lower() == 'true'
+AI_STUB_CONFIG = {
+    'ttft': float(os.environ.get('AI_STUB_TTFT', '0.05')),  # secondes avant le premier token
+    'token_latency': float(os.environ.get('AI_STUB_TOKEN_LATENCY', '0.01')),  # secondes par token
+    'error_rate': float(os.environ.get('AI_STUB_ERROR_RATE', '0.0')),
+    'min_tokens': int(os.environ.get('AI_STUB_MIN_TOKENS', '20')),
+    'max_tokens': int(os.environ.get('AI_STUB_MAX_TOKENS', '80')),
+    'image_latency': float(os.environ.get('AI_STUB_IMAGE_LATENCY', '0.2')),
+    'image_error_rate': float(os.environ.get('AI_STUB_IMAGE_ERROR_RATE', '0.0')),
+    'image_size': int(os.environ.get('AI_STUB_IMAGE_SIZE', '512')),
+    'seed': int(os.environ.get('AI_STUB_SEED', '0')),
+}
+
+# Cache (partagé entre les workers si REDIS_URL est défini)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Durée de vie de la page publique d'un jeu en cache (invalidée par signaux)
+GAME_DETAIL_CACHE_TIMEOUT = int(os.environ.get('GAME_DETAIL_CACHE_TIMEOUT', '3600'))
+
+# Classement des jeux tendance
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', '48'))
+TRENDING_SIZE = int(os.environ.get('TRENDING_SIZE', '24'))
+TRENDING_CACHE_TIMEOUT = int(os.environ.get('TRENDING_CACHE_TIMEOUT', '900'))
+
+# Nombre maximal d'appels simultanés par backend d'IA (par processus)
+AI_BACKEND_CONCURRENCY = {
+    'LOCAL': int(os.environ.get('AI_CONCURRENCY_LOCAL', '1')),
+    'REMOTE': int(os.environ.get('AI_CONCURRENCY_REMOTE', '4')),
+    'LMSTUDIO': int(os.environ.get('AI_CONCURRENCY_LMSTUDIO', '2')),
+    'CHATGPT': int(os.environ.get('AI_CONCURRENCY_CHATGPT', '8')),
+    'HUGGINGFACE': int(os.environ.get('AI_CONCURRENCY_HUGGINGFACE', '4')),
+    'IMAGES': int(os.environ.get('AI_CONCURRENCY_IMAGES', '2')),
+    'STUB': int(os.environ.get('AI_CONCURRENCY_STUB', '64')),
+    # Requêtes en vol vers run_model_server, qui les regroupe en lots
+    'LOCAL_SERVER': int(os.environ.get('AI_CONCURRENCY_LOCAL_SERVER', '16')),
+}
+
+# Profilage des requêtes (en-tête X-Profile pour le staff, ou échantillonnage)
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_DUMP_DIR = os.environ.get('PROFILING_DUMP_DIR') or None
+PROFILING_USE_PYINSTRUMENT = os.environ.get('PROFILING_USE_PYINSTRUMENT', 'False').lower() == 'true'
+
+# Nombre de contextes partagés dont le cache clé/valeur est conservé (modèle local, 0 pour désactiver)
+AI_PREFIX_CACHE_SIZE = int(os.environ.get('AI_PREFIX_CACHE_SIZE', '8'))
+
+# Mode d'inférence du modèle local (FLOAT32, INT8 ou ONNX); vide pour utiliser celui d'AISettings
+LOCAL_INFERENCE_MODE = os.environ.get('LOCAL_INFERENCE_MODE') or None
+# Dossier des modèles convertis (quantifiés ou exportés en ONNX)
+LOCAL_MODEL_CACHE_DIR = os.environ.get('LOCAL_MODEL_CACHE_DIR', str(BASE_DIR / 'model_cache'))
+
+# Socket Unix de run_model_server: les workers web utilisent ce serveur au lieu de charger le modèle
+LOCAL_MODEL_SERVER_SOCKET = os.environ.get('LOCAL_MODEL_SERVER_SOCKET') or None
+LOCAL_MODEL_SERVER_TIMEOUT = float(os.environ.get('LOCAL_MODEL_SERVER_TIMEOUT', '120'))
+
+# Limites de génération de jeux (seaux à jetons partagés via le cache):
+# `capacity` générations d'affilée, puis `per_hour` par heure
+GENERATION_RATE_LIMIT_USER = {'capacity': 5, 'per_hour': 30}
+GENERATION_RATE_LIMIT_BACKEND = {
+    'LOCAL': {'capacity': 10, 'per_hour': 120},
+    'LOCAL_SERVER': {'capacity': 20, 'per_hour': 360},
+    'LMSTUDIO': {'capacity': 10, 'per_hour': 120},
+    'REMOTE': {'capacity': 20, 'per_hour': 360},
+}
+# Poids des utilisateurs dans la file équitable des créneaux de chaque backend
+GENERATION_QUEUE_WEIGHTS = {'default': 1, 'staff': 2}
+
+# Mode variantes en cache: chaque prompt a au plus N variantes, mises en cache et partagées
+# entre les appels identiques simultanés (0 pour désactiver)
+AI_TEXT_CACHE_VARIANTS = int(os.environ.get('AI_TEXT_CACHE_VARIANTS', '0'))
+AI_TEXT_CACHE_TIMEOUT = int(os.environ.get('AI_TEXT_CACHE_TIMEOUT', '86400'))
+# Met en cache chaque génération sous (prompt, paramètres, graine): rejouer un jeu avec sa
+# graine réutilise les sections inchangées au lieu de les régénérer
+AI_TEXT_CACHE_SEEDED = os.environ.get('AI_TEXT_CACHE_SEEDED', 'True').lower() == 'true'
+# Budget de tokens (prompts et textes générés) d'une génération de jeu; 0 pour ne pas limiter
+GENERATION_TOKEN_BUDGET = int(os.environ.get('GENERATION_TOKEN_BUDGET', '4000'))
+# Version des prompts (voir gameforge.prompts; la plus récente si vide)
+PROMPT_TEMPLATE_VERSION = os.environ.get('PROMPT_TEMPLATE_VERSION', '')
+# Test A/B des prompts: poids de chaque version, tirée au sort par jeu (ex: "v1:50,v2:50")
+PROMPT_TEMPLATE_AB = {
+    version: int(weight)
+    for version, _, weight in (item.partition(':') for item in os.environ.get('PROMPT_TEMPLATE_AB', '').split(',') if item)
+}
+# Attente maximale d'une génération identique lancée par un autre processus
+AI_SINGLE_FLIGHT_TIMEOUT = float(os.environ.get('AI_SINGLE_FLIGHT_TIMEOUT', '120'))
+
+# Jeton des scrapers Prometheus pour /metrics (en-tête Authorization: Bearer); vide: staff seulement
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Sondes de disponibilité des backends (en secondes)
+HEALTH_PROBE_INTERVAL = int(os.environ.get('HEALTH_PROBE_INTERVAL', '30'))
+# Ne déclarer l'application prête que si un backend de génération répond
+HEALTH_REQUIRE_BACKEND = os.environ.get('HEALTH_REQUIRE_BACKEND', 'False').lower() == 'true'
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Game, Character, Location, GameImage, Favorite, AISettings
+from .models import Game, Character, Location, GameImage, Favorite, GameTrend, AISettings, GenerationRecord
 
 # Register your models here.
 class CharacterInline(admin.TabularInline):
@@ -16,7 +16,7 @@ class GameImageInline(admin.TabularInline):
 
 @admin.register(Game)
 class GameAdmin(admin.ModelAdmin):
-    list_display = ('title', 'creator', 'genre', 'ambiance', 'is_public', 'created_at')
+    list_display = ('title', 'creator', 'genre', 'ambiance', 'is_public', 'favorite_count', 'created_at')
     list_filter = ('genre', 'ambiance', 'is_public', 'created_at')
     search_fields = ('title', 'creator__username', 'keywords')
     inlines = [CharacterInline, LocationInline, GameImageInline]
@@ -27,6 +27,11 @@ class GameAdmin(admin.ModelAdmin):
             return qs
         return qs.filter(creator=request.user)
 
+    def save_model(self, request, obj, form, change):
+        # La prémisse est modifiable ici: le résumé des cartes doit suivre
+        obj.refresh_summary()
+        super().save_model(request, obj, form, change)
+
 @admin.register(Character)
 class CharacterAdmin(admin.ModelAdmin):
     list_display = ('name', 'game', 'character_class', 'role')
@@ -50,9 +55,20 @@ class FavoriteAdmin(admin.ModelAdmin):
     list_filter = ('created_at',)
     search_fields = ('user__username', 'game__title')
 
+@admin.register(GameTrend)
+class GameTrendAdmin(admin.ModelAdmin):
+    list_display = ('game', 'score', 'refreshed_at')
+    ordering = ('-score',)
+
+@admin.register(GenerationRecord)
+class GenerationRecordAdmin(admin.ModelAdmin):
+    list_display = ('game', 'section', 'backend', 'template_version', 'seed', 'cache_hit', 'fallback', 'created_at')
+    list_filter = ('backend', 'template_version', 'cache_hit', 'fallback')
+    search_fields = ('game__title', 'section', 'prompt_hash', 'output_hash')
+
 @admin.register(AISettings)
 class AISettingsAdmin(admin.ModelAdmin):
-    list_display = ('use_remote_llm', 'remote_llm_url', 'updated_at')
+    list_display = ('use_remote_llm', 'remote_llm_url', 'local_inference_mode', 'updated_at')
 
     def has_add_permission(self, request):
         # Only allow adding if no AISettings exist yet
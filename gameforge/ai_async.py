@@ -0,0 +1,300 @@
+import asyncio
+import contextvars
+import logging
+import weakref
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from . import ai_utils, metrics, prompts, ratelimit
+from .ai_utils import (
+    BACKEND_MODELS, MAX_RETRIES, clean_llm_output, count_tokens, get_ai_settings, resolve_backend,
+    truncate_at_stop,
+)
+from .cache_utils import CacheLockTimeout, acache_lock
+
+try:
+    import httpx
+
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Backends appelés en HTTP (/v1/completions), servis sans thread par la boucle d'événements
+ASYNC_BACKENDS = ('REMOTE', 'LMSTUDIO', 'LOCAL_SERVER')
+
+# Clients HTTP de chaque boucle d'événements (un client httpx ne peut pas
+# changer de boucle), fermés quand la boucle s'arrête
+_loop_clients = weakref.WeakKeyDictionary()
+_slots_held = contextvars.ContextVar('gameforge_async_slots_held', default=frozenset())
+
+
+async def _close_on_shutdown(clients):
+    # Générateur asynchrone laissé suspendu: asyncio.run, uvicorn et asgiref
+    # (vues asynchrones servies en WSGI, une boucle par requête) appellent
+    # loop.shutdown_asyncgens() avant de fermer la boucle, ce qui exécute le finally
+    try:
+        yield
+    finally:
+        for client in list(clients.values()):
+            await client.aclose()
+        clients.clear()
+
+
+async def _client(backend):
+    """Client HTTP partagé par backend: les connexions sont réutilisées d'un appel à l'autre."""
+    loop = asyncio.get_running_loop()
+    state = _loop_clients.get(loop)
+    if state is None:
+        clients = {}
+        closer = _close_on_shutdown(clients)
+        await closer.__anext__()
+        state = _loop_clients[loop] = (clients, closer)
+    clients = state[0]
+    key = 'LOCAL_SERVER' if backend == 'LOCAL_SERVER' else 'HTTP'
+    client = clients.get(key)
+    if client is None:
+        if key == 'LOCAL_SERVER':
+            transport = httpx.AsyncHTTPTransport(uds=settings.LOCAL_MODEL_SERVER_SOCKET)
+            client = httpx.AsyncClient(transport=transport, base_url="http://localhost",
+                                       timeout=settings.LOCAL_MODEL_SERVER_TIMEOUT)
+        else:
+            client = httpx.AsyncClient(timeout=30)
+        clients[key] = client
+    return client
+
+
+@asynccontextmanager
+async def backend_slot(backend, user=None):
+    """
+    Réserve un créneau sur un backend selon `AI_BACKEND_CONCURRENCY`, dans
+    la même file équitable que ai_utils.backend_slot: la limite vaut pour
+    tout le processus, threads et boucles d'événements confondus, et
+    l'attente n'occupe aucun thread. Réentrant pour les nouvelles tentatives.
+
+    Args:
+        backend (str): Nom du backend (voir resolve_backend)
+        user (User, optional): L'utilisateur pour qui le créneau est réservé
+    """
+    limit = getattr(settings, 'AI_BACKEND_CONCURRENCY', {}).get(backend)
+    held = _slots_held.get()
+    if backend is None or not limit or backend in held:
+        yield
+        return
+
+    slots = ai_utils.fair_slots(backend, limit)
+    await slots.aacquire(ai_utils.slot_flow(user), weight=ratelimit.queue_weight(user))
+    token = _slots_held.set(held | {backend})
+    try:
+        yield
+    finally:
+        _slots_held.reset(token)
+        slots.release()
+
+
+async def agenerate_text(prompt, max_new_tokens=80, patience=2, user=None, prefix=None,
+                         section=None, seed=None, stop=None):
+    """
+    Variante asynchrone de ai_utils.generate_text, mêmes arguments et même
+    résultat. Les backends HTTP (LLM distant, LM Studio, serveur de modèle
+    local) sont appelés avec httpx sans occuper de thread; les autres
+    (modèle local, ChatGPT, Hugging Face, backends factices) passent par
+    generate_text dans un thread.
+
+    Returns:
+        str: Le texte généré
+    """
+    user_settings = await sync_to_async(get_ai_settings)(user)
+    backend = resolve_backend(user, user_settings)
+    if not HTTPX_AVAILABLE or backend not in ASYNC_BACKENDS:
+        return await sync_to_async(ai_utils.generate_text, thread_sensitive=False)(
+            prompt, max_new_tokens, patience, user=user, prefix=prefix, section=section, seed=seed, stop=stop,
+        )
+
+    # URL résolue une fois pour cet appel: les globales d'ai_utils suivent la dernière requête
+    endpoint = ai_utils.backend_url(backend, user_settings)
+    prompt_tokens = count_tokens(prefix) + count_tokens(prompt) if prefix else count_tokens(prompt)
+    retry = metrics.current_call() is not None
+    with metrics.track_call(backend, BACKEND_MODELS.get(backend), prompt_tokens) as call:
+        if retry:
+            if call.retries > MAX_RETRIES:
+                logger.warning(f"Génération insuffisante après {MAX_RETRIES} nouvelles tentatives pour: {prompt}")
+                metrics.mark_fallback()
+                return f"{prompt} (génération insuffisante)"
+            seed = (call.seed + call.retries) & 0x7fffffff
+            return await _agenerate_in_slot(backend, endpoint, prompt, max_new_tokens, patience, user, prefix, seed, stop)
+
+        seed, max_new_tokens = ai_utils._start_call(call, prompt, prefix, max_new_tokens, patience, section, seed, stop)
+        if max_new_tokens <= 0:
+            text = ai_utils._budget_exhausted(call, prompt)
+        elif ai_utils._uses_text_cache(backend):
+            # Même cache et mêmes générations partagées que generate_text
+            key = ai_utils._text_cache_key(backend, user_settings, prompt, prefix, max_new_tokens, patience, seed, stop)
+            text = await _asingle_flight(key, call, lambda: _agenerate_in_slot(
+                backend, endpoint, prompt, max_new_tokens, patience, user, prefix, seed, stop,
+            ))
+        else:
+            text = await _agenerate_in_slot(backend, endpoint, prompt, max_new_tokens, patience, user,
+                                            prefix, seed, stop)
+        ai_utils._finish_call(call, text)
+    return text
+
+
+async def _asingle_flight(key, call, generate):
+    """
+    Variante asynchrone de ai_utils._single_flight, sur les mêmes générations
+    en cours: un appel identique déjà lancé par un thread, une autre boucle
+    ou un autre processus est attendu au lieu d'être refait.
+    """
+    cached = await cache.aget(key)
+    if cached is not None:
+        call.cache_hit = True
+        return cached
+
+    with ai_utils._in_flight_lock:
+        future = ai_utils._in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = ai_utils._in_flight[key] = Future()
+
+    if not leader:
+        text, fallback = await asyncio.wrap_future(future)
+        call.cache_hit = True
+        call.fallback = fallback
+        return text
+
+    try:
+        try:
+            async with acache_lock(f"text:{key}", timeout=settings.AI_SINGLE_FLIGHT_TIMEOUT,
+                                   wait=settings.AI_SINGLE_FLIGHT_TIMEOUT):
+                text = await cache.aget(key)
+                if text is not None:
+                    call.cache_hit = True
+                else:
+                    text = await generate()
+                    if not call.fallback:
+                        await cache.aset(key, text, settings.AI_TEXT_CACHE_TIMEOUT)
+        except CacheLockTimeout:
+            text = await generate()
+        future.set_result((text, call.fallback))
+        return text
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with ai_utils._in_flight_lock:
+            del ai_utils._in_flight[key]
+
+
+async def _agenerate_in_slot(backend, endpoint, prompt, max_new_tokens, patience, user, prefix, seed, stop):
+    async with backend_slot(backend, user):
+        return await _agenerate_http(backend, endpoint, prompt, max_new_tokens, patience, user, prefix, seed, stop)
+
+
+async def _agenerate_http(backend, endpoint, prompt, max_new_tokens, patience, user, prefix, seed, stop):
+    """
+    Appel /v1/completions d'un backend HTTP, avec les mêmes replis et nouvelles
+    tentatives que generate_text. `endpoint` est l'URL de base résolue par
+    agenerate_text (None pour le serveur de modèle local, joint par son socket).
+    """
+    url = f"{endpoint or ''}/v1/completions"
+    payload = ai_utils._completion_payload(ai_utils._full_prompt(prompt, prefix, seed), max_new_tokens,
+                                           patience, seed, stop)
+
+    try:
+        response = await (await _client(backend)).post(url, json=payload)
+    except httpx.HTTPError as e:
+        logger.error(f"Erreur de connexion au backend {backend}: {e}")
+        metrics.mark_fallback()
+        return f"{prompt} (erreur de connexion: {str(e)[:30]}...)"
+
+    if response.status_code != 200:
+        logger.error(f"Erreur API du backend {backend}: {response.status_code} - {response.text}")
+        metrics.mark_fallback()
+        return f"{prompt} (erreur API: {response.status_code})"
+
+    try:
+        generated_text = response.json()["choices"][0].get("text", "")
+        clean_text = clean_llm_output(truncate_at_stop(generated_text, stop).strip())
+    except Exception as e:
+        # Réponse 200 mal formée: même repli que generate_text
+        logger.error(f"Réponse invalide du backend {backend}: {e}")
+        metrics.mark_fallback()
+        return f"{prompt} (erreur: {str(e)[:30]}...)"
+    if not clean_text or len(clean_text) < 5:
+        logger.warning(f"Génération insuffisante pour: {prompt}")
+        return await agenerate_text(prompt, max_new_tokens, patience=min(patience + 1, 3), user=user,
+                                    prefix=prefix, stop=stop)
+    return clean_text
+
+
+async def aclose_clients():
+    """Ferme tout de suite les clients HTTP de la boucle en cours, sans attendre son arrêt."""
+    state = _loop_clients.pop(asyncio.get_running_loop(), None)
+    if state is not None:
+        await state[1].aclose()
+
+
+async def agenerate_story(title, genre, ambiance, keywords=None, refs=None, random_mode=False, user=None):
+    """Variante asynchrone de ai_utils.generate_story: les sections sont générées en parallèle."""
+    if random_mode or not await sync_to_async(ai_utils.ai_available)(user):
+        return ai_utils.random_story(genre, ambiance)
+
+    base_context, section_prompts = ai_utils.story_prompts(title, genre, ambiance, keywords, refs)
+    texts = await asyncio.gather(*(
+        agenerate_text(section_prompts[section], user=user, prefix=base_context, section=f"story:{section}", **params)
+        for section, params in ai_utils.STORY_SECTION_PARAMS.items()
+    ))
+    return dict(zip(ai_utils.STORY_SECTION_PARAMS, texts))
+
+
+async def agenerate_character(game_genre, role, user=None, use_ai=None, prefix=None):
+    """Variante asynchrone de ai_utils.generate_character: les quatre textes sont générés en parallèle."""
+    if use_ai is None:
+        use_ai = await sync_to_async(ai_utils.ai_available)(user)
+    if not use_ai:
+        return ai_utils.generate_character(game_genre, role, use_ai=False)
+
+    label, template, _, _ = ai_utils.character_spec(role)
+    background, gameplay, name, class_text = await asyncio.gather(
+        agenerate_text(prompts.render(f"{template}.background", role=label, genre=game_genre), max_new_tokens=80,
+                       patience=2, user=user, prefix=prefix, section=f"character:{label}:background",
+                       stop=ai_utils.PARAGRAPH_STOP),
+        agenerate_text(prompts.render(f"{template}.gameplay", role=label, genre=game_genre), max_new_tokens=80,
+                       patience=2, user=user, prefix=prefix, section=f"character:{label}:gameplay",
+                       stop=ai_utils.PARAGRAPH_STOP),
+        agenerate_text(prompts.render("character.name", role=label, genre=game_genre), max_new_tokens=10,
+                       patience=1, user=user, prefix=prefix, section=f"character:{label}:name",
+                       stop=ai_utils.LINE_STOP),
+        agenerate_text(prompts.render("character.class", role=label, genre=game_genre), max_new_tokens=10,
+                       patience=1, user=user, prefix=prefix, section=f"character:{label}:class",
+                       stop=ai_utils.LINE_STOP),
+    )
+    return {
+        "name": ai_utils.parse_character_name(name),
+        "character_class": ai_utils.parse_character_class(class_text),
+        "role": role,
+        "background": background,
+        "gameplay": gameplay,
+    }
+
+
+async def agenerate_location(game_ambiance, user=None, use_ai=None, prefix=None):
+    """Variante asynchrone de ai_utils.generate_location (la description dépend du nom généré)."""
+    if use_ai is None:
+        use_ai = await sync_to_async(ai_utils.ai_available)(user)
+    if not use_ai:
+        return ai_utils.random_location(game_ambiance)
+
+    name = await agenerate_text(prompts.render("location.name", ambiance=game_ambiance), max_new_tokens=15,
+                                patience=1, user=user, prefix=prefix, section="location:name",
+                                stop=ai_utils.LINE_STOP)
+    description = await agenerate_text(prompts.render("location.description", ambiance=game_ambiance, name=name),
+                                       max_new_tokens=80, patience=2, user=user, prefix=prefix,
+                                       section="location:description", stop=ai_utils.PARAGRAPH_STOP)
+    return {"name": name, "description": description}
@@ -0,0 +1,156 @@
+import hashlib
+import io
+import random
+import time
+
+from PIL import Image, ImageDraw
+from django.conf import settings
+
+from . import metrics
+
+# Vocabulaire utilisé par le backend texte factice
+STUB_WORDS = [
+    "le", "héros", "traverse", "une", "cité", "oubliée", "où", "les", "ombres",
+    "murmurent", "des", "secrets", "anciens", "et", "chaque", "pas", "révèle",
+    "un", "nouveau", "danger", "alors", "que", "royaume", "vacille", "sous",
+    "la", "menace", "d'un", "mal", "mystérieux", "lumière", "forêt", "temple",
+    "cristal", "tempête", "alliés", "destin", "combat", "artefact", "voyage",
+]
+
+_text_backend = None
+_image_backend = None
+
+
+class StubBackendError(Exception):
+    """Erreur simulée par les backends factices."""
+
+
+class StubTextBackend:
+    """
+    Backend de génération de texte factice et déterministe.
+
+    Émule un LLM avec un temps jusqu'au premier token, une latence par token,
+    un taux d'erreur et une longueur de sortie configurables. La sortie ne
+    dépend que du prompt et de la graine, ce qui rend les mesures reproductibles.
+    """
+
+    def __init__(self, ttft=0.05, token_latency=0.01, error_rate=0.0,
+                 min_tokens=20, max_tokens=80, seed=0):
+        self.ttft = ttft
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.seed = seed
+
+    def _rng(self, prompt):
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def complete(self, prompt, max_tokens=None):
+        """
+        Génère une complétion factice pour le prompt.
+
+        Args:
+            prompt (str): Le prompt à compléter
+            max_tokens (int, optional): Nombre maximum de tokens à produire
+
+        Returns:
+            str: Le texte généré
+
+        Raises:
+            StubBackendError: Si une erreur est simulée pour ce prompt
+        """
+        rng = self._rng(prompt)
+        time.sleep(self.ttft)
+        metrics.first_token()
+
+        if rng.random() < self.error_rate:
+            raise StubBackendError("erreur simulée par le backend factice")
+
+        upper = self.max_tokens if max_tokens is None else min(self.max_tokens, max_tokens)
+        lower = min(self.min_tokens, upper)
+        n_tokens = rng.randint(lower, upper)
+        time.sleep(self.token_latency * n_tokens)
+
+        words = [rng.choice(STUB_WORDS) for _ in range(n_tokens)]
+        if words:
+            words[0] = words[0].capitalize()
+        return " ".join(words) + "."
+
+
+class StubImageBackend:
+    """Backend de génération d'images factice et déterministe."""
+
+    def __init__(self, latency=0.2, error_rate=0.0, size=512, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.size = size
+        self.seed = seed
+
+    def generate(self, prompt, width=None, height=None):
+        """
+        Génère une image factice pour le prompt.
+
+        Args:
+            prompt (str): Le prompt de génération d'image
+            width (int, optional): Largeur de l'image
+            height (int, optional): Hauteur de l'image
+
+        Returns:
+            bytes: L'image encodée en JPEG
+
+        Raises:
+            StubBackendError: Si une erreur est simulée pour ce prompt
+        """
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).digest()
+        rng = random.Random(int.from_bytes(digest[:8], "big"))
+        time.sleep(self.latency)
+
+        if rng.random() < self.error_rate:
+            raise StubBackendError("erreur simulée par le backend d'images factice")
+
+        width = width or self.size
+        height = height or self.size
+        img = Image.new('RGB', (width, height), color=tuple(digest[:3]))
+        d = ImageDraw.Draw(img)
+        d.text((20, 20), prompt[:60], fill=(255, 255, 255))
+
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG')
+        return buffer.getvalue()
+
+
+def is_enabled():
+    """Indique si les backends factices sont activés dans les paramètres."""
+    return getattr(settings, 'AI_STUB_BACKEND', False)
+
+
+def get_text_backend():
+    """Retourne le backend texte factice configuré dans les paramètres."""
+    global _text_backend
+    if _text_backend is None:
+        config = getattr(settings, 'AI_STUB_CONFIG', {})
+        _text_backend = StubTextBackend(
+            ttft=config.get('ttft', 0.05),
+            token_latency=config.get('token_latency', 0.01),
+            error_rate=config.get('error_rate', 0.0),
+            min_tokens=config.get('min_tokens', 20),
+            max_tokens=config.get('max_tokens', 80),
+            seed=config.get('seed', 0),
+        )
+    return _text_backend
+
+
+def get_image_backend():
+    """Retourne le backend d'images factice configuré dans les paramètres."""
+    global _image_backend
+    if _image_backend is None:
+        config = getattr(settings, 'AI_STUB_CONFIG', {})
+        _image_backend = StubImageBackend(
+            latency=config.get('image_latency', 0.2),
+            error_rate=config.get('image_error_rate', 0.0),
+            size=config.get('image_size', 512),
+            seed=config.get('seed', 0),
+        )
+    return _image_backend
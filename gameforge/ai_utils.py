@@ -3,14 +3,25 @@ import os
 import json
 import re
 import io
+import copy
+import gc
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
 
 
 import requests
 from PIL import Image, ImageDraw, ImageFont
 from django.conf import settings
+from django.core.cache import cache
 from huggingface_hub import InferenceClient
 import logging
 import openai
+from . import ai_stubs, llm_server, metrics, prompts, ratelimit, storage
+from .cache_utils import CacheLockTimeout, cache_lock
 try:
     from .models import AISettings, UserAISettings
 except ImportError:
@@ -18,21 +29,56 @@ except ImportError:
     UserAISettings = None
 
 try:
-    from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
+    from transformers import (
+        pipeline, AutoModelForCausalLM, AutoTokenizer, DynamicCache, StoppingCriteria, StoppingCriteriaList,
+    )
     import torch
 
     TRANSFORMERS_AVAILABLE = True
 except ImportError:
     TRANSFORMERS_AVAILABLE = False
 
+try:
+    from optimum.onnxruntime import ORTModelForCausalLM
+
+    OPTIMUM_AVAILABLE = True
+except ImportError:
+    OPTIMUM_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
 MODEL_LOADED = False
 text_generator = None
 tokenizer = None
+model = None
+LOCAL_INFERENCE_MODE = None
 USE_REMOTE_LLM = False
 REMOTE_LLM_URL = None
 
+# Modèle servi par chaque backend, pour les métriques
+BACKEND_MODELS = {
+    'STUB': 'stub',
+    'CHATGPT': 'gpt-3.5-turbo-instruct',
+    'HUGGINGFACE': 'mistralai/Mistral-7B-Instruct-v0.2',
+    'LMSTUDIO': 'lmstudio',
+    'REMOTE': 'qwen3-8b',
+    'LOCAL': 'LaiCharts/OsGPT',
+    'LOCAL_SERVER': 'LaiCharts/OsGPT',
+}
+
+# Créneaux limitant le nombre d'appels simultanés par backend
+_backend_semaphores = {}
+_backend_semaphores_lock = threading.Lock()
+_backend_slot_state = threading.local()
+
+# Cache LRU des clés/valeurs d'attention des contextes partagés (modèle local)
+_prefix_cache = OrderedDict()
+_prefix_cache_lock = threading.Lock()
+
+# Générations en cours en mode variantes en cache, par clé
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
 
 def clean_llm_output(text):
     """
@@ -137,58 +183,184 @@ def get_ai_settings(user=None):
     REMOTE_LLM_URL = settings.REMOTE_LLM_URL
     return None
 
-get_ai_settings()
 
-if TRANSFORMERS_AVAILABLE and not USE_REMOTE_LLM:
-    try:
-        model_name = "LaiCharts/OsGPT"
+def remote_llm_url(user_settings=None):
+    """
+    URL du LLM distant pour les paramètres retournés par get_ai_settings.
+    Les globales USE_REMOTE_LLM et REMOTE_LLM_URL sont réécrites à chaque
+    appel de get_ai_settings, pour l'utilisateur de la dernière requête: un
+    appel en cours ne doit pas s'y fier.
+
+    Args:
+        user_settings (optional): Paramètres retournés par get_ai_settings
+
+    Returns:
+        str: L'URL du LLM distant, ou None s'il n'est pas utilisé
+    """
+    if UserAISettings is not None and isinstance(user_settings, UserAISettings):
+        if user_settings.ai_service in ('LOCAL', 'HUGGINGFACE', 'CHATGPT'):
+            return None
+        if user_settings.ai_service == 'LMSTUDIO' and user_settings.lmstudio_url:
+            return user_settings.lmstudio_url
+        return settings.REMOTE_LLM_URL
+    if AISettings is not None and isinstance(user_settings, AISettings):
+        return user_settings.remote_llm_url if user_settings.use_remote_llm else None
+    return settings.REMOTE_LLM_URL if settings.USE_REMOTE_LLM else None
+
+
+def backend_url(backend, user_settings=None):
+    """URL de base d'un backend HTTP (LM Studio ou LLM distant) pour ces paramètres, sinon None."""
+    if backend == 'LMSTUDIO':
+        return getattr(user_settings, 'lmstudio_url', None)
+    if backend == 'REMOTE':
+        return remote_llm_url(user_settings)
+    return None
+
+
+def local_inference_mode():
+    """
+    Retourne le mode d'inférence du modèle local: `settings.LOCAL_INFERENCE_MODE`
+    s'il est défini, sinon celui choisi dans AISettings.
+
+    Returns:
+        str: FLOAT32, INT8 ou ONNX
+    """
+    mode = settings.LOCAL_INFERENCE_MODE
+    if not mode and AISettings is not None:
+        try:
+            mode = AISettings.get_settings().local_inference_mode
+        except Exception as e:
+            logger.error(f"Error getting AI settings from database: {e}")
+
+    if mode == 'ONNX' and not OPTIMUM_AVAILABLE:
+        logger.warning("optimum[onnxruntime] n'est pas installé, utilisation du mode FLOAT32")
+        mode = 'FLOAT32'
+    return mode or 'FLOAT32'
+
+
+def _converted_model_dir(model_name, mode):
+    return os.path.join(settings.LOCAL_MODEL_CACHE_DIR, f"{model_name.replace('/', '--')}-{mode.lower()}")
 
-        logger.info(f"Début du chargement du modèle {model_name}...")
 
-        # Chargement du tokenizer
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        logger.info(f"Tokenizer {model_name} chargé")
+def load_local_model(model_name, mode='FLOAT32'):
+    """
+    Charge le modèle local pour une inférence sur CPU.
+
+    En mode INT8, les couches linéaires sont quantifiées dynamiquement; en
+    mode ONNX, le modèle est exporté pour ONNX Runtime (optimum). Les modèles
+    convertis sont conservés dans `LOCAL_MODEL_CACHE_DIR` pour ne les
+    convertir qu'une fois.
+
+    Args:
+        model_name (str): Nom du modèle sur le Hub Hugging Face
+        mode (str, optional): FLOAT32, INT8 ou ONNX
+
+    Returns:
+        tuple: Le tokenizer et le modèle
+    """
+    if mode == 'ONNX' and not OPTIMUM_AVAILABLE:
+        raise RuntimeError("Le mode ONNX nécessite optimum[onnxruntime]")
+
+    logger.info(f"Début du chargement du modèle {model_name} ({mode})...")
 
+    # Chargement du tokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    logger.info(f"Tokenizer {model_name} chargé")
+
+    converted_dir = _converted_model_dir(model_name, mode)
+    if mode == 'ONNX':
+        if os.path.isdir(converted_dir):
+            model = ORTModelForCausalLM.from_pretrained(converted_dir)
+        else:
+            model = ORTModelForCausalLM.from_pretrained(model_name, export=True)
+            model.save_pretrained(converted_dir)
+            logger.info(f"Modèle ONNX enregistré dans {converted_dir}")
+    elif mode == 'INT8':
+        converted_path = os.path.join(converted_dir, "model.pt")
+        if os.path.exists(converted_path):
+            model = torch.load(converted_path, weights_only=False)
+        else:
+            model = AutoModelForCausalLM.from_pretrained(model_name, low_cpu_mem_usage=True, torch_dtype=torch.float32)
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            os.makedirs(converted_dir, exist_ok=True)
+            tmp_path = f"{converted_path}.tmp"
+            torch.save(model, tmp_path)
+            os.replace(tmp_path, converted_path)
+            logger.info(f"Modèle quantifié enregistré dans {converted_path}")
+        model.eval()
+    else:
         # Chargement du modèle avec optimisations CPU uniquement
         model = AutoModelForCausalLM.from_pretrained(
             model_name,
             low_cpu_mem_usage=True,  # Économiser la mémoire
             torch_dtype=torch.float32,  # Format 32-bit standard pour CPU
         )
-        logger.info(f"Modèle {model_name} chargé")
+
+    logger.info(f"Modèle {model_name} chargé")
+    return tokenizer, model
+
+
+
+def prepare_for_fork():
+    """
+    Prépare le processus maître avant la création des workers (gunicorn avec
+    preload_app): les objets déjà chargés sont exclus du ramasse-miettes,
+    pour que les workers partagent les pages des poids par copy-on-write au
+    lieu de les copier.
+
+    Les poids ne sont pas déplacés en mémoire partagée (share_memory): chaque
+    tenseur serait recopié dans un segment partagé, ce qui double le pic de
+    mémoire du maître sans rien apporter au partage après fork().
+    """
+    if model is not None and hasattr(model, "eval"):
+        # Mode inférence fixé avant le fork, pour que les workers n'aient rien à modifier
+        model.eval()
+
+    # Le ramasse-miettes écrit dans l'en-tête des objets qu'il parcourt, ce qui
+    # copierait les pages partagées dans chaque worker
+    gc.collect()
+    gc.freeze()
+
+get_ai_settings()
+
+if ai_stubs.is_enabled():
+    # Backends factices pour les tests de performance: aucun modèle à charger
+    MODEL_LOADED = True
+    logger.info("Utilisation des backends d'IA factices (AI_STUB_BACKEND)")
+elif settings.LOCAL_MODEL_SERVER_SOCKET and not USE_REMOTE_LLM:
+    # Le modèle est servi par run_model_server: une seule copie pour tous les workers.
+    # Le serveur peut démarrer après l'application: sa disponibilité n'est pas
+    # figée ici, chaque appel se replie s'il ne répond pas et le moniteur de
+    # santé (gameforge.health) suit son état.
+    MODEL_LOADED = True
+    logger.info(f"Utilisation du serveur de modèle local sur {settings.LOCAL_MODEL_SERVER_SOCKET}")
+elif TRANSFORMERS_AVAILABLE and not USE_REMOTE_LLM:
+    try:
+        model_name = "LaiCharts/OsGPT"
+        LOCAL_INFERENCE_MODE = local_inference_mode()
+
+        tokenizer, model = load_local_model(model_name, LOCAL_INFERENCE_MODE)
 
         # Créer le pipeline avec le modèle optimisé pour CPU
-        text_generator = pipeline(
-            "text-generation",
-            model=model,
-            tokenizer=tokenizer,
-            device=-1,  # Forcer l'utilisation du CPU
-            batch_size=1  # Ne pas surcharger la mémoire
-        )
+        pipeline_options = {'batch_size': 1}  # Ne pas surcharger la mémoire
+        if LOCAL_INFERENCE_MODE != 'ONNX':
+            pipeline_options['device'] = -1  # Forcer l'utilisation du CPU
+        text_generator = pipeline("text-generation", model=model, tokenizer=tokenizer, **pipeline_options)
 
         # Test simple du modèle
         test_result = text_generator("Bonjour, je suis un", max_length=30, do_sample=True, temperature=1.0)
         logger.info(f"Test du modèle: {test_result[0]['generated_text']}")
 
         MODEL_LOADED = True
-        logger.info(f"Modèle {model_name} initialisé avec succès")
+        logger.info(f"Modèle {model_name} initialisé avec succès ({LOCAL_INFERENCE_MODE})")
     except Exception as e:
         logger.error(f"Erreur lors du chargement du modèle: {e}")
         logger.error(f"Détail: {str(e)}")
         logger.info("Utilisation du mode de génération aléatoire comme solution de repli")
 elif USE_REMOTE_LLM:
-    try:
-        logger.info(f"Utilisation du LLM distant à {REMOTE_LLM_URL}")
-        response = requests.get(f"{REMOTE_LLM_URL}/health", timeout=5)
-        if response.status_code == 200:
-            MODEL_LOADED = True
-            logger.info("LLM distant disponible et prêt à être utilisé")
-        else:
-            logger.error(f"LLM distant non disponible: {response.status_code}")
-            logger.info("Utilisation du mode de génération aléatoire comme solution de repli")
-    except Exception as e:
-        logger.error(f"Erreur lors de la connexion au LLM distant: {e}")
-        logger.info("Utilisation du mode de génération aléatoire comme solution de repli")
+    # Comme pour le serveur de modèle local: disponibilité suivie par le moniteur de santé
+    MODEL_LOADED = True
+    logger.info(f"Utilisation du LLM distant à {REMOTE_LLM_URL}")
 
 # Listes existantes conservées comme solution de repli (inchangées)
 GAME_TITLES = [
@@ -219,16 +391,244 @@ LOCATION_NAMES = [
 ]
 
 
-def generate_text(prompt, max_length=150, max_new_tokens=80, patience=2, user=None):
+def resolve_backend(user=None, user_settings=None):
+    """
+    Détermine le backend qui servira les appels de génération de texte.
+
+    Args:
+        user (User, optional): L'utilisateur pour lequel générer du texte
+        user_settings (optional): Paramètres retournés par get_ai_settings
+
+    Returns:
+        str: Nom du backend (STUB, CHATGPT, HUGGINGFACE, LMSTUDIO, REMOTE, LOCAL_SERVER, LOCAL) ou None
+    """
+    if ai_stubs.is_enabled():
+        return 'STUB'
+    if user and user.is_authenticated and isinstance(user_settings, UserAISettings):
+        if user_settings.ai_service == 'CHATGPT' and user_settings.chatgpt_token:
+            return 'CHATGPT'
+        if user_settings.ai_service == 'HUGGINGFACE' and user_settings.huggingface_token:
+            return 'HUGGINGFACE'
+        if user_settings.ai_service == 'LMSTUDIO' and user_settings.lmstudio_url:
+            return 'LMSTUDIO'
+    if remote_llm_url(user_settings):
+        return 'REMOTE'
+    if settings.LOCAL_MODEL_SERVER_SOCKET:
+        return 'LOCAL_SERVER'
+    if TRANSFORMERS_AVAILABLE and text_generator is not None:
+        return 'LOCAL'
+    return None
+
+
+def fair_slots(backend, limit):
+    """File équitable des créneaux d'un backend, partagée par tout le processus."""
+    with _backend_semaphores_lock:
+        slots = _backend_semaphores.get(backend)
+        if slots is None:
+            slots = _backend_semaphores[backend] = ratelimit.FairSlots(limit)
+    return slots
+
+
+def slot_flow(user):
+    """Flux d'un utilisateur dans la file équitable (les anonymes en partagent un)."""
+    return user.id if user is not None and user.is_authenticated else None
+
+
+@contextmanager
+def backend_slot(backend, user=None):
+    """
+    Réserve un créneau d'exécution sur un backend, selon les limites de
+    `AI_BACKEND_CONCURRENCY`. Les créneaux sont attribués par file équitable
+    entre utilisateurs. Réentrant dans un même thread, pour que les
+    nouvelles tentatives récursives de generate_text ne se bloquent pas.
+
+    Args:
+        backend (str): Nom du backend (voir resolve_backend)
+        user (User, optional): L'utilisateur pour qui le créneau est réservé
+    """
+    limit = getattr(settings, 'AI_BACKEND_CONCURRENCY', {}).get(backend)
+    held = getattr(_backend_slot_state, 'held', set())
+    if backend is None or not limit or backend in held:
+        yield
+        return
+
+    slots = fair_slots(backend, limit)
+    slots.acquire(slot_flow(user), weight=ratelimit.queue_weight(user))
+    _backend_slot_state.held = held | {backend}
+    try:
+        yield
+    finally:
+        _backend_slot_state.held = held
+        slots.release()
+
+
+def count_tokens(text):
+    """
+    Compte les tokens d'un texte avec le tokenizer actif, ou les estime par
+    le nombre de mots si aucun tokenizer n'est chargé.
+
+    Args:
+        text (str): Le texte à mesurer
+
+    Returns:
+        int: Nombre de tokens
+    """
+    if not text:
+        return 0
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    return len(text.split())
+
+
+def _prefix_kv_cache(prefix):
+    """
+    Retourne les tokens d'un contexte partagé et son cache clé/valeur,
+    calculé une seule fois puis conservé dans un cache LRU borné par
+    `AI_PREFIX_CACHE_SIZE`.
+
+    Args:
+        prefix (str): Le contexte partagé
+
+    Returns:
+        tuple: Les identifiants de tokens du contexte et son cache clé/valeur
+    """
+    with _prefix_cache_lock:
+        entry = _prefix_cache.get(prefix)
+        if entry is not None:
+            _prefix_cache.move_to_end(prefix)
+            return entry
+
+    prefix_ids = tokenizer(prefix, return_tensors="pt").input_ids
+    with torch.no_grad():
+        past_key_values = model(input_ids=prefix_ids, past_key_values=DynamicCache(), use_cache=True).past_key_values
+    entry = (prefix_ids, past_key_values)
+
+    with _prefix_cache_lock:
+        _prefix_cache[prefix] = entry
+        _prefix_cache.move_to_end(prefix)
+        while len(_prefix_cache) > settings.AI_PREFIX_CACHE_SIZE:
+            _prefix_cache.popitem(last=False)
+    return entry
+
+
+def generate_local_with_prefix(prefix, prompt, max_new_tokens=80, temperature=0.9, top_p=0.9,
+                               repetition_penalty=1.2, use_prefix_cache=True, stop=None):
+    """
+    Génère du texte avec le modèle local en réutilisant le cache clé/valeur
+    du contexte partagé, pour ne calculer l'attention que sur le prompt propre
+    à chaque section.
+
+    Args:
+        prefix (str): Contexte partagé entre plusieurs appels
+        prompt (str): Instruction propre à cet appel
+        max_new_tokens (int, optional): Nombre maximum de nouveaux tokens à générer
+        temperature (float, optional): Température d'échantillonnage
+        top_p (float, optional): Seuil de l'échantillonnage nucleus
+        repetition_penalty (float, optional): Pénalité de répétition
+        use_prefix_cache (bool, optional): Désactiver pour mesurer le gain du cache
+        stop (list, optional): Séquences qui arrêtent la génération
+
+    Returns:
+        str: Le texte généré, sans le prompt
+    """
+    prompt_ids = tokenizer(prompt, return_tensors="pt", add_special_tokens=False).input_ids
+    if use_prefix_cache:
+        prefix_ids, prefix_cache = _prefix_kv_cache(prefix)
+        # generate() complète le cache: on travaille sur une copie
+        past_key_values = copy.deepcopy(prefix_cache)
+    else:
+        prefix_ids = tokenizer(prefix, return_tensors="pt").input_ids
+        past_key_values = None
+
+    input_ids = torch.cat([prefix_ids, prompt_ids], dim=-1)
+    with torch.no_grad():
+        output = model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=past_key_values,
+            max_new_tokens=max_new_tokens,
+            do_sample=True,
+            temperature=temperature,
+            top_p=top_p,
+            top_k=50,
+            repetition_penalty=repetition_penalty,
+            no_repeat_ngram_size=3,
+            pad_token_id=tokenizer.eos_token_id,
+            stopping_criteria=_stopping_criteria(stop, input_ids.shape[-1]),
+        )
+    return truncate_at_stop(tokenizer.decode(output[0, input_ids.shape[-1]:], skip_special_tokens=True), stop)
+
+
+def truncate_at_stop(text, stop):
+    """
+    Coupe un texte généré à la première séquence d'arrêt, pour les backends
+    qui ne les appliquent pas eux-mêmes ou qui les incluent dans le texte.
+
+    Args:
+        text (str): Le texte généré
+        stop (list): Séquences d'arrêt (None ou vide: texte inchangé)
+
+    Returns:
+        str: Le texte jusqu'à la première séquence d'arrêt exclue
+    """
+    # Une séquence avant tout texte (saut de ligne initial) n'arrête rien
+    start = len(text) - len(text.lstrip())
+    for sequence in stop or ():
+        index = text.find(sequence, start)
+        if index > start:
+            text = text[:index]
+    return text
+
+
+if TRANSFORMERS_AVAILABLE:
+    class StopOnSequences(StoppingCriteria):
+        """Arrête la génération locale dès qu'une séquence d'arrêt apparaît dans le texte généré."""
+
+        def __init__(self, stop, prompt_length):
+            self.stop = stop
+            self.prompt_length = prompt_length
+
+        def __call__(self, input_ids, scores, **kwargs):
+            text = tokenizer.decode(input_ids[0, self.prompt_length:], skip_special_tokens=True)
+            done = truncate_at_stop(text, self.stop) != text
+            return torch.full((input_ids.shape[0],), done, dtype=torch.bool, device=input_ids.device)
+
+    class FirstTokenCriteria(StoppingCriteria):
+        """N'arrête jamais la génération: appelé après chaque token, il en note le premier pour les métriques."""
+
+        def __call__(self, input_ids, scores, **kwargs):
+            metrics.first_token()
+            return torch.zeros((input_ids.shape[0],), dtype=torch.bool, device=input_ids.device)
+
+
+def _stopping_criteria(stop, prompt_length):
+    criteria = [FirstTokenCriteria()]
+    if stop:
+        criteria.append(StopOnSequences(stop, prompt_length))
+    return StoppingCriteriaList(criteria)
+
+
+# Nouvelles tentatives au plus après une génération vide ou trop courte
+MAX_RETRIES = 2
+
+
+def generate_text(prompt, max_new_tokens=80, patience=2, user=None, prefix=None,
+                  section=None, seed=None, stop=None):
     """
     Génère du texte en utilisant le service d'IA préféré de l'utilisateur.
 
     Args:
         prompt (str): Texte de prompt pour amorcer la génération
-        max_length (int, optional): Longueur maximale du texte généré
-        max_new_tokens (int, optional): Nombre maximum de nouveaux tokens à générer
+        max_new_tokens (int, optional): Budget de tokens générés, quelle que soit
+            la longueur du prompt (réduit si le budget du jeu est presque épuisé)
         patience (int, optional): Niveau de patience (1-3) influençant les paramètres de génération
         user (User, optional): L'utilisateur pour lequel générer du texte
+        prefix (str, optional): Contexte partagé placé avant le prompt; le modèle
+            local réutilise son cache clé/valeur d'un appel à l'autre
+        section (str, optional): Section générée, pour la traçabilité
+        seed (int, optional): Graine d'échantillonnage (par défaut dérivée de
+            celle de la génération en cours)
+        stop (list, optional): Séquences qui arrêtent la génération
 
     Returns:
         str: Le texte généré
@@ -236,29 +636,200 @@ def generate_text(prompt, max_length=150, max_new_tokens=80, patience=2, user=No
     # Reload settings in case they've changed
     user_settings = get_ai_settings(user)
 
+    backend = resolve_backend(user, user_settings)
+    prompt_tokens = count_tokens(prefix) + count_tokens(prompt) if prefix else count_tokens(prompt)
+    # Les nouvelles tentatives récursives ne passent pas par le cache
+    retry = metrics.current_call() is not None
+    with metrics.track_call(backend, BACKEND_MODELS.get(backend), prompt_tokens) as call:
+        if retry:
+            if call.retries > MAX_RETRIES:
+                logger.warning(f"Génération insuffisante après {MAX_RETRIES} nouvelles tentatives pour: {prompt}")
+                metrics.mark_fallback()
+                return f"{prompt} (génération insuffisante)"
+            # Nouvelle graine à chaque tentative, reproductible elle aussi
+            seed = (call.seed + call.retries) & 0x7fffffff
+            text = _generate_in_slot(backend, prompt, max_new_tokens, patience, user, user_settings, prefix, seed, stop)
+            return text
+
+        seed, max_new_tokens = _start_call(call, prompt, prefix, max_new_tokens, patience, section, seed, stop)
+        if max_new_tokens <= 0:
+            text = _budget_exhausted(call, prompt)
+        elif _uses_text_cache(backend):
+            # Même graine et même prompt: la génération peut être rejouée depuis le cache
+            key = _text_cache_key(backend, user_settings, prompt, prefix, max_new_tokens, patience, seed, stop)
+            text = _single_flight(key, call, lambda: _generate_in_slot(
+                backend, prompt, max_new_tokens, patience, user, user_settings, prefix, seed, stop,
+            ))
+        else:
+            text = _generate_in_slot(backend, prompt, max_new_tokens, patience, user, user_settings, prefix, seed, stop)
+        _finish_call(call, text)
+    return text
+
+
+def _start_call(call, prompt, prefix, max_new_tokens, patience, section, seed, stop):
+    """
+    Fixe la graine et le budget de tokens d'un appel et enregistre sa provenance.
+
+    Returns:
+        tuple: La graine et le nombre maximum de tokens à générer (0 ou moins:
+        budget du jeu épuisé)
+    """
+    # Budget de tokens du jeu: le prompt est compté, la génération est plafonnée au reste
+    target_tokens = max_new_tokens
+    max_new_tokens = metrics.reserve_tokens(call, max_new_tokens)
+
+    if seed is None:
+        seed = metrics.next_seed(section)
+        if settings.AI_TEXT_CACHE_VARIANTS > 0:
+            # Mode variantes en cache: chaque prompt a un nombre fini de variantes,
+            # et les appels identiques simultanés partagent une seule génération.
+            # La variante dérive de la graine du job, qui reste reproductible;
+            # une graine explicite est gardée telle quelle.
+            seed %= settings.AI_TEXT_CACHE_VARIANTS
+    call.record(section=section, seed=seed, template_version=prompts.active_version(),
+                params={'max_new_tokens': max_new_tokens, 'target_tokens': target_tokens,
+                        'patience': patience, 'stop': stop or []},
+                prompt=f"{prefix or ''}{prompt}")
+    return seed, max_new_tokens
+
+
+def _budget_exhausted(call, prompt):
+    logger.warning(f"Budget de tokens du jeu épuisé pour: {prompt}")
+    # Le prompt n'est pas envoyé: il ne compte pas dans le budget
+    call.prompt_tokens = 0
+    metrics.mark_fallback()
+    return f"{prompt} (budget de tokens épuisé)"
+
+
+def _finish_call(call, text):
+    if not call.fallback and not call.cache_hit:
+        call.completion_tokens = count_tokens(text)
+    call.output = text
+
+
+def _uses_text_cache(backend):
+    return backend is not None and (settings.AI_TEXT_CACHE_VARIANTS > 0 or settings.AI_TEXT_CACHE_SEEDED)
+
+
+def _generate_in_slot(backend, prompt, max_new_tokens, patience, user, user_settings, prefix, seed, stop):
+    with backend_slot(backend, user):
+        return _generate_text(prompt, max_new_tokens, patience, user, user_settings, prefix, seed, stop)
+
+
+def _text_cache_key(backend, user_settings, prompt, prefix, max_new_tokens, patience, seed, stop):
+    # LM Studio est propre à chaque utilisateur: son URL fait partie de la clé
+    endpoint = backend_url(backend, user_settings)
+    raw = json.dumps([backend, BACKEND_MODELS.get(backend), endpoint, prefix, prompt,
+                      max_new_tokens, patience, seed, stop])
+    return f"gameforge:text:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+
+def _single_flight(key, call, generate):
+    """
+    Retourne le texte en cache pour `key`, ou le génère une seule fois pour
+    tous les appels identiques en cours: entre threads par un Future partagé,
+    entre processus par un verrou dans le cache.
+
+    Args:
+        key (str): Clé de cache de la génération
+        call (GenerationCall): Mesures de l'appel en cours
+        generate (callable): Génère le texte
+
+    Returns:
+        str: Le texte généré ou partagé
+    """
+    cached = cache.get(key)
+    if cached is not None:
+        call.cache_hit = True
+        return cached
+
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = Future()
+
+    if not leader:
+        text, fallback = future.result()
+        call.cache_hit = True
+        call.fallback = fallback
+        return text
+
+    try:
+        try:
+            with cache_lock(f"text:{key}", timeout=settings.AI_SINGLE_FLIGHT_TIMEOUT, wait=settings.AI_SINGLE_FLIGHT_TIMEOUT):
+                # Un autre processus a pu générer ce texte pendant l'attente du verrou
+                text = cache.get(key)
+                if text is not None:
+                    call.cache_hit = True
+                else:
+                    text = generate()
+                    if not call.fallback:
+                        cache.set(key, text, settings.AI_TEXT_CACHE_TIMEOUT)
+        except CacheLockTimeout:
+            text = generate()
+        future.set_result((text, call.fallback))
+        return text
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+
+
+def _sampling_params(patience):
+    """Température, top_p et pénalité de répétition selon le niveau de patience."""
+    if patience == 1:  # Rapide mais moins créatif
+        return 0.7, 0.85, 1.1
+    if patience == 3:  # Lent mais plus créatif
+        return 1.2, 0.95, 1.3
+    return 0.9, 0.9, 1.2  # Équilibré (par défaut)
+
+
+def _full_prompt(prompt, prefix, seed):
+    # Ajout d'un identifiant unique pour éviter les répétitions entre appels,
+    # dérivé de la graine pour que la génération reste reproductible.
+    # La réponse commence à la ligne suivante: un saut de ligne initial
+    # ne déclenche pas les séquences d'arrêt des backends distants
+    return f"{prefix or ''}{prompt} #{seed % 10000}\n"
+
+
+def _completion_payload(full_prompt, max_new_tokens, patience, seed, stop):
+    """Requête /v1/completions (format OpenAI) commune au LLM distant, à LM Studio et au serveur local."""
+    temperature, top_p, repetition_penalty = _sampling_params(patience)
+    return {
+        "prompt": full_prompt,
+        "max_tokens": max_new_tokens,
+        "temperature": temperature,
+        "top_p": top_p,
+        "repetition_penalty": repetition_penalty,
+        "seed": seed,
+        "stop": stop or []
+    }
+
+
+def _generate_text(prompt, max_new_tokens, patience, user, user_settings, prefix=None, seed=None, stop=None):
+    """Implémentation de generate_text, appelée avec un créneau du backend réservé."""
     # Check if we have a valid model or user settings
     if not MODEL_LOADED and (user_settings is None or not isinstance(user_settings, UserAISettings)):
         logger.warning(f"Aucun modèle disponible pour: {prompt}")
+        metrics.mark_fallback()
         return f"{prompt} (mode texte aléatoire)"
 
-    # Ajuster les paramètres selon le niveau de patience
-    if patience == 1:  # Rapide mais moins créatif
-        temperature = 0.7
-        top_p = 0.85
-        repetition_penalty = 1.1
-    elif patience == 3:  # Lent mais plus créatif
-        temperature = 1.2
-        top_p = 0.95
-        repetition_penalty = 1.3
-    else:  # Équilibré (par défaut)
-        temperature = 0.9
-        top_p = 0.9
-        repetition_penalty = 1.2
+    temperature, top_p, repetition_penalty = _sampling_params(patience)
 
     try:
-        # Ajout d'un identifiant unique pour éviter les répétitions entre appels
-        unique_id = random.randint(1, 10000)
-        full_prompt = f"{prompt} #{unique_id}"
+        if seed is None:
+            seed = random.getrandbits(31)
+        unique_id = seed % 10000
+        full_prompt = _full_prompt(prompt, prefix, seed)
+
+        # Backends factices pour les tests de performance (prioritaires sur tout le reste)
+        if ai_stubs.is_enabled():
+            # Le prompt sans identifiant unique garde la sortie déterministe
+            generated_text = ai_stubs.get_text_backend().complete(f"{prefix or ''}{prompt}", max_tokens=max_new_tokens)
+            return clean_llm_output(truncate_at_stop(generated_text, stop).strip())
 
         # Check if we're using a user-specific AI service
         if user and user.is_authenticated and isinstance(user_settings, UserAISettings):
@@ -277,7 +848,9 @@ def generate_text(prompt, max_length=150, max_new_tokens=80, patience=2, user=No
                         temperature=temperature,
                         top_p=top_p,
                         frequency_penalty=repetition_penalty - 1.0,  # Convert to OpenAI scale
-                        presence_penalty=0.0
+                        presence_penalty=0.0,
+                        seed=seed,
+                        stop=stop or None
                     )
 
                     generated_text = response.choices[0].text
@@ -285,12 +858,13 @@ def generate_text(prompt, max_length=150, max_new_tokens=80, patience=2, user=No
 
                     if not clean_text or len(clean_text) < 5:
                         logger.warning(f"Génération ChatGPT insuffisante pour: {prompt}")
-                        return generate_text(prompt, max_length, max_new_tokens, 
-                                           patience=min(patience + 1, 3), user=user)
+                        return generate_text(prompt, max_new_tokens, 
+                                           patience=min(patience + 1, 3), user=user, prefix=prefix, stop=stop)
 
                     return clean_text
                 except Exception as e:
                     logger.error(f"Erreur ChatGPT: {e}")
+                    metrics.mark_fallback()
                     return f"{prompt} (erreur ChatGPT: {str(e)[:30]}...)"
 
             elif ai_service == 'HUGGINGFACE' and user_settings.huggingface_token:
@@ -304,34 +878,30 @@ def generate_text(prompt, max_length=150, max_new_tokens=80, patience=2, user=No
                         max_new_tokens=max_new_tokens,
                         temperature=temperature,
                         top_p=top_p,
-                        repetition_penalty=repetition_penalty
+                        repetition_penalty=repetition_penalty,
+                        seed=seed,
+                        stop_sequences=stop or None
                     )
 
-                    # Clean the response
-                    clean_text = clean_llm_output(response.strip())
+                    # Clean the response (TGI inclut la séquence d'arrêt dans le texte)
+                    clean_text = clean_llm_output(truncate_at_stop(response, stop).strip())
 
                     if not clean_text or len(clean_text) < 5:
                         logger.warning(f"Génération Hugging Face insuffisante pour: {prompt}")
-                        return generate_text(prompt, max_length, max_new_tokens, 
-                                           patience=min(patience + 1, 3), user=user)
+                        return generate_text(prompt, max_new_tokens, 
+                                           patience=min(patience + 1, 3), user=user, prefix=prefix, stop=stop)
 
                     return clean_text
                 except Exception as e:
                     logger.error(f"Erreur Hugging Face: {e}")
+                    metrics.mark_fallback()
                     return f"{prompt} (erreur Hugging Face: {str(e)[:30]}...)"
 
             elif ai_service == 'LMSTUDIO' and user_settings.lmstudio_url:
                 # Use LM Studio API
                 lmstudio_url = user_settings.lmstudio_url
 
-                payload = {
-                    "prompt": full_prompt,
-                    "max_tokens": max_new_tokens,
-                    "temperature": temperature,
-                    "top_p": top_p,
-                    "repetition_penalty": repetition_penalty,
-                    "stop": []
-                }
+                payload = _completion_payload(full_prompt, max_new_tokens, patience, seed, stop)
 
                 try:
                     response = requests.post(
@@ -344,35 +914,31 @@ def generate_text(prompt, max_length=150, max_new_tokens=80, patience=2, user=No
                     if response.status_code == 200:
                         result = response.json()
                         generated_text = result.get("choices", [{}])[0].get("text", "")
-                        clean_text = clean_llm_output(generated_text.strip())
+                        clean_text = clean_llm_output(truncate_at_stop(generated_text, stop).strip())
 
                         if not clean_text or len(clean_text) < 5:
                             logger.warning(f"Génération LM Studio insuffisante pour: {prompt}")
-                            return generate_text(prompt, max_length, max_new_tokens, 
-                                               patience=min(patience + 1, 3), user=user)
+                            return generate_text(prompt, max_new_tokens, 
+                                               patience=min(patience + 1, 3), user=user, prefix=prefix, stop=stop)
 
                         return clean_text
                     else:
                         logger.error(f"Erreur API LM Studio: {response.status_code} - {response.text}")
+                        metrics.mark_fallback()
                         return f"{prompt} (erreur API LM Studio: {response.status_code})"
                 except Exception as e:
                     logger.error(f"Erreur de connexion à LM Studio: {e}")
+                    metrics.mark_fallback()
                     return f"{prompt} (erreur de connexion à LM Studio: {str(e)[:30]}...)"
 
         # Fallback to standard remote or local LLM
-        if USE_REMOTE_LLM and REMOTE_LLM_URL:
+        remote_url = remote_llm_url(user_settings)
+        if remote_url:
             # Utiliser le LLM distant
-            payload = {
-                "prompt": full_prompt,
-                "max_tokens": 200,  # "max_tokens": max_new_tokens,
-                "temperature": temperature,
-                "top_p": top_p,
-                "repetition_penalty": repetition_penalty,
-                "stop": []
-            }
+            payload = _completion_payload(full_prompt, max_new_tokens, patience, seed, stop)
 
             response = requests.post(
-                f"{REMOTE_LLM_URL}/v1/completions",
+                f"{remote_url}/v1/completions",
                 json=payload,
                 headers={"Content-Type": "application/json"},
                 timeout=30
@@ -381,53 +947,165 @@ def generate_text(prompt, max_length=150, max_new_tokens=80, patience=2, user=No
             if response.status_code == 200:
                 result = response.json()
                 generated_text = result.get("choices", [{}])[0].get("text", "")
-                clean_text = clean_llm_output(generated_text.strip())
+                clean_text = clean_llm_output(truncate_at_stop(generated_text, stop).strip())
 
                 if not clean_text or len(clean_text) < 5:
                     logger.warning(f"Génération insuffisante pour: {prompt}")
-                    return generate_text(prompt, max_length, max_new_tokens, 
-                                       patience=min(patience + 1, 3), user=user)
+                    return generate_text(prompt, max_new_tokens, 
+                                       patience=min(patience + 1, 3), user=user, prefix=prefix, stop=stop)
 
                 return clean_text
             else:
                 logger.error(f"Erreur API LLM distant: {response.status_code} - {response.text}")
+                metrics.mark_fallback()
                 return f"{prompt} (erreur API: {response.status_code})"
-        elif TRANSFORMERS_AVAILABLE and text_generator is not None:
-            # Utiliser le modèle local
-            result = text_generator(
-                full_prompt,
-                max_length=max_length,
-                max_new_tokens=max_new_tokens,
-                num_return_sequences=1,
-                temperature=temperature,
-                do_sample=True,
-                top_p=top_p,
-                top_k=50,
-                repetition_penalty=repetition_penalty,
-                no_repeat_ngram_size=3,
-                pad_token_id=tokenizer.eos_token_id
+        elif settings.LOCAL_MODEL_SERVER_SOCKET:
+            # Serveur de modèle local partagé, même format de requête que le LLM distant
+            payload = _completion_payload(full_prompt, max_new_tokens, patience, seed, stop)
+
+            status_code, result = llm_server.unix_socket_request(
+                settings.LOCAL_MODEL_SERVER_SOCKET, "POST", "/v1/completions", payload,
+                timeout=settings.LOCAL_MODEL_SERVER_TIMEOUT,
             )
 
-            # Extraire et nettoyer le texte généré
-            generated_text = result[0]['generated_text']
-            clean_text = generated_text.replace(full_prompt, "", 1).strip()
+            if status_code == 200:
+                generated_text = result.get("choices", [{}])[0].get("text", "")
+                clean_text = clean_llm_output(truncate_at_stop(generated_text, stop).strip())
+
+                if not clean_text or len(clean_text) < 5:
+                    logger.warning(f"Génération insuffisante pour: {prompt}")
+                    return generate_text(prompt, max_new_tokens,
+                                       patience=min(patience + 1, 3), user=user, prefix=prefix, stop=stop)
+
+                return clean_text
+            else:
+                logger.error(f"Erreur du serveur de modèle local: {status_code} - {result}")
+                metrics.mark_fallback()
+                return f"{prompt} (erreur API: {status_code})"
+        elif TRANSFORMERS_AVAILABLE and text_generator is not None:
+            # Échantillonnage reproductible (un seul appel local à la fois par défaut)
+            torch.manual_seed(seed)
+            if prefix and settings.AI_PREFIX_CACHE_SIZE > 0 and LOCAL_INFERENCE_MODE != 'ONNX':
+                # Modèle local avec réutilisation du cache clé/valeur du contexte partagé
+                clean_text = generate_local_with_prefix(
+                    prefix, f"{prompt} #{unique_id}\n",
+                    max_new_tokens=max_new_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    repetition_penalty=repetition_penalty,
+                    stop=stop,
+                ).strip()
+            else:
+                # Utiliser le modèle local
+                # max_new_tokens seul: le budget ne dépend pas de la longueur du prompt
+                result = text_generator(
+                    full_prompt,
+                    max_new_tokens=max_new_tokens,
+                    num_return_sequences=1,
+                    temperature=temperature,
+                    do_sample=True,
+                    top_p=top_p,
+                    top_k=50,
+                    repetition_penalty=repetition_penalty,
+                    no_repeat_ngram_size=3,
+                    pad_token_id=tokenizer.eos_token_id,
+                    stopping_criteria=_stopping_criteria(stop, len(tokenizer(full_prompt).input_ids)),
+                )
+
+                # Extraire le texte généré
+                generated_text = result[0]['generated_text']
+                clean_text = truncate_at_stop(generated_text.replace(full_prompt, "", 1), stop).strip()
+
             clean_text = clean_llm_output(clean_text)
 
             if not clean_text or len(clean_text) < 5:
                 logger.warning(f"Génération insuffisante pour: {prompt}")
-                return generate_text(prompt, max_length, max_new_tokens, 
-                                   patience=min(patience + 1, 3), user=user)
+                return generate_text(prompt, max_new_tokens, 
+                                   patience=min(patience + 1, 3), user=user, prefix=prefix, stop=stop)
 
             return clean_text
         else:
             # No valid model available
             logger.warning(f"Aucun modèle disponible pour: {prompt}")
+            metrics.mark_fallback()
             return f"{prompt} (mode texte aléatoire)"
     except Exception as e:
         logger.error(f"Erreur lors de la génération de texte: {e}")
+        metrics.mark_fallback()
         return f"{prompt} (erreur: {str(e)[:30]}...)"
 
 
+# Séquences d'arrêt: une ligne pour les noms et titres, un paragraphe pour les textes
+LINE_STOP = ["\n"]
+PARAGRAPH_STOP = ["\n\n"]
+
+# Budget de tokens, patience et séquences d'arrêt de chaque section de l'histoire
+STORY_SECTION_PARAMS = {
+    "title": {"max_new_tokens": 15, "patience": 1, "stop": LINE_STOP},
+    "premise": {"max_new_tokens": 80, "patience": 2, "stop": PARAGRAPH_STOP},
+    "act1": {"max_new_tokens": 80, "patience": 2, "stop": PARAGRAPH_STOP},
+    "act2": {"max_new_tokens": 80, "patience": 2, "stop": PARAGRAPH_STOP},
+    "act3": {"max_new_tokens": 80, "patience": 2, "stop": PARAGRAPH_STOP},
+    "twist": {"max_new_tokens": 60, "patience": 3, "stop": PARAGRAPH_STOP},
+}
+
+
+def ai_available(user=None, user_settings=None):
+    """
+    Indique si un service d'IA est utilisable pour cet utilisateur; sinon
+    le contenu est tiré au hasard.
+
+    Args:
+        user (User, optional): L'utilisateur pour lequel générer
+        user_settings (optional): Paramètres retournés par get_ai_settings
+
+    Returns:
+        bool: True si la génération par IA est possible
+    """
+    if user_settings is None:
+        user_settings = get_ai_settings(user)
+
+    if user and user.is_authenticated and isinstance(user_settings, UserAISettings):
+        if user_settings.ai_service == 'LOCAL' and not MODEL_LOADED:
+            return False
+        elif user_settings.ai_service == 'HUGGINGFACE' and not user_settings.huggingface_token:
+            return False
+        elif user_settings.ai_service == 'CHATGPT' and not user_settings.chatgpt_token:
+            return False
+        elif user_settings.ai_service == 'LMSTUDIO' and not user_settings.lmstudio_url:
+            return False
+        return True
+    return MODEL_LOADED
+
+
+def story_prompts(title, genre, ambiance, keywords=None, refs=None):
+    """
+    Construit les prompts de l'histoire: un contexte commun au jeu, suivi
+    d'une consigne courte propre à chaque section. Le contexte est passé
+    en `prefix` à generate_text pour que le modèle local ne calcule son
+    attention qu'une fois par jeu. Les textes viennent du registre de
+    prompts, dans la version active (voir prompts.active_version).
+
+    Args:
+        title (str): Le titre du jeu
+        genre (str): Le genre du jeu
+        ambiance (str): L'ambiance du jeu
+        keywords (str, optional): Mots-clés séparés par des virgules
+        refs (str, optional): Références séparées par des virgules
+
+    Returns:
+        tuple: Le contexte commun et un dictionnaire des consignes par section
+    """
+    version = prompts.active_version()
+    # Le contexte se termine par un saut de ligne pour être suivi de la consigne
+    base_context = prompts.render("story.context", version, title=title, genre=genre, ambiance=ambiance,
+                                  keywords=keywords, refs=refs) + "\n"
+    return base_context, {
+        section: prompts.render(f"story.{section}", version, genre=genre, ambiance=ambiance)
+        for section in STORY_SECTION_PARAMS
+    }
+
+
 def generate_story(title, genre, ambiance, keywords=None, refs=None, random_mode=False, user=None):
     """
     Génère une histoire pour un jeu basée sur le genre, l'ambiance et les mots-clés.
@@ -446,125 +1124,139 @@ def generate_story(title, genre, ambiance, keywords=None, refs=None, random_mode
     """
     logger.info(f"Génération d'histoire: {genre}, {ambiance}, mode aléatoire: {random_mode}")
 
-    # Get user settings
-    user_settings = get_ai_settings(user)
-
-    # Check if we should use random mode
-    use_random = random_mode
-
-    # If user has no valid AI settings, use random mode
-    if user and user.is_authenticated and isinstance(user_settings, UserAISettings):
-        if user_settings.ai_service == 'LOCAL' and not MODEL_LOADED:
-            use_random = True
-        elif user_settings.ai_service == 'HUGGINGFACE' and not user_settings.huggingface_token:
-            use_random = True
-        elif user_settings.ai_service == 'CHATGPT' and not user_settings.chatgpt_token:
-            use_random = True
-        elif user_settings.ai_service == 'LMSTUDIO' and not user_settings.lmstudio_url:
-            use_random = True
-    elif not MODEL_LOADED:
-        use_random = True
-
-    if use_random:
-        # Contenu aléatoire (inchangé)
-        random_title = random.choice(GAME_TITLES)
-        story = {
-            "title": random_title,
-            "premise": f"Dans un monde {ambiance.lower()}, un héros se lance dans une aventure {genre.lower()} pour sauver leur royaume d'un mal ancien.",
-            "act1": f"Le héros découvre son destin et part de ses humbles origines, rassemblant des alliés et des ressources pour le voyage à venir.",
-            "act2": f"Face à des défis de plus en plus difficiles, la détermination du héros est mise à l'épreuve. Ils découvrent des vérités cachées sur le monde et sur eux-mêmes.",
-            "act3": f"Après avoir surmonté leurs démons intérieurs, le héros affronte le mal ultime dans un affrontement épique qui détermine le destin du monde.",
-            "twist": f"Le mal ancien se révèle être une manifestation des propres peurs et doutes du héros, les forçant à affronter leur véritable moi."
-        }
+    # Sans service d'IA valide pour l'utilisateur, contenu aléatoire
+    if random_mode or not ai_available(user):
+        story = random_story(genre, ambiance)
     else:
-        # Construire des prompts détaillés pour de meilleurs résultats
-        key_terms = f"{genre} {ambiance}"
-        if keywords:
-            key_terms += f" {keywords}"
-
-        # Prompts en français pour de meilleurs résultats avec les modèles multilingues
-        base_context = f"""
-        CONSIGNE DE REPONSE : AUCUN SMILEY, AUCUN TEXTE GRAS , AUCUNE MISE EN FORME, JE VEUX UN TEXTE PLAT
-        Génération pour un jeu vidéo avec les caractéristiques suivantes:
-        - Titre: {title}
-        - Genre: {genre}
-        - Ambiance: {ambiance}
-        - Mots-clés: {keywords}
-        - Inspirations/Références: {refs}
-        """
-
-        title_prompt = f"""
-        {base_context}
-        Propose un titre original, accrocheur et mémorable qui capture parfaitement l'essence de ce jeu.
-        Le titre doit être court (2-5 mots maximum) et évocateur.
-        """
-        premise_prompt = f"""
-
-        {base_context}
-        Rédige un synopsis captivant pour ce jeu qui présente:
-        - L'univers et son ambiance {ambiance}
-        - Le concept central du gameplay
-        - La situation initiale qui lance l'aventure
-        - Ce qui rend ce jeu unique dans le genre {genre}
-        (Entre 3 et 5 phrases maximum)
-        """
-
-        act1_prompt = f"""
-        {base_context}
-        Décris le premier acte du jeu qui doit inclure:
-        - L'introduction du protagoniste et sa situation initiale
-        - Les événements déclencheurs qui lancent l'aventure
-        - Les premiers objectifs/missions du joueur
-        - Les mécaniques de base introduites
-        - L'ambiance {ambiance} mise en place
-        (Entre 4 et 6 phrases)
-        """
-
-        act2_prompt = f"""
-        {base_context}
-        Décris le deuxième acte du jeu qui doit détailler:
-        - L'évolution des enjeux et l'intensification du conflit principal
-        - Les défis croissants auxquels le joueur fait face
-        - Les nouvelles mécaniques/capacités débloquées
-        - Les rebondissements qui complexifient l'histoire
-        - Comment l'ambiance {ambiance} évolue
-        (Entre 4 et 6 phrases)
-        """
-
-        act3_prompt = f"""
-        {base_context}
-        Décris le climax et la conclusion du jeu, incluant:
-        - La confrontation finale ou défi ultime
-        - Comment les mécaniques et l'histoire convergent
-        - L'utilisation des capacités complètes du joueur
-        - La résolution des principaux arcs narratifs
-        - L'impact émotionnel final fidèle à l'ambiance {ambiance}
-        (Entre 4 et 6 phrases)
-        """
-
-        twist_prompt = f"""
-        {base_context}
-        Propose un rebondissement narratif ou ludique inattendu qui:
-        - Surprend le joueur à un moment clé de l'aventure
-        - Transforme sa perception de l'histoire ou des mécaniques
-        - Reste cohérent avec l'univers et le genre {genre}
-        - Ajoute une profondeur supplémentaire à l'expérience
-        (Entre 2 et 3 phrases percutantes)
-        """
+        base_context, section_prompts = story_prompts(title, genre, ambiance, keywords, refs)
 
         # Générer le contenu avec patience variable
         story = {
-            "title": generate_text(title_prompt, max_length=50, max_new_tokens=15, patience=1, user=user),
-            "premise": generate_text(premise_prompt, max_length=150, max_new_tokens=80, patience=2, user=user),
-            "act1": generate_text(act1_prompt, max_length=150, max_new_tokens=80, patience=2, user=user),
-            "act2": generate_text(act2_prompt, max_length=150, max_new_tokens=80, patience=2, user=user),
-            "act3": generate_text(act3_prompt, max_length=150, max_new_tokens=80, patience=2, user=user),
-            "twist": generate_text(twist_prompt, max_length=150, max_new_tokens=80, patience=3, user=user)
+            section: generate_text(section_prompts[section], user=user, prefix=base_context,
+                                   section=f"story:{section}", **params)
+            for section, params in STORY_SECTION_PARAMS.items()
         }
 
     return story
 
 
+def random_story(genre, ambiance):
+    """Histoire tirée au hasard, sans appel au modèle."""
+    return {
+        "title": random.choice(GAME_TITLES),
+        "premise": f"Dans un monde {ambiance.lower()}, un héros se lance dans une aventure {genre.lower()} pour sauver leur royaume d'un mal ancien.",
+        "act1": f"Le héros découvre son destin et part de ses humbles origines, rassemblant des alliés et des ressources pour le voyage à venir.",
+        "act2": f"Face à des défis de plus en plus difficiles, la détermination du héros est mise à l'épreuve. Ils découvrent des vérités cachées sur le monde et sur eux-mêmes.",
+        "act3": f"Après avoir surmonté leurs démons intérieurs, le héros affronte le mal ultime dans un affrontement épique qui détermine le destin du monde.",
+        "twist": f"Le mal ancien se révèle être une manifestation des propres peurs et doutes du héros, les forçant à affronter leur véritable moi."
+    }
+
+
+def parse_character_name(name):
+    """Extrait le nom d'un personnage du texte généré."""
+    # Extraire juste le premier mot significatif
+    name_parts = name.split()
+    if len(name_parts) > 0:
+        for part in name_parts:
+            # Chercher un mot significatif de 3 caractères ou plus
+            if len(part) >= 3 and part[0].isupper():
+                return part
+    return name_parts[0] if len(name_parts) > 0 else "Héros"
+
+
+def parse_character_class(class_text):
+    """Extrait la classe d'un personnage du texte généré."""
+    # Extraire le premier mot pertinent
+    words = class_text.split()
+    for word in words:
+        if len(word) >= 4 and word not in ["pour", "dans", "avec", "qui", "est", "une", "type"]:
+            return word.capitalize()
+    return words[0].capitalize() if words else "Guerrier"
+
+
+def _character_name(game_genre, role, user=None, use_ai=True, prefix=None):
+    if use_ai:
+        prompt = prompts.render("character.name", role=role, genre=game_genre)
+        name = generate_text(prompt, max_new_tokens=10, patience=1, user=user, prefix=prefix,
+                             section=f"character:{role}:name", stop=LINE_STOP)
+        return parse_character_name(name)
+    return random.choice(CHARACTER_NAMES)
+
+
+def _character_class(game_genre, role, user=None, use_ai=True, prefix=None):
+    if use_ai:
+        prompt = prompts.render("character.class", role=role, genre=game_genre)
+        class_text = generate_text(prompt, max_new_tokens=10, patience=1, user=user, prefix=prefix,
+                                   section=f"character:{role}:class", stop=LINE_STOP)
+        return parse_character_class(class_text)
+    return random.choice(CHARACTER_CLASSES)
+
+
+def character_spec(role):
+    """
+    Libellé, prompts et textes de repli d'un rôle de personnage.
+
+    Returns:
+        tuple: (libellé, préfixe des prompts, histoire de repli, gameplay de repli)
+    """
+    if role == "Protagonist":
+        return (
+            "protagoniste", "character.protagonist",
+            f"Un individu déterminé avec un passé mystérieux, cherchant à trouver sa place dans le monde.",
+            f"Capacités équilibrées avec potentiel de croissance dans plusieurs directions basées sur les choix du joueur.",
+        )
+    if role == "Antagonist":
+        return (
+            "antagoniste", "character.antagonist",
+            f"Autrefois une figure respectée qui a été corrompue par le pouvoir et cherche maintenant à remodeler le monde selon sa vision.",
+            f"Capacités puissantes qui défient le joueur, avec des mécaniques uniques qui doivent être comprises pour vaincre.",
+        )
+    return (
+        role.lower(), "character.other",
+        f"Un individu unique avec ses propres motivations et son histoire, dont le chemin croise celui du protagoniste.",
+        f"Capacités spécialisées qui complètent l'équipe et fournissent des options stratégiques dans diverses situations.",
+    )
+
+
+def generate_character(game_genre, role, user=None, use_ai=None, prefix=None):
+    """
+    Génère un personnage d'un rôle donné.
+
+    Args:
+        game_genre (str): Le genre du jeu
+        role (str): Rôle du personnage (Protagonist, Antagonist ou un de CHARACTER_ROLES)
+        user (User, optional): L'utilisateur pour lequel générer le personnage
+        use_ai (bool, optional): Forcer ou non l'IA (par défaut selon ai_available)
+        prefix (str, optional): Contexte du jeu placé avant chaque prompt
+
+    Returns:
+        dict: Le personnage généré
+    """
+    if use_ai is None:
+        use_ai = ai_available(user)
+
+    label, template, fallback_background, fallback_gameplay = character_spec(role)
+
+    if use_ai:
+        background_prompt = prompts.render(f"{template}.background", role=label, genre=game_genre)
+        gameplay_prompt = prompts.render(f"{template}.gameplay", role=label, genre=game_genre)
+        background = generate_text(background_prompt, max_new_tokens=80, patience=2, user=user,
+                                   prefix=prefix, section=f"character:{label}:background", stop=PARAGRAPH_STOP)
+        gameplay = generate_text(gameplay_prompt, max_new_tokens=80, patience=2, user=user,
+                                 prefix=prefix, section=f"character:{label}:gameplay", stop=PARAGRAPH_STOP)
+    else:
+        background = fallback_background
+        gameplay = fallback_gameplay
+
+    return {
+        "name": _character_name(game_genre, label, user, use_ai, prefix),
+        "character_class": _character_class(game_genre, label, user, use_ai, prefix),
+        "role": role,
+        "background": background,
+        "gameplay": gameplay
+    }
+
+
 def generate_characters(game_genre, count=2, user=None):
     """
     Génère des personnages pour un jeu.
@@ -577,113 +1269,58 @@ def generate_characters(game_genre, count=2, user=None):
     Returns:
         list: Une liste de dictionnaires de personnages
     """
-    characters = []
+    use_ai = ai_available(user)
+    return [generate_character(game_genre, role, user=user, use_ai=use_ai) for role in character_roles(count)]
 
-    # Get user settings
-    user_settings = get_ai_settings(user)
 
-    # Check if we should use AI generation
-    use_ai = True
+def character_roles(count):
+    """Rôles des personnages d'un jeu: toujours un protagoniste et un antagoniste, puis des rôles au hasard."""
+    roles = ["Protagonist", "Antagonist"]
+    # Ajouter des personnages supplémentaires si demandé
+    for _ in range(count - 2):
+        roles.append(random.choice([r for r in CHARACTER_ROLES if r not in ["Protagonist", "Antagonist"]]))
+    return roles
 
-    # If user has no valid AI settings, use random mode
-    if user and user.is_authenticated and isinstance(user_settings, UserAISettings):
-        if user_settings.ai_service == 'LOCAL' and not MODEL_LOADED:
-            use_ai = False
-        elif user_settings.ai_service == 'HUGGINGFACE' and not user_settings.huggingface_token:
-            use_ai = False
-        elif user_settings.ai_service == 'CHATGPT' and not user_settings.chatgpt_token:
-            use_ai = False
-        elif user_settings.ai_service == 'LMSTUDIO' and not user_settings.lmstudio_url:
-            use_ai = False
-    elif not MODEL_LOADED:
-        use_ai = False
-
-    # Fonctions pour générer des noms et classes aléatoires ou via modèle
-    def get_name(role):
-        if use_ai:
-            prompt = f"Un nom original pour un {role} dans un jeu {game_genre}:"
-            name = generate_text(prompt, max_length=30, max_new_tokens=10, patience=1, user=user)
-            # Extraire juste le premier mot significatif
-            name_parts = name.split()
-            if len(name_parts) > 0:
-                for part in name_parts:
-                    # Chercher un mot significatif de 3 caractères ou plus
-                    if len(part) >= 3 and part[0].isupper():
-                        return part
-            return name_parts[0] if len(name_parts) > 0 else "Héros"
-        return random.choice(CHARACTER_NAMES)
-
-    def get_class(role):
-        if use_ai:
-            prompt = f"Une classe typique pour un {role} dans un jeu {game_genre}:"
-            class_text = generate_text(prompt, max_length=30, max_new_tokens=10, patience=1, user=user)
-            # Extraire le premier mot pertinent
-            words = class_text.split()
-            for word in words:
-                if len(word) >= 4 and word not in ["pour", "dans", "avec", "qui", "est", "une", "type"]:
-                    return word.capitalize()
-            return words[0].capitalize() if words else "Guerrier"
-        return random.choice(CHARACTER_CLASSES)
-
-    # Toujours inclure un protagoniste
-    if use_ai:
-        background_prompt = f"Histoire et motivations d'un protagoniste héroïque dans un jeu {game_genre}:"
-        gameplay_prompt = f"Les capacités et le style de jeu d'un protagoniste dans un jeu {game_genre}:"
-        background = generate_text(background_prompt, max_length=150, max_new_tokens=80, patience=2, user=user)
-        gameplay = generate_text(gameplay_prompt, max_length=150, max_new_tokens=80, patience=2, user=user)
-    else:
-        background = f"Un individu déterminé avec un passé mystérieux, cherchant à trouver sa place dans le monde."
-        gameplay = f"Capacités équilibrées avec potentiel de croissance dans plusieurs directions basées sur les choix du joueur."
 
-    characters.append({
-        "name": get_name("protagoniste"),
-        "character_class": get_class("protagoniste"),
-        "role": "Protagonist",
-        "background": background,
-        "gameplay": gameplay
-    })
+def generate_location(game_ambiance, user=None, use_ai=None, prefix=None):
+    """
+    Génère un lieu.
+
+    Args:
+        game_ambiance (str): L'ambiance du jeu
+        user (User, optional): L'utilisateur pour lequel générer le lieu
+        use_ai (bool, optional): Forcer ou non l'IA (par défaut selon ai_available)
+        prefix (str, optional): Contexte du jeu placé avant chaque prompt
+
+    Returns:
+        dict: Le lieu généré
+    """
+    if use_ai is None:
+        use_ai = ai_available(user)
 
-    # Ajouter un antagoniste
     if use_ai:
-        background_prompt = f"Histoire et motivations d'un antagoniste mémorable dans un jeu {game_genre}:"
-        gameplay_prompt = f"Les capacités et les tactiques d'un antagoniste dans un jeu {game_genre}:"
-        background = generate_text(background_prompt, max_length=150, max_new_tokens=80, patience=2, user=user)
-        gameplay = generate_text(gameplay_prompt, max_length=150, max_new_tokens=80, patience=2, user=user)
-    else:
-        background = f"Autrefois une figure respectée qui a été corrompue par le pouvoir et cherche maintenant à remodeler le monde selon sa vision."
-        gameplay = f"Capacités puissantes qui défient le joueur, avec des mécaniques uniques qui doivent être comprises pour vaincre."
+        name_prompt = prompts.render("location.name", ambiance=game_ambiance)
+        name = generate_text(name_prompt, max_new_tokens=15, patience=1, user=user, prefix=prefix,
+                             section="location:name", stop=LINE_STOP)
 
-    characters.append({
-        "name": get_name("antagoniste"),
-        "character_class": get_class("antagoniste"),
-        "role": "Antagonist",
-        "background": background,
-        "gameplay": gameplay
-    })
+        desc_prompt = prompts.render("location.description", ambiance=game_ambiance, name=name)
+        description = generate_text(desc_prompt, max_new_tokens=80, patience=2, user=user,
+                                    prefix=prefix, section="location:description", stop=PARAGRAPH_STOP)
+    else:
+        return random_location(game_ambiance)
 
-    # Ajouter des personnages supplémentaires si demandé
-    for i in range(count - 2):
-        if i >= 0:  # Vérification pour éviter les indices négatifs si count < 2
-            role = random.choice([r for r in CHARACTER_ROLES if r not in ["Protagonist", "Antagonist"]])
-
-            if use_ai:
-                background_prompt = f"Histoire et motivations d'un personnage {role.lower()} dans un jeu {game_genre}:"
-                gameplay_prompt = f"Les capacités et l'utilité d'un personnage {role.lower()} dans un jeu {game_genre}:"
-                background = generate_text(background_prompt, max_length=150, max_new_tokens=80, patience=2, user=user)
-                gameplay = generate_text(gameplay_prompt, max_length=150, max_new_tokens=80, patience=2, user=user)
-            else:
-                background = f"Un individu unique avec ses propres motivations et son histoire, dont le chemin croise celui du protagoniste."
-                gameplay = f"Capacités spécialisées qui complètent l'équipe et fournissent des options stratégiques dans diverses situations."
+    return {
+        "name": name,
+        "description": description
+    }
 
-            characters.append({
-                "name": get_name(role.lower()),
-                "character_class": get_class(role.lower()),
-                "role": role,
-                "background": background,
-                "gameplay": gameplay
-            })
 
-    return characters
+def random_location(game_ambiance):
+    """Lieu tiré au hasard, sans appel au modèle."""
+    return {
+        "name": random.choice(LOCATION_NAMES),
+        "description": f"Un lieu avec une ambiance {game_ambiance.lower()} avec des défis uniques et des secrets à découvrir. L'atmosphère ici reflète le ton général du monde tout en offrant des opportunités de gameplay distinctes."
+    }
 
 
 def generate_locations(game_ambiance, count=2, user=None):
@@ -698,44 +1335,8 @@ def generate_locations(game_ambiance, count=2, user=None):
     Returns:
         list: Une liste de dictionnaires de lieux
     """
-    locations = []
-
-    # Get user settings
-    user_settings = get_ai_settings(user)
-
-    # Check if we should use AI generation
-    use_ai = True
-
-    # If user has no valid AI settings, use random mode
-    if user and user.is_authenticated and isinstance(user_settings, UserAISettings):
-        if user_settings.ai_service == 'LOCAL' and not MODEL_LOADED:
-            use_ai = False
-        elif user_settings.ai_service == 'HUGGINGFACE' and not user_settings.huggingface_token:
-            use_ai = False
-        elif user_settings.ai_service == 'CHATGPT' and not user_settings.chatgpt_token:
-            use_ai = False
-        elif user_settings.ai_service == 'LMSTUDIO' and not user_settings.lmstudio_url:
-            use_ai = False
-    elif not MODEL_LOADED:
-        use_ai = False
-
-    for i in range(count):
-        if use_ai:
-            name_prompt = f"Un nom évocateur pour un lieu avec ambiance {game_ambiance}:"
-            name = generate_text(name_prompt, max_length=40, max_new_tokens=15, patience=1, user=user)
-
-            desc_prompt = f"Description atmosphérique d'un lieu {game_ambiance} nommé {name}:"
-            description = generate_text(desc_prompt, max_length=150, max_new_tokens=80, patience=2, user=user)
-        else:
-            name = random.choice(LOCATION_NAMES)
-            description = f"Un lieu avec une ambiance {game_ambiance.lower()} avec des défis uniques et des secrets à découvrir. L'atmosphère ici reflète le ton général du monde tout en offrant des opportunités de gameplay distinctes."
-
-        locations.append({
-            "name": name,
-            "description": description
-        })
-
-    return locations
+    use_ai = ai_available(user)
+    return [generate_location(game_ambiance, user=user, use_ai=use_ai) for _ in range(count)]
 
 
 def generate_placeholder_image(prompt, image_type, filename, user=None):
@@ -751,7 +1352,8 @@ def generate_placeholder_image(prompt, image_type, filename, user=None):
     Returns:
         str: Chemin vers l'image générée
     """
-    print("GENERATION D'IMAGE")
+    logger.info(f"Génération d'image {image_type}: {prompt}")
+    started = time.perf_counter()
 
     # Get user settings
     user_settings = get_ai_settings(user)
@@ -760,6 +1362,7 @@ def generate_placeholder_image(prompt, image_type, filename, user=None):
     if user and user.is_authenticated and isinstance(user_settings, UserAISettings):
         if not user_settings.generate_images:
             logger.info(f"Génération d'images désactivée pour l'utilisateur {user.username}")
+            metrics.record_image('DISABLED', time.perf_counter() - started, fallback=True)
             return generate_fallback_image(prompt, image_type, filename, disabled=True)
 
     try:
@@ -779,13 +1382,7 @@ def generate_placeholder_image(prompt, image_type, filename, user=None):
         if not huggingface_token:
             huggingface_token = os.environ.get("HUGGINGFACE_API_KEY")
 
-        if huggingface_token:
-            # Initialiser l'InferenceClient avec le token
-            client = InferenceClient(
-                provider="cerebras",
-                api_key=huggingface_token,
-            )
-
+        if ai_stubs.is_enabled() or huggingface_token:
             # Adapter le prompt en fonction du type d'image
             if image_type == 'CHARACTER':
                 enhanced_prompt = f"Character portrait, {prompt}, detailed, fantasy style"
@@ -794,36 +1391,68 @@ def generate_placeholder_image(prompt, image_type, filename, user=None):
             else:  # CONCEPT
                 enhanced_prompt = f"Game concept art, {prompt}, detailed illustration"
 
-            # Génération d'image avec le client Hugging Face
-            image_bytes = client.text_to_image(
-                model="stabilityai/stable-diffusion-xl-base-1.0",
-                prompt=enhanced_prompt,
-                negative_prompt="low quality, blurry, distorted, deformed, bad anatomy, ugly",
-                height=512,
-                width=512,
-            )
+            with backend_slot('IMAGES', user):
+                if ai_stubs.is_enabled():
+                    # Backend d'images factice pour les tests de performance
+                    image_bytes = ai_stubs.get_image_backend().generate(enhanced_prompt, width=512, height=512)
+                else:
+                    # Initialiser l'InferenceClient avec le token
+                    client = InferenceClient(
+                        provider="cerebras",
+                        api_key=huggingface_token,
+                    )
 
-            # Créer le dossier de destination s'il n'existe pas
-            os.makedirs(os.path.join(settings.MEDIA_ROOT, 'game_images'), exist_ok=True)
+                    # Génération d'image avec le client Hugging Face
+                    image_bytes = client.text_to_image(
+                        model="stabilityai/stable-diffusion-xl-base-1.0",
+                        prompt=enhanced_prompt,
+                        negative_prompt="low quality, blurry, distorted, deformed, bad anatomy, ugly",
+                        height=512,
+                        width=512,
+                    )
 
-            # Sauvegarder l'image
-            media_path = os.path.join(settings.MEDIA_ROOT, 'game_images', filename)
-            with open(media_path, 'wb') as f:
-                f.write(image_bytes)
+            # Sauvegarder l'image (en arrière-plan), sous un nom dérivé de son contenu
+            image_path = storage.save_image(image_bytes, filename)
+
+            metrics.record_image('STUB' if ai_stubs.is_enabled() else 'HUGGINGFACE', time.perf_counter() - started)
 
             # Retourner le chemin relatif pour la base de données
-            return os.path.join('game_images', filename)
+            return image_path
         else:
             logger.warning("Token Hugging Face non disponible, utilisation de l'image placeholder")
+            metrics.record_image('NONE', time.perf_counter() - started, fallback=True)
             return generate_fallback_image(prompt, image_type, filename)
 
     except Exception as e:
         logger.error(f"Erreur lors de la génération de l'image: {e}")
+        metrics.record_image('ERROR', time.perf_counter() - started, fallback=True)
         # Fallback à l'image placeholder en cas d'erreur
         return generate_fallback_image(prompt, image_type, filename)
 
 
-def generate_fallback_image(prompt, image_type, filename, disabled=False):
+def ensure_image_written(image_path, prompt, image_type):
+    """
+    Attend l'écriture en arrière-plan d'une image avant que la base ne la
+    référence. Si l'écriture a échoué, l'image est remplacée par un
+    placeholder écrit immédiatement.
+
+    Args:
+        image_path (str): Chemin retourné par generate_placeholder_image
+        prompt (str): Le prompt de génération d'image
+        image_type (str): Type d'image (CHARACTER, LOCATION, CONCEPT)
+
+    Returns:
+        str: Chemin vers une image présente dans le stockage
+    """
+    try:
+        storage.wait_for_write(image_path)
+        return image_path
+    except Exception as e:
+        logger.error(f"Erreur lors de l'écriture de l'image {image_path}: {e}")
+        return generate_fallback_image(prompt, image_type, os.path.basename(image_path), background=False)
+
+
+def generate_fallback_image(prompt, image_type, filename, disabled=False, background=None):
     """
     Génère une image placeholder avec du texte en cas d'échec de l'API Hugging Face
     ou si la génération d'images est désactivée.
@@ -833,6 +1462,7 @@ def generate_fallback_image(prompt, image_type, filename, disabled=False):
         image_type (str): Type d'image (CHARACTER, LOCATION, CONCEPT)
         filename (str): Nom de fichier pour sauvegarder l'image
         disabled (bool, optional): Si True, indique que la génération d'images est désactivée
+        background (bool, optional): Écrire l'image en arrière-plan (voir storage.save_image)
 
     Returns:
         str: Chemin vers l'image générée
@@ -890,26 +1520,24 @@ def generate_fallback_image(prompt, image_type, filename, disabled=False):
             d.text((50, 530), "dans vos paramètres utilisateur pour générer des images avec l'IA.", 
                    fill=(255, 255, 255), font=font)
 
-        # Créer le dossier de destination s'il n'existe pas
-        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'game_images'), exist_ok=True)
-
-        # Sauvegarder l'image
-        media_path = os.path.join(settings.MEDIA_ROOT, 'game_images', filename)
-        img.save(media_path)
-
-        # Retourner le chemin relatif pour la base de données
-        return os.path.join('game_images', filename)
+        # Sauvegarder l'image (en arrière-plan), sous un nom dérivé de son contenu
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG')
+        return storage.save_image(buffer.getvalue(), filename, background=background)
 
     except Exception as e:
         logger.error(f"Erreur lors de la génération de l'image placeholder: {e}")
         # Retourner un chemin d'image par défaut en cas d'erreur
-        return 'game_images/placeholder.jpg'
+        return f"{storage.IMAGES_DIR}/placeholder.jpg"
 
 
-def check_model_status():
+def check_model_status(run_test=True):
     """
     Fonction de diagnostic pour vérifier l'état du modèle.
 
+    Args:
+        run_test (bool, optional): Lancer une vraie génération de test (lent)
+
     Returns:
         dict: Un dictionnaire contenant des informations sur l'état du modèle
     """
@@ -923,17 +1551,22 @@ def check_model_status():
         "tokenizer_loaded": tokenizer is not None if not USE_REMOTE_LLM else None
     }
 
-    if USE_REMOTE_LLM:
+    if ai_stubs.is_enabled():
+        status["model_name"] = "stub"
+    elif USE_REMOTE_LLM:
         status["remote_llm_url"] = REMOTE_LLM_URL
         status["model_name"] = "qwen3-8b (remote)"
+    elif settings.LOCAL_MODEL_SERVER_SOCKET:
+        status["model_server_socket"] = settings.LOCAL_MODEL_SERVER_SOCKET
+        status["model_name"] = "LaiCharts/OsGPT (serveur local)" if MODEL_LOADED else None
     else:
         status["model_name"] = "LaiCharts/OsGPT" if MODEL_LOADED else None
 
     # Essayer de générer du texte test si le modèle est chargé
-    if MODEL_LOADED:
+    if run_test and MODEL_LOADED:
         try:
             test_prompt = "Test de génération:"
-            test_result = generate_text(test_prompt, max_length=20, max_new_tokens=10)
+            test_result = generate_text(test_prompt, max_new_tokens=10)
             status["test_generation"] = test_result
             status["test_success"] = True
         except Exception as e:
@@ -0,0 +1,255 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.core.paginator import Paginator
+from django.db.models import BooleanField, Count, Exists, Max, OuterRef, Q, Sum, Value
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_GET, require_POST, require_http_methods
+
+from .favorites import add_favorite, remove_favorite, favoritable_game_ids, set_favorites
+from .models import Game, Character, Location, GameImage, Favorite
+
+API_PAGE_SIZE = 50
+
+# Fields loaded for game listings: the story texts are only needed in detail views
+GAME_LIST_FIELDS = ('id', 'title', 'creator__username', 'genre', 'ambiance', 'keywords', 'references',
+                    'is_public', 'created_at', 'updated_at', 'favorite_count')
+
+
+def serialize_character(character):
+    return {
+        'id': character.id,
+        'name': character.name,
+        'class': character.character_class,
+        'role': character.role,
+        'background': character.background,
+        'gameplay': character.gameplay,
+    }
+
+def serialize_location(location):
+    return {
+        'id': location.id,
+        'name': location.name,
+        'description': location.description,
+    }
+
+def serialize_image(image):
+    return {
+        'id': image.id,
+        'type': image.image_type,
+        'url': image.image.url,
+        'prompt': image.prompt,
+    }
+
+def serialize_game(game, detail=False):
+    """Compact JSON representation of a game; `detail` adds its content."""
+    data = {
+        'id': game.id,
+        'title': game.title,
+        'creator': game.creator.username,
+        'genre': game.genre,
+        'ambiance': game.ambiance,
+        'keywords': game.keywords,
+        'references': game.references,
+        'is_public': game.is_public,
+        'created_at': game.created_at.isoformat(),
+        'updated_at': game.updated_at.isoformat(),
+        'favorite_count': game.favorite_count,
+    }
+    if detail:
+        data.update({
+            'story': {
+                'premise': game.story_premise,
+                'act1': game.story_act1,
+                'act2': game.story_act2,
+                'act3': game.story_act3,
+                'twist': game.story_twist,
+            },
+            'characters': [serialize_character(c) for c in game.characters.all()],
+            'locations': [serialize_location(l) for l in game.locations.all()],
+            'images': [serialize_image(i) for i in game.images.all()],
+            'is_favorite': game.is_favorite,
+        })
+    return data
+
+def api_login_required(view):
+    """Like login_required, but answers 401 JSON instead of redirecting"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'status': 'error', 'message': 'Authentification requise.'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+def _not_found():
+    return JsonResponse({'status': 'error', 'message': 'Jeu introuvable.'}, status=404)
+
+def _select_fields(request, data):
+    """Keep only the fields listed in ?fields=a,b,c (all fields by default)"""
+    fields = request.GET.get('fields')
+    if not fields:
+        return data
+    wanted = {field.strip() for field in fields.split(',')}
+    return {key: value for key, value in data.items() if key in wanted}
+
+def _etag(request, *parts):
+    """Strong ETag built from the resource state and the query string"""
+    raw = ':'.join(str(part) for part in parts + (request.GET.urlencode(),))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def _visible_games(user):
+    if user.is_authenticated:
+        return Game.objects.filter(Q(is_public=True) | Q(creator=user))
+    return Game.objects.filter(is_public=True)
+
+def _game_state(request, game_id):
+    """
+    Cheap single-row lookup of what the conditional GET headers depend on,
+    memoized on the request so ETag and Last-Modified share one query.
+    """
+    memo = request.__dict__.setdefault('_api_game_state', {})
+    if game_id not in memo:
+        games = _visible_games(request.user).filter(id=game_id)
+        if request.user.is_authenticated:
+            games = games.annotate(is_favorite=Exists(
+                Favorite.objects.filter(user=request.user, game=OuterRef('pk'))
+            ))
+        else:
+            games = games.annotate(is_favorite=Value(False, output_field=BooleanField()))
+        memo[game_id] = games.values('updated_at', 'favorite_count', 'is_favorite').first()
+    return memo[game_id]
+
+def _game_etag(request, game_id, **kwargs):
+    state = _game_state(request, game_id)
+    if state is None:
+        return None
+    return _etag(request, request.path, state['updated_at'].timestamp(),
+                 state['favorite_count'], state['is_favorite'])
+
+def _game_last_modified(request, game_id, **kwargs):
+    state = _game_state(request, game_id)
+    return state['updated_at'] if state else None
+
+def _games_state(request):
+    memo = request.__dict__
+    if '_api_games_state' not in memo:
+        memo['_api_games_state'] = _visible_games(request.user).aggregate(
+            last=Max('updated_at'), count=Count('id'), favorites=Sum('favorite_count'),
+        )
+    return memo['_api_games_state']
+
+def _games_etag(request):
+    state = _games_state(request)
+    return _etag(request, request.user.id, state['last'], state['count'], state['favorites'])
+
+def _games_last_modified(request):
+    return _games_state(request)['last']
+
+def _favorites_state(request):
+    memo = request.__dict__
+    if '_api_favorites_state' not in memo:
+        memo['_api_favorites_state'] = Favorite.objects.filter(user=request.user).aggregate(
+            last=Max('game__updated_at'), added=Max('created_at'), count=Count('id'),
+        )
+    return memo['_api_favorites_state']
+
+def _favorites_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    state = _favorites_state(request)
+    return _etag(request, request.user.id, state['last'], state['added'], state['count'])
+
+def _favorites_last_modified(request):
+    if not request.user.is_authenticated:
+        return None
+    state = _favorites_state(request)
+    return max(filter(None, (state['last'], state['added'])), default=None)
+
+def _paginated(request, queryset):
+    page = Paginator(queryset, API_PAGE_SIZE).get_page(request.GET.get('page'))
+    return page, {
+        'count': page.paginator.count,
+        'page': page.number,
+        'num_pages': page.paginator.num_pages,
+    }
+
+@require_GET
+@condition(etag_func=_games_etag, last_modified_func=_games_last_modified)
+def game_list(request):
+    """JSON view listing the games visible to the user"""
+    games = (_visible_games(request.user).select_related('creator')
+             .only(*GAME_LIST_FIELDS).order_by('-created_at'))
+    page, meta = _paginated(request, games)
+    meta['results'] = [_select_fields(request, serialize_game(game)) for game in page]
+    return JsonResponse(meta)
+
+@require_GET
+@condition(etag_func=_game_etag, last_modified_func=_game_last_modified)
+def game_detail(request, game_id):
+    """JSON view returning a game with all its content"""
+    game = Game.objects.with_detail(request.user).filter(id=game_id).first()
+
+    # Private games are only visible to their creator
+    if game is None or (not game.is_public and request.user.id != game.creator_id):
+        return _not_found()
+
+    return JsonResponse(_select_fields(request, serialize_game(game, detail=True)))
+
+def _game_children_view(model, serializer):
+    @require_GET
+    @condition(etag_func=_game_etag, last_modified_func=_game_last_modified)
+    def view(request, game_id):
+        if _game_state(request, game_id) is None:
+            return _not_found()
+        items = model.objects.filter(game_id=game_id).order_by('id')
+        return JsonResponse({'results': [_select_fields(request, serializer(item)) for item in items]})
+    view.__doc__ = f"JSON view listing the {model._meta.verbose_name_plural} of a game"
+    return view
+
+game_characters = _game_children_view(Character, serialize_character)
+game_locations = _game_children_view(Location, serialize_location)
+game_images = _game_children_view(GameImage, serialize_image)
+
+@require_GET
+@api_login_required
+@condition(etag_func=_favorites_etag, last_modified_func=_favorites_last_modified)
+def favorite_list(request):
+    """JSON view listing the current user's favorite games"""
+    favorites = (Favorite.objects.filter(user=request.user)
+                 .select_related('game__creator')
+                 .only(*(f'game__{field}' for field in GAME_LIST_FIELDS), 'created_at')
+                 .order_by('-created_at'))
+    page, meta = _paginated(request, favorites)
+    meta['results'] = [
+        dict(_select_fields(request, serialize_game(favorite.game)), favorited_at=favorite.created_at.isoformat())
+        for favorite in page
+    ]
+    return JsonResponse(meta)
+
+@api_login_required
+@require_http_methods(["PUT", "DELETE"])
+def favorite(request, game_id):
+    """Idempotent favorite API: PUT adds the game, DELETE removes it"""
+    if request.method == 'PUT':
+        if not favoritable_game_ids(request.user, [game_id]):
+            return _not_found()
+        add_favorite(request.user, game_id)
+        return JsonResponse({'status': 'success', 'is_favorite': True})
+
+    remove_favorite(request.user, game_id)
+    return JsonResponse({'status': 'success', 'is_favorite': False})
+
+@api_login_required
+@require_POST
+def favorites_batch(request):
+    """Batch favorite API taking {"add": [ids], "remove": [ids]}"""
+    try:
+        payload = json.loads(request.body or b'{}')
+        add = [int(game_id) for game_id in payload.get('add', [])]
+        remove = [int(game_id) for game_id in payload.get('remove', [])]
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'status': 'error', 'message': 'Requête invalide.'}, status=400)
+
+    added = set_favorites(request.user, add=add, remove=remove)
+    return JsonResponse({'status': 'success', 'added': added, 'removed': sorted(set(remove) - set(added))})
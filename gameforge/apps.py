@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GameforgeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gameforge'
+
+    def ready(self):
+        # Connecte les signaux d'invalidation du cache
+        from . import signals  # noqa: F401
@@ -0,0 +1,65 @@
+import asyncio
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+from django.core.cache import cache
+
+
+class CacheLockTimeout(Exception):
+    """Le verrou n'a pas pu être obtenu dans le délai imparti."""
+
+
+def game_detail_cache_key(game_id, updated_at):
+    """
+    Clé de cache de la page publique d'un jeu. Elle contient la date de
+    dernière modification du jeu, mise à jour aussi quand son contenu change:
+    une page modifiée n'est jamais relue, sans dépendre d'une invalidation.
+    """
+    return f"gameforge:game_detail:{game_id}:{updated_at.timestamp()}"
+
+
+@contextmanager
+def cache_lock(name, timeout=10, wait=5):
+    """
+    Verrou partagé entre processus, posé avec `cache.add` (atomique sur
+    Redis et Memcached, par processus avec LocMem).
+
+    Args:
+        name (str): Nom du verrou
+        timeout (float, optional): Durée de vie du verrou, au cas où son détenteur disparaîtrait
+        wait (float, optional): Attente maximale pour l'obtenir
+
+    Raises:
+        CacheLockTimeout: Si le verrou est toujours pris après `wait` secondes
+    """
+    key = f"gameforge:lock:{name}"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    while not cache.add(key, token, timeout):
+        if time.monotonic() >= deadline:
+            raise CacheLockTimeout(name)
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        # Ne pas libérer un verrou expiré puis repris par un autre processus
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+@asynccontextmanager
+async def acache_lock(name, timeout=10, wait=5):
+    """Variante asynchrone de cache_lock: l'attente n'occupe aucun thread."""
+    key = f"gameforge:lock:{name}"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    while not await cache.aadd(key, token, timeout):
+        if time.monotonic() >= deadline:
+            raise CacheLockTimeout(name)
+        await asyncio.sleep(0.01)
+    try:
+        yield
+    finally:
+        if await cache.aget(key) == token:
+            await cache.adelete(key)
@@ -0,0 +1,94 @@
+import gzip
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.utils.dateparse import parse_datetime
+
+from .models import Game, Character, Location, GameImage
+from .storage import IMAGES_DIR, sharded_name
+
+GAME_FIELDS = ('title', 'genre', 'ambiance', 'keywords', 'references', 'story_premise', 'story_act1',
+               'story_act2', 'story_act3', 'story_twist', 'is_public')
+CHARACTER_FIELDS = ('name', 'character_class', 'role', 'background', 'gameplay')
+LOCATION_FIELDS = ('name', 'description')
+
+
+def open_text(path, mode):
+    """Ouvre un fichier NDJSON, compressé en gzip si son nom se termine par .gz."""
+    if path.endswith('.gz'):
+        return gzip.open(path, f"{mode}t", encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def file_sha256(name, chunk_size=64 * 1024):
+    """Hash SHA-256 d'un fichier du stockage, lu par blocs."""
+    digest = hashlib.sha256()
+    with default_storage.open(name, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _hashed_name(sha256, original_name):
+    return f"{sha256}{os.path.splitext(original_name)[1] or '.jpg'}"
+
+
+def image_archive_name(sha256, original_name):
+    """Nom d'une image dans l'archive tar: le hash de son contenu et son extension."""
+    return f"images/{_hashed_name(sha256, original_name)}"
+
+
+def imported_image_name(sha256, original_name):
+    """Chemin de stockage d'une image importée, dédupliquée par contenu (même répartition que storage.save_image)."""
+    return sharded_name(sha256, os.path.splitext(original_name)[1] or '.jpg', IMAGES_DIR)
+
+
+def game_to_record(game, image_hashes=None):
+    """
+    Convertit un jeu (avec ses relations préchargées) en enregistrement NDJSON.
+
+    Args:
+        game (Game): Le jeu à exporter
+        image_hashes (dict, optional): Hash du contenu de chaque image, par nom de fichier
+
+    Returns:
+        dict: L'enregistrement avec personnages, lieux et images imbriqués
+    """
+    record = {field: getattr(game, field) for field in GAME_FIELDS}
+    record['creator'] = game.creator.username
+    record['created_at'] = game.created_at.isoformat()
+    record['characters'] = [{field: getattr(c, field) for field in CHARACTER_FIELDS} for c in game.characters.all()]
+    record['locations'] = [{field: getattr(l, field) for field in LOCATION_FIELDS} for l in game.locations.all()]
+    record['images'] = [
+        {
+            'image_type': image.image_type,
+            'prompt': image.prompt,
+            'name': image.image.name,
+            'sha256': (image_hashes or {}).get(image.image.name),
+        }
+        for image in game.images.all()
+    ]
+    return record
+
+
+def record_to_rows(record, creator):
+    """
+    Construit les objets (non enregistrés) d'un jeu à partir d'un enregistrement.
+    La date de création de l'export est reprise dans `created_at`; bulk_create
+    la remplace (auto_now_add), l'import la rétablit ensuite (voir import_games).
+
+    Returns:
+        tuple: Le jeu, et ses personnages, lieux et images à créer après lui
+    """
+    game = Game(creator=creator, **{field: record[field] for field in GAME_FIELDS if field in record})
+    game.refresh_summary()
+    if record.get('created_at'):
+        game.created_at = parse_datetime(record['created_at'])
+    characters = [Character(game=game, **data) for data in record.get('characters', [])]
+    locations = [Location(game=game, **data) for data in record.get('locations', [])]
+    images = []
+    for data in record.get('images', []):
+        name = imported_image_name(data['sha256'], data['name']) if data.get('sha256') else data['name']
+        images.append(GameImage(game=game, image_type=data['image_type'], prompt=data['prompt'], image=name))
+    return game, characters, locations, images
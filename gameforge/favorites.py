@@ -0,0 +1,155 @@
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Game, Favorite
+
+
+def _actual_favorite_count():
+    counts = (Favorite.objects.filter(game=OuterRef('pk')).order_by()
+              .values('game').annotate(n=Count('pk')).values('n'))
+    return Coalesce(Subquery(counts), 0)
+
+
+def add_favorite(user, game_id):
+    """
+    Ajoute un jeu aux favoris d'un utilisateur (idempotent).
+
+    L'insertion se fait dans un savepoint: une insertion concurrente du même
+    couple (utilisateur, jeu) lève une IntegrityError qui est absorbée au lieu
+    de remonter jusqu'à la vue.
+
+    Returns:
+        bool: True si le favori a été créé par cet appel
+    """
+    try:
+        with transaction.atomic():
+            Favorite.objects.create(user=user, game_id=game_id)
+            Game.objects.filter(pk=game_id).update(favorite_count=F('favorite_count') + 1)
+    except IntegrityError:
+        return False
+    return True
+
+
+def remove_favorite(user, game_id):
+    """
+    Retire un jeu des favoris d'un utilisateur (idempotent) avec un seul DELETE.
+
+    Returns:
+        bool: True si le favori a été supprimé par cet appel
+    """
+    with transaction.atomic():
+        deleted, _ = Favorite.objects.filter(user=user, game_id=game_id).delete()
+        if deleted:
+            Game.objects.filter(pk=game_id).update(favorite_count=F('favorite_count') - deleted)
+    return bool(deleted)
+
+
+def toggle_favorite(user, game_id):
+    """
+    Ajoute ou retire un jeu des favoris d'un utilisateur.
+
+    Sous PostgreSQL, une seule requête supprime le favori s'il existe, sinon
+    l'insère (ON CONFLICT DO NOTHING), et ajuste `favorite_count` du même
+    nombre de lignes. Les autres bases le font dans une seule transaction.
+
+    Returns:
+        bool: True si le jeu est maintenant un favori
+    """
+    if connection.vendor == 'postgresql':
+        return _toggle_favorite_postgresql(user, game_id)
+    with transaction.atomic():
+        deleted, _ = Favorite.objects.filter(user=user, game_id=game_id).delete()
+        if deleted:
+            Game.objects.filter(pk=game_id).update(favorite_count=F('favorite_count') - deleted)
+            return False
+        add_favorite(user, game_id)
+    return True
+
+
+def _toggle_favorite_postgresql(user, game_id):
+    # Les sous-requêtes d'un WITH voient toutes le même instantané: l'insertion
+    # ne dépend que du résultat du DELETE, et une insertion concurrente du même
+    # couple est ignorée par ON CONFLICT au lieu de lever une IntegrityError.
+    favorite = Favorite._meta
+    game = Game._meta
+    user_column = favorite.get_field('user').column
+    game_column = favorite.get_field('game').column
+    created_column = favorite.get_field('created_at').column
+    count_column = game.get_field('favorite_count').column
+    sql = f"""
+        WITH deleted AS (
+            DELETE FROM {favorite.db_table} WHERE {user_column} = %s AND {game_column} = %s
+            RETURNING 1
+        ), inserted AS (
+            INSERT INTO {favorite.db_table} ({user_column}, {game_column}, {created_column})
+            SELECT %s, %s, %s WHERE NOT EXISTS (SELECT 1 FROM deleted)
+            ON CONFLICT ({user_column}, {game_column}) DO NOTHING
+            RETURNING 1
+        ), counted AS (
+            UPDATE {game.db_table}
+            SET {count_column} = {count_column} + (SELECT count(*) FROM inserted) - (SELECT count(*) FROM deleted)
+            WHERE {game.pk.column} = %s
+        )
+        SELECT NOT EXISTS (SELECT 1 FROM deleted)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user.pk, game_id, user.pk, game_id, timezone.now(), game_id])
+        return cursor.fetchone()[0]
+
+
+def favoritable_game_ids(user, game_ids):
+    """Filtre les jeux que l'utilisateur a le droit d'ajouter aux favoris."""
+    return list(
+        Game.objects.filter(pk__in=game_ids)
+        .filter(Q(is_public=True) | Q(creator=user))
+        .values_list('pk', flat=True)
+    )
+
+
+def set_favorites(user, add=(), remove=()):
+    """
+    Ajoute et retire des favoris par lots, pour les clients qui synchronisent
+    beaucoup de jeux à la fois.
+
+    Args:
+        user (User): L'utilisateur
+        add (iterable, optional): Identifiants des jeux à ajouter
+        remove (iterable, optional): Identifiants des jeux à retirer
+
+    Returns:
+        list: Identifiants des jeux favoris parmi ceux demandés
+    """
+    add = set(favoritable_game_ids(user, add)) if add else set()
+    remove = set(remove) - add
+
+    with transaction.atomic():
+        if add:
+            Favorite.objects.bulk_create(
+                [Favorite(user=user, game_id=game_id) for game_id in add],
+                ignore_conflicts=True,
+            )
+        if remove:
+            Favorite.objects.filter(user=user, game_id__in=remove).delete()
+
+        # bulk_create ne dit pas quelles lignes ont été insérées: on recompte
+        touched = add | remove
+        if touched:
+            Game.objects.filter(pk__in=touched).update(favorite_count=_actual_favorite_count())
+
+    return sorted(add)
+
+
+def reconcile_favorite_counts():
+    """
+    Recalcule `favorite_count` à partir de la table Favorite pour corriger
+    toute dérive du compteur.
+
+    Returns:
+        int: Nombre de jeux corrigés
+    """
+    actual = _actual_favorite_count()
+    return (Game.objects.annotate(actual_count=actual)
+            .exclude(favorite_count=F('actual_count'))
+            .update(favorite_count=actual))
@@ -0,0 +1,382 @@
+import asyncio
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from . import ai_async, metrics
+from .ai_utils import (
+    generate_story, generate_characters, generate_locations, generate_placeholder_image, ensure_image_written,
+    generate_character, generate_location, generate_text, story_prompts, ai_available, character_roles,
+    STORY_SECTION_PARAMS,
+)
+from .signals import touching_games
+from .models import Game, Character, Location, GameImage, GenerationRecord
+
+
+def build_game_content(game, random=False, seed=None, images=True):
+    """
+    Génère tout le contenu d'un jeu avec l'IA, sans rien écrire en base.
+
+    Le jeu peut ne pas encore être enregistré, ce qui permet de générer
+    plusieurs jeux en parallèle puis de les écrire par lots.
+
+    Args:
+        game (Game): Le jeu (genre, ambiance, mots-clés et créateur renseignés)
+        random (bool, optional): Générer du contenu complètement aléatoire
+        seed (int, optional): Graine de la génération, pour en rejouer une
+        images (bool, optional): Générer aussi les images
+
+    Returns:
+        dict: Histoire, personnages, lieux et images générés, les mesures
+        agrégées de la génération, sa graine et la provenance de chaque section
+    """
+    with metrics.generation_job(game.title, seed=seed, budget=settings.GENERATION_TOKEN_BUDGET) as job:
+        content = _build_game_content(game, random=random, images=images)
+    return _with_job(content, job)
+
+
+async def abuild_game_content(game, random=False, seed=None, images=True):
+    """
+    Variante asynchrone de build_game_content, pour les vues ASGI: l'histoire,
+    les personnages et les lieux sont générés en parallèle, sans occuper de
+    thread pendant les appels aux backends HTTP.
+    """
+    user = game.creator
+    with metrics.generation_job(game.title, seed=seed, budget=settings.GENERATION_TOKEN_BUDGET) as job:
+        # Comme generate_characters: personnages et lieux par IA même pour un jeu aléatoire
+        use_ai = await sync_to_async(ai_available)(user)
+        # Rangs des sections répétées fixés avant de lancer les générations: mêmes
+        # graines que build_game_content, quel que soit l'ordre d'arrivée. Le budget
+        # est réservé appel par appel (metrics.reserve_tokens).
+        roles = character_roles(2)
+        story, characters, locations = await asyncio.gather(
+            ai_async.agenerate_story(
+                title=game.title, genre=game.genre, ambiance=game.ambiance, keywords=game.keywords,
+                refs=game.references, random_mode=random, user=user,
+            ),
+            asyncio.gather(*(
+                _as_occurrence(roles[:i].count(role) + 1,
+                               ai_async.agenerate_character(game.genre, role, user=user, use_ai=use_ai))
+                for i, role in enumerate(roles)
+            )),
+            asyncio.gather(*(
+                _as_occurrence(i + 1, ai_async.agenerate_location(game.ambiance, user=user, use_ai=use_ai))
+                for i in range(2)
+            )),
+        )
+        game_images = await asyncio.gather(*(
+            sync_to_async(_generate_image, thread_sensitive=False)(game, *spec) for spec in _image_specs(game, images)
+        ))
+    content = {
+        "story": story,
+        "characters": list(characters),
+        "locations": list(locations),
+        "images": list(game_images),
+    }
+    return _with_job(content, job)
+
+
+async def _as_occurrence(occurrence, coroutine):
+    # Chaque coroutine de gather tourne dans sa propre tâche, donc son propre contexte
+    with metrics.section_occurrence(occurrence):
+        return await coroutine
+
+
+def _with_job(content, job):
+    content["metrics"] = job.as_dict()
+    content["seed"] = job.seed
+    content["provenance"] = job.records
+    return content
+
+
+def _build_game_content(game, random=False, images=True):
+    # Get the user from the game
+    user = game.creator
+
+    # Générer l'histoire avec l'IA
+    story = generate_story(
+        title=game.title,
+        genre=game.genre,
+        ambiance=game.ambiance,
+        keywords=game.keywords,
+        refs=game.references,
+        random_mode=random,
+        user=user
+    )
+
+    # Générer des personnages avec l'IA (2 par défaut: un protagoniste et un antagoniste)
+    characters = generate_characters(game_genre=game.genre, count=2, user=user)
+
+    # Générer des lieux avec l'IA
+    locations = generate_locations(game_ambiance=game.ambiance, count=2, user=user)
+
+    # Générer des images pour un personnage et un lieu
+    images = [_generate_image(game, *spec) for spec in _image_specs(game, images)]
+
+    return {
+        "story": story,
+        "characters": characters,
+        "locations": locations,
+        "images": images,
+    }
+
+
+def _image_specs(game, images=True):
+    if not images:
+        return ()
+    return (
+        ("CHARACTER", "character", f"Un héros de type {game.genre} dans un univers {game.ambiance}"),
+        ("LOCATION", "location", f"Un lieu d'ambiance {game.ambiance} pour une aventure de type {game.genre}"),
+    )
+
+
+def _generate_image(game, image_type, prefix, prompt):
+    filename = f"{prefix}_{game.id or 'new'}_{uuid.uuid4().hex}.jpg"
+    image_path = generate_placeholder_image(
+        prompt=prompt,
+        image_type=image_type,
+        filename=filename,
+        user=game.creator
+    )
+    return {"image_type": image_type, "prompt": prompt, "image": image_path}
+
+
+def _apply_story(game, story, random=False):
+    # Mettre à jour les champs du jeu avec l'histoire générée
+    game.title = story["title"] if random else game.title
+    game.story_premise = story["premise"]
+    game.story_act1 = story["act1"]
+    game.story_act2 = story["act2"]
+    game.story_act3 = story["act3"]
+    game.story_twist = story["twist"]
+    game.refresh_summary()
+
+
+def _content_rows(game, content):
+    characters = [Character(game=game, **char_data) for char_data in content["characters"]]
+    locations = [Location(game=game, **loc_data) for loc_data in content["locations"]]
+    images = [GameImage(game=game, **image_data) for image_data in content["images"]]
+    return characters, locations, images
+
+
+def _record_rows(game, records):
+    return [
+        GenerationRecord(game=game, **dict(record, backend=record["backend"] or "", model=record["model"] or ""))
+        for record in records
+    ]
+
+
+def save_games_content(items, random=False):
+    """
+    Enregistre par lots des jeux et le contenu généré pour eux.
+
+    Args:
+        items (list): Couples (jeu, contenu retourné par build_game_content)
+        random (bool, optional): Utiliser le titre généré
+
+    Returns:
+        list: Les jeux enregistrés
+    """
+    characters, locations, images, records = [], [], [], []
+
+    # Les images écrites en arrière-plan doivent exister avant les lignes qui les référencent
+    for _, content in items:
+        for image in content["images"]:
+            image["image"] = ensure_image_written(image["image"], image["prompt"], image["image_type"])
+
+    with transaction.atomic():
+        new_games, existing = [], []
+        for game, content in items:
+            _apply_story(game, content["story"], random=random)
+            game.generation_seed = content.get("seed")
+            if game.pk is None:
+                new_games.append(game)
+            else:
+                game.save()
+                existing.append(game.pk)
+        Game.objects.bulk_create(new_games)
+
+        # Un jeu régénéré remplace son contenu au lieu d'en ajouter un second exemplaire.
+        # Ces jeux viennent d'être enregistrés: leur updated_at n'est mis à jour qu'une fois.
+        if existing:
+            with touching_games():
+                Character.objects.filter(game_id__in=existing).delete()
+                Location.objects.filter(game_id__in=existing).delete()
+                GameImage.objects.filter(game_id__in=existing).delete()
+            GenerationRecord.objects.filter(game_id__in=existing).delete()
+
+        for game, content in items:
+            rows = _content_rows(game, content)
+            characters += rows[0]
+            locations += rows[1]
+            images += rows[2]
+            records += _record_rows(game, content.get("provenance", []))
+
+        Character.objects.bulk_create(characters)
+        Location.objects.bulk_create(locations)
+        GameImage.objects.bulk_create(images)
+        GenerationRecord.objects.bulk_create(records)
+
+    return [game for game, _ in items]
+
+
+def generate_game_content(game, random=False, seed=None):
+    """Helper function to generate game content using AI"""
+    save_games_content([(game, build_game_content(game, random=random, seed=seed))], random=random)
+
+
+# Sections de l'histoire régénérables une à une, et leur libellé dans le contexte
+STORY_SECTIONS = {
+    "premise": "Synopsis",
+    "act1": "Acte 1",
+    "act2": "Acte 2",
+    "act3": "Acte 3",
+    "twist": "Rebondissement",
+}
+
+
+class RegenerationUnavailable(Exception):
+    """Aucun service d'IA n'est disponible pour régénérer une section."""
+
+
+def game_context(game, exclude=None):
+    """
+    Contexte d'un jeu existant pour régénérer une de ses sections: les
+    caractéristiques du jeu suivies des autres sections de l'histoire.
+
+    Args:
+        game (Game): Le jeu
+        exclude (str, optional): Section régénérée, à ne pas reprendre
+
+    Returns:
+        tuple: Le contexte et les consignes de l'histoire par section
+    """
+    base_context, section_prompts = story_prompts(game.title, game.genre, game.ambiance, game.keywords,
+                                                  game.references)
+    story = "\n".join(
+        f"- {label}: {getattr(game, f'story_{section}')}"
+        for section, label in STORY_SECTIONS.items() if section != exclude
+    )
+    return f"{base_context}Histoire actuelle du jeu:\n{story}\n", section_prompts
+
+
+def _regeneration(game, name, available=None):
+    if not (ai_available(game.creator) if available is None else available):
+        raise RegenerationUnavailable(name)
+    return metrics.generation_job(f"{game.title}:{name}", budget=settings.GENERATION_TOKEN_BUDGET)
+
+
+def _apply_section(game, section, text):
+    """Remplace une section de l'histoire et retourne les champs à enregistrer."""
+    setattr(game, f"story_{section}", text)
+    update_fields = [f"story_{section}", "updated_at"]
+    if section == "premise":
+        game.refresh_summary()
+        update_fields.append("summary")
+    return update_fields
+
+
+def _save_regeneration(game, instance, records, update_fields=None):
+    with transaction.atomic():
+        instance.save(update_fields=update_fields)
+        GenerationRecord.objects.bulk_create(_record_rows(game, records))
+
+
+def regenerate_story_section(game, section):
+    """
+    Régénère une seule section de l'histoire (un appel au modèle).
+
+    Args:
+        game (Game): Le jeu
+        section (str): Une des clés de STORY_SECTIONS
+
+    Returns:
+        str: Le nouveau texte de la section
+    """
+    with _regeneration(game, section) as job:
+        context, section_prompts = game_context(game, exclude=section)
+        text = generate_text(section_prompts[section], user=game.creator, prefix=context, section=f"story:{section}",
+                             **STORY_SECTION_PARAMS[section])
+    _save_regeneration(game, game, job.records, update_fields=_apply_section(game, section, text))
+    return text
+
+
+async def aregenerate_story_section(game, section):
+    """Variante asynchrone de regenerate_story_section."""
+    available = await sync_to_async(ai_available)(game.creator)
+    with _regeneration(game, section, available) as job:
+        context, section_prompts = game_context(game, exclude=section)
+        text = await ai_async.agenerate_text(section_prompts[section], user=game.creator, prefix=context,
+                                             section=f"story:{section}", **STORY_SECTION_PARAMS[section])
+    await sync_to_async(_save_regeneration)(game, game, job.records,
+                                            update_fields=_apply_section(game, section, text))
+    return text
+
+
+def regenerate_character(character):
+    """Régénère un personnage en gardant son rôle."""
+    game = character.game
+    with _regeneration(game, f"character:{character.id}") as job:
+        context, _ = game_context(game)
+        data = generate_character(game.genre, character.role, user=game.creator, use_ai=True, prefix=context)
+    for field, value in data.items():
+        setattr(character, field, value)
+    _save_regeneration(game, character, job.records)
+    return character
+
+
+async def aregenerate_character(character):
+    """Variante asynchrone de regenerate_character."""
+    game = character.game
+    available = await sync_to_async(ai_available)(game.creator)
+    with _regeneration(game, f"character:{character.id}", available) as job:
+        context, _ = game_context(game)
+        data = await ai_async.agenerate_character(game.genre, character.role, user=game.creator, use_ai=True,
+                                                  prefix=context)
+    for field, value in data.items():
+        setattr(character, field, value)
+    await sync_to_async(_save_regeneration)(game, character, job.records)
+    return character
+
+
+def regenerate_location(location):
+    """Régénère un lieu."""
+    game = location.game
+    with _regeneration(game, f"location:{location.id}") as job:
+        context, _ = game_context(game)
+        data = generate_location(game.ambiance, user=game.creator, use_ai=True, prefix=context)
+    for field, value in data.items():
+        setattr(location, field, value)
+    _save_regeneration(game, location, job.records)
+    return location
+
+
+async def aregenerate_location(location):
+    """Variante asynchrone de regenerate_location."""
+    game = location.game
+    available = await sync_to_async(ai_available)(game.creator)
+    with _regeneration(game, f"location:{location.id}", available) as job:
+        context, _ = game_context(game)
+        data = await ai_async.agenerate_location(game.ambiance, user=game.creator, use_ai=True, prefix=context)
+    for field, value in data.items():
+        setattr(location, field, value)
+    await sync_to_async(_save_regeneration)(game, location, job.records)
+    return location
+
+
+def regenerate_image(image):
+    """Régénère une image à partir de son prompt (aucun appel au modèle de texte)."""
+    game = image.game
+    with metrics.generation_job(f"{game.title}:image:{image.id}"):
+        prefix = image.image_type.lower()
+        image_path = generate_placeholder_image(
+            prompt=image.prompt,
+            image_type=image.image_type,
+            filename=f"{prefix}_{game.id}_{uuid.uuid4().hex}.jpg",
+            user=game.creator,
+        )
+    image.image = ensure_image_written(image_path, image.prompt, image.image_type)
+    image.save(update_fields=["image"])
+    return image
@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from . import ai_stubs, ai_utils, llm_server
+
+logger = logging.getLogger(__name__)
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def _health_cache_key(backend):
+    return f"gameforge:health:{backend}"
+
+
+def _remote_llm_url():
+    """
+    URL du LLM distant de toute l'application (AISettings, sinon settings.py).
+    Les globales d'ai_utils suivent les paramètres du dernier utilisateur servi
+    et ne disent rien de la configuration globale.
+    """
+    ai_settings = None
+    if ai_utils.AISettings is not None:
+        try:
+            ai_settings = ai_utils.AISettings.get_settings()
+        except Exception as e:
+            logger.error(f"Impossible de lire AISettings: {e}")
+    return ai_utils.remote_llm_url(ai_settings)
+
+
+def configured_backends():
+    """Backends de génération de texte configurés pour toute l'application."""
+    if ai_stubs.is_enabled():
+        return ['STUB']
+    backends = []
+    if _remote_llm_url():
+        backends.append('REMOTE')
+    if settings.LOCAL_MODEL_SERVER_SOCKET:
+        backends.append('LOCAL_SERVER')
+    elif ai_utils.TRANSFORMERS_AVAILABLE:
+        backends.append('LOCAL')
+    return backends
+
+
+def probe_backend(backend):
+    """
+    Vérifie qu'un backend répond, sans lancer de génération.
+
+    Args:
+        backend (str): Nom du backend (voir ai_utils.resolve_backend)
+
+    Returns:
+        dict: Disponibilité, latence de la sonde et éventuelle erreur
+    """
+    started = time.perf_counter()
+    error = None
+    try:
+        if backend == 'REMOTE':
+            available = requests.get(f"{_remote_llm_url()}/health", timeout=5).status_code == 200
+        elif backend == 'LOCAL_SERVER':
+            status_code, _ = llm_server.unix_socket_request(settings.LOCAL_MODEL_SERVER_SOCKET, "GET", "/health", timeout=5)
+            available = status_code == 200
+        elif backend == 'LOCAL':
+            # Modèle chargé dans ce processus: rien à interroger
+            available = ai_utils.text_generator is not None
+        else:
+            available = True
+    except Exception as e:
+        available = False
+        error = str(e)
+
+    return {
+        'backend': backend,
+        'available': available,
+        'latency': time.perf_counter() - started,
+        'checked_at': time.time(),
+        'error': error,
+    }
+
+
+def probe_all():
+    """Sonde tous les backends configurés et met les résultats en cache."""
+    results = {}
+    for backend in configured_backends():
+        results[backend] = result = probe_backend(backend)
+        cache.set(_health_cache_key(backend), result, settings.HEALTH_PROBE_INTERVAL * 3)
+        if not result['available']:
+            logger.warning(f"Backend {backend} indisponible: {result['error'] or 'pas de réponse'}")
+    return results
+
+
+def _run_monitor():
+    while True:
+        # Un seul processus sonde les backends à chaque intervalle
+        if cache.add("gameforge:health:probing", True, settings.HEALTH_PROBE_INTERVAL):
+            try:
+                probe_all()
+            except Exception as e:
+                logger.error(f"Erreur lors de la vérification des backends: {e}")
+        time.sleep(settings.HEALTH_PROBE_INTERVAL)
+
+
+def start_monitor():
+    """Démarre la surveillance des backends dans ce processus, une seule fois."""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = threading.Thread(target=_run_monitor, name="gameforge-health-monitor", daemon=True)
+            _monitor.start()
+
+
+def backend_status():
+    """
+    Retourne le dernier état connu de chaque backend, depuis le cache.
+
+    Returns:
+        dict: Résultat de la dernière sonde par backend (None si pas encore sondé)
+    """
+    start_monitor()
+    backends = configured_backends()
+    cached = cache.get_many([_health_cache_key(backend) for backend in backends])
+    return {backend: cached.get(_health_cache_key(backend)) for backend in backends}
+
+
+def readiness():
+    """
+    État de préparation pour les répartiteurs de charge: la base de données
+    et le cache doivent répondre. Les backends indisponibles ne rendent pas
+    l'application indisponible (génération aléatoire de repli), sauf avec
+    HEALTH_REQUIRE_BACKEND.
+
+    Returns:
+        tuple: (prêt, détail des vérifications)
+    """
+    checks = {}
+    try:
+        connection.ensure_connection()
+        checks['database'] = True
+    except Exception as e:
+        logger.error(f"Base de données indisponible: {e}")
+        checks['database'] = False
+    try:
+        cache.set("gameforge:health:ready", True, 10)
+        checks['cache'] = cache.get("gameforge:health:ready") is True
+    except Exception as e:
+        logger.error(f"Cache indisponible: {e}")
+        checks['cache'] = False
+
+    backends = backend_status()
+    checks['backends'] = {backend: bool(status and status['available']) for backend, status in backends.items()}
+
+    ready = checks['database'] and checks['cache']
+    if settings.HEALTH_REQUIRE_BACKEND:
+        ready = ready and any(checks['backends'].values())
+    return ready, checks
@@ -0,0 +1,138 @@
+import http.client
+import json
+import logging
+import os
+import socket
+import socketserver
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionRequestHandler(BaseHTTPRequestHandler):
+    """
+    Gestionnaire HTTP minimal compatible avec l'API OpenAI utilisée par
+    LM Studio: `GET /health` et `POST /v1/completions`.
+
+    Le serveur doit exposer une méthode `complete(payload)` qui retourne le
+    texte généré, et un attribut `model_name`.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "model": self.server.model_name})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/v1/completions":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON payload"})
+            return
+
+        try:
+            text = self.server.complete(payload)
+        except Exception as e:
+            logger.error(f"Erreur lors de la complétion: {e}")
+            self._send_json(500, {"error": str(e)})
+            return
+
+        self._send_json(200, {
+            "id": f"cmpl-{uuid.uuid4().hex}",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": self.server.model_name,
+            "choices": [{"index": 0, "text": text, "finish_reason": "length"}],
+        })
+
+    def address_string(self):
+        # Les clients d'un socket Unix n'ont pas d'adresse
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class CompletionServer(ThreadingHTTPServer):
+    """Serveur HTTP multi-thread qui délègue les complétions à une fonction."""
+
+    daemon_threads = True
+
+    def __init__(self, address, complete, model_name):
+        super().__init__(address, CompletionRequestHandler)
+        self.complete = complete
+        self.model_name = model_name
+
+
+class UnixCompletionServer(socketserver.ThreadingUnixStreamServer):
+    """Même serveur de complétions, à l'écoute sur un socket Unix."""
+
+    daemon_threads = True
+
+    def __init__(self, path, complete, model_name):
+        # Un socket laissé par un arrêt brutal empêcherait le bind
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, CompletionRequestHandler)
+        self.complete = complete
+        self.model_name = model_name
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """Connexion HTTP passant par un socket Unix."""
+
+    def __init__(self, path, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def unix_socket_request(path, method, url, payload=None, timeout=30):
+    """
+    Envoie une requête JSON à un serveur de complétions sur un socket Unix.
+
+    Args:
+        path (str): Chemin du socket
+        method (str): Méthode HTTP
+        url (str): Chemin de la requête, par exemple "/v1/completions"
+        payload (dict, optional): Corps JSON de la requête
+        timeout (float, optional): Délai maximal en secondes
+
+    Returns:
+        tuple: Le code HTTP et la réponse JSON décodée
+    """
+    connection = UnixHTTPConnection(path, timeout=timeout)
+    try:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        connection.request(method, url, body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b"{}")
+    finally:
+        connection.close()
@@ -0,0 +1,88 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gameforge import ai_async, ai_utils
+
+
+class Command(BaseCommand):
+    help = ("Compare le débit de générations simultanées entre des workers WSGI (un thread par requête) "
+            "et une boucle ASGI (httpx asynchrone), contre le LLM HTTP configuré (par exemple run_stub_llm)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Nombre de générations simultanées")
+        parser.add_argument('--workers', type=int, default=8, help="Nombre de threads WSGI simulés")
+        parser.add_argument('--max-new-tokens', type=int, default=40, help="Tokens générés par appel")
+
+    def _prompts(self, mode, count):
+        # Un prompt distinct par appel: aucune réponse ne vient du cache
+        return [f"Benchmark {mode} {i}: décris une cité oubliée." for i in range(count)]
+
+    def _report(self, label, started, latencies, peak_threads):
+        wall = time.perf_counter() - started
+        latencies = sorted(latencies)
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+        self.stdout.write(
+            f"{label}: {wall:.2f}s au total, {len(latencies) / wall if wall else 0:.1f} générations/s, "
+            f"latence p50 {statistics.median(latencies) if latencies else 0:.2f}s / p95 {p95:.2f}s, "
+            f"{peak_threads} threads au plus"
+        )
+        return wall
+
+    def _run_wsgi(self, count, workers, max_new_tokens):
+        latencies, peak = [], [threading.active_count()]
+
+        def handle(prompt):
+            started = time.perf_counter()
+            ai_utils.generate_text(prompt, max_new_tokens=max_new_tokens, patience=1)
+            latencies.append(time.perf_counter() - started)
+            peak[0] = max(peak[0], threading.active_count())
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(handle, self._prompts("wsgi", count)))
+        return self._report(f"WSGI ({workers} threads)", started, latencies, peak[0])
+
+    def _run_asgi(self, count, max_new_tokens):
+        latencies, peak = [], [threading.active_count()]
+
+        async def handle(prompt):
+            started = time.perf_counter()
+            await ai_async.agenerate_text(prompt, max_new_tokens=max_new_tokens, patience=1)
+            latencies.append(time.perf_counter() - started)
+            peak[0] = max(peak[0], threading.active_count())
+
+        async def main():
+            try:
+                await asyncio.gather(*(handle(prompt) for prompt in self._prompts("asgi", count)))
+            finally:
+                await ai_async.aclose_clients()
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        return self._report("ASGI (1 boucle)", started, latencies, peak[0])
+
+    def handle(self, *args, **options):
+        if not ai_async.HTTPX_AVAILABLE:
+            raise CommandError("httpx n'est pas installé: le chemin asynchrone n'est pas disponible")
+
+        backend = ai_utils.resolve_backend(None, ai_utils.get_ai_settings(None))
+        if backend not in ai_async.ASYNC_BACKENDS:
+            raise CommandError(
+                f"Backend {backend} non servi en HTTP: activer USE_REMOTE_LLM avec REMOTE_LLM_URL "
+                f"vers run_stub_llm, ou LOCAL_MODEL_SERVER_SOCKET"
+            )
+
+        count, max_new_tokens = options['requests'], options['max_new_tokens']
+        self.stdout.write(f"Backend {backend}, créneaux: {settings.AI_BACKEND_CONCURRENCY.get(backend)}")
+        wsgi = self._run_wsgi(count, options['workers'], max_new_tokens)
+        asgi = self._run_asgi(count, max_new_tokens)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Gain ASGI: {wsgi / asgi if asgi else 0:.1f}x sur le temps total pour {count} générations"
+        ))
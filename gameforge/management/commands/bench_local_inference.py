@@ -0,0 +1,105 @@
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+MODES = ('FLOAT32', 'INT8', 'ONNX')
+BENCH_PROMPT = "Décris le premier acte d'un jeu de rôle dans un univers fantasy:"
+
+
+def _rss_mb():
+    with open('/proc/self/statm') as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+class Command(BaseCommand):
+    help = "Compare la latence, le débit et la mémoire du modèle local selon le mode d'inférence (FLOAT32, INT8, ONNX)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help="Modes à comparer")
+        parser.add_argument('--runs', type=int, default=5, help="Générations mesurées par mode")
+        parser.add_argument('--max-new-tokens', type=int, default=64, help="Tokens générés par génération")
+        parser.add_argument('--single', choices=MODES, help="Usage interne: mesurer un seul mode dans ce processus")
+
+    def handle(self, *args, **options):
+        if options['single']:
+            result = self._bench_mode(options['single'], options['runs'], options['max_new_tokens'])
+            self.stdout.write(json.dumps(result))
+            return
+
+        # Chaque mode est mesuré dans un processus neuf pour que la mémoire ne se cumule pas
+        results = []
+        for mode in options['modes']:
+            self.stdout.write(f"Mesure du mode {mode}...")
+            process = subprocess.run(
+                [sys.executable, sys.argv[0], 'bench_local_inference', '--single', mode,
+                 '--runs', str(options['runs']), '--max-new-tokens', str(options['max_new_tokens'])],
+                env=dict(os.environ, LOCAL_INFERENCE_MODE=mode, USE_REMOTE_LLM='False', AI_STUB_BACKEND='False'),
+                capture_output=True, text=True,
+            )
+            if process.returncode != 0:
+                self.stderr.write(f"Échec du mode {mode}: {process.stderr.strip().splitlines()[-1:]}")
+                continue
+            results.append(json.loads(process.stdout.strip().splitlines()[-1]))
+
+        if not results:
+            raise CommandError("Aucun mode n'a pu être mesuré")
+
+        baseline = next((r for r in results if r['mode'] == 'FLOAT32'), results[0])
+        self.stdout.write(f"{'Mode':<8} {'Chargement':>11} {'Latence':>9} {'Tokens/s':>9} {'RSS':>9} {'RSS max':>9}")
+        for r in results:
+            self.stdout.write(
+                f"{r['mode']:<8} {r['load_seconds']:>10.1f}s {r['latency_median']:>8.2f}s "
+                f"{r['tokens_per_second']:>9.1f} {r['rss_mb']:>7.0f}Mo {r['max_rss_mb']:>7.0f}Mo"
+            )
+        for r in results:
+            if r is not baseline:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{r['mode']}: latence x{r['latency_median'] / baseline['latency_median']:.2f}, "
+                    f"débit x{r['tokens_per_second'] / baseline['tokens_per_second']:.2f}, "
+                    f"RSS x{r['rss_mb'] / baseline['rss_mb']:.2f} par rapport à {baseline['mode']}"
+                ))
+
+    def _bench_mode(self, mode, runs, max_new_tokens):
+        started = time.perf_counter()
+        # Le modèle est chargé à l'import, dans le mode demandé par LOCAL_INFERENCE_MODE
+        from gameforge import ai_utils
+        load_seconds = time.perf_counter() - started
+
+        if ai_utils.text_generator is None or ai_utils.LOCAL_INFERENCE_MODE != mode:
+            raise CommandError(f"Le modèle local n'a pas pu être chargé en mode {mode}")
+
+        prompt_length = len(ai_utils.tokenizer(BENCH_PROMPT).input_ids)
+
+        def generate():
+            # Décodage glouton: même charge de travail pour tous les modes
+            return ai_utils.text_generator(
+                BENCH_PROMPT, max_new_tokens=max_new_tokens, do_sample=False,
+                pad_token_id=ai_utils.tokenizer.eos_token_id,
+            )[0]['generated_text']
+
+        generate()  # Échauffement
+
+        latencies, tokens = [], 0
+        for _ in range(runs):
+            started = time.perf_counter()
+            text = generate()
+            latencies.append(time.perf_counter() - started)
+            tokens += len(ai_utils.tokenizer(text).input_ids) - prompt_length
+
+        return {
+            'mode': mode,
+            'load_seconds': load_seconds,
+            'latency_median': statistics.median(latencies),
+            'latency_mean': statistics.mean(latencies),
+            'tokens_per_second': tokens / sum(latencies),
+            'rss_mb': _rss_mb(),
+            # ru_maxrss est exprimé en Ko sous Linux
+            'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
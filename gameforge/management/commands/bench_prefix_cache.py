@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gameforge import ai_utils
+
+
+class Command(BaseCommand):
+    help = "Mesure le temps CPU par jeu de l'histoire générée par le modèle local, avec et sans cache du contexte partagé"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=3, help="Nombre de jeux générés par mode")
+        parser.add_argument('--max-new-tokens', type=int, default=40, help="Tokens générés par section")
+
+    def _run(self, games, max_new_tokens, use_prefix_cache):
+        started = time.process_time()
+        for i in range(games):
+            # Un contexte différent par jeu: le cache ne sert qu'entre les sections d'un même jeu
+            base_context, prompts = ai_utils.story_prompts(
+                f"Benchmark {i}", "RPG", "Fantasy", keywords="dragons, magie", refs="Zelda",
+            )
+            for prompt in prompts.values():
+                ai_utils.generate_local_with_prefix(
+                    base_context, prompt, max_new_tokens=max_new_tokens, use_prefix_cache=use_prefix_cache,
+                )
+        return (time.process_time() - started) / games
+
+    def handle(self, *args, **options):
+        if not ai_utils.TRANSFORMERS_AVAILABLE or ai_utils.model is None:
+            raise CommandError("Le modèle local n'est pas chargé")
+
+        games, max_new_tokens = options['games'], options['max_new_tokens']
+        # Échauffement: premier passage hors mesure
+        self._run(1, max_new_tokens, use_prefix_cache=False)
+        without_cache = self._run(games, max_new_tokens, use_prefix_cache=False)
+        with_cache = self._run(games, max_new_tokens, use_prefix_cache=True)
+
+        self.stdout.write(f"Sans cache: {without_cache:.2f}s CPU par jeu")
+        self.stdout.write(f"Avec cache: {with_cache:.2f}s CPU par jeu")
+        self.stdout.write(self.style.SUCCESS(
+            f"Gain: {without_cache - with_cache:.2f}s CPU par jeu "
+            f"({(1 - with_cache / without_cache) * 100 if without_cache else 0:.0f}%)"
+        ))
@@ -0,0 +1,64 @@
+import json
+import sys
+import tarfile
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from gameforge.catalog import file_sha256, game_to_record, image_archive_name, open_text
+from gameforge.models import Game
+
+
+class Command(BaseCommand):
+    help = "Exporte les jeux en NDJSON (un jeu par ligne), en flux et à mémoire constante"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Fichier NDJSON de sortie (.gz pour compresser, - pour stdout)")
+        parser.add_argument('--images', help="Archive tar où copier les images, dédupliquées par hash")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Taille des lots lus en base")
+        parser.add_argument('--public-only', action='store_true', help="N'exporter que les jeux publics")
+
+    def handle(self, *args, **options):
+        games = Game.objects.select_related('creator').prefetch_related('characters', 'locations', 'images')
+        if options['public_only']:
+            games = games.filter(is_public=True)
+
+        output = sys.stdout if options['output'] == '-' else open_text(options['output'], 'w')
+        archive = tarfile.open(options['images'], 'w|') if options['images'] else None
+        archived = set()
+        exported = 0
+
+        try:
+            # iterator(chunk_size) lit la table par lots avec un curseur côté serveur
+            for game in games.order_by('pk').iterator(chunk_size=options['chunk_size']):
+                image_hashes = {}
+                if archive is not None:
+                    for image in game.images.all():
+                        image_hashes[image.image.name] = self._archive_image(archive, archived, image.image.name)
+
+                output.write(json.dumps(game_to_record(game, image_hashes), ensure_ascii=False))
+                output.write('\n')
+                exported += 1
+        finally:
+            if archive is not None:
+                archive.close()
+            if output is not sys.stdout:
+                output.close()
+
+        self.stderr.write(self.style.SUCCESS(
+            f"{exported} jeu(x) exportés, {len(archived)} image(s) archivées"
+        ))
+
+    def _archive_image(self, archive, archived, name):
+        if not default_storage.exists(name):
+            self.stderr.write(self.style.WARNING(f"Image manquante: {name}"))
+            return None
+
+        sha256 = file_sha256(name)
+        if sha256 not in archived:
+            info = tarfile.TarInfo(image_archive_name(sha256, name))
+            info.size = default_storage.size(name)
+            with default_storage.open(name, 'rb') as f:
+                archive.addfile(info, f)
+            archived.add(sha256)
+        return sha256
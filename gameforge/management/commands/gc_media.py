@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from gameforge import storage
+
+
+class Command(BaseCommand):
+    help = "Supprime du stockage les images qu'aucun jeu ne référence (jeux supprimés, écritures abandonnées)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Lister les images orphelines sans les supprimer")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Fichiers comparés à la base par requête")
+        parser.add_argument('--grace', type=int, default=3600,
+                            help="Âge minimum (secondes) d'une image avant suppression")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        orphans = freed = 0
+        for name in storage.orphaned_images(batch_size=options['batch_size'], grace=options['grace']):
+            if dry_run:
+                self.stdout.write(name)
+                orphans += 1
+                continue
+            size = storage.delete_orphan(name, grace=options['grace'])
+            if size:
+                orphans += 1
+                freed += size
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f"{orphans} image(s) orpheline(s) (aucune supprimée)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{orphans} image(s) orpheline(s) supprimée(s), {freed / 1024 / 1024:.1f} Mo libérés"
+            ))
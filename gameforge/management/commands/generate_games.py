@@ -0,0 +1,125 @@
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from gameforge import storage
+from gameforge.ai_utils import get_ai_settings, resolve_backend
+from gameforge.generation import build_game_content, save_games_content
+from gameforge.models import Game
+
+
+class Command(BaseCommand):
+    help = "Génère un catalogue de jeux aléatoires en parallèle, avec reprise sur point de contrôle"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, required=True, help="Nombre de jeux à générer")
+        parser.add_argument('--workers', type=int, default=4, help="Nombre de threads de génération")
+        parser.add_argument('--user', required=True, help="Nom de l'utilisateur créateur des jeux")
+        parser.add_argument('--batch-size', type=int, default=20, help="Nombre de jeux écrits par lot")
+        parser.add_argument('--checkpoint', default='generate_games.checkpoint.json',
+                            help="Fichier de point de contrôle")
+        parser.add_argument('--resume', action='store_true', help="Reprendre depuis le point de contrôle")
+
+    def _load_checkpoint(self, path, resume):
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        return {"completed": 0, "game_ids": []}
+
+    def _save_checkpoint(self, path, checkpoint):
+        # Écriture atomique pour ne jamais laisser un point de contrôle tronqué
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
+
+    def _new_game(self, user):
+        return Game(
+            title="Random Game",
+            creator=user,
+            genre=random.choice(Game.GENRE_CHOICES)[0],
+            ambiance=random.choice(Game.AMBIANCE_CHOICES)[0],
+            keywords="random, generated",
+        )
+
+    def _build(self, game):
+        try:
+            return build_game_content(game, random=True)
+        finally:
+            close_old_connections()
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Utilisateur introuvable: {options['user']}")
+
+        checkpoint_path = options['checkpoint']
+        checkpoint = self._load_checkpoint(checkpoint_path, options['resume'])
+        remaining = options['count'] - checkpoint["completed"]
+        if remaining <= 0:
+            self.stdout.write(self.style.SUCCESS("Rien à faire: tous les jeux ont déjà été générés"))
+            return
+
+        backend = resolve_backend(user, get_ai_settings(user))
+        limit = settings.AI_BACKEND_CONCURRENCY.get(backend)
+        if limit and options['workers'] > limit:
+            self.stdout.write(self.style.WARNING(
+                f"{options['workers']} workers mais le backend {backend} est limité à {limit} appels simultanés"
+            ))
+
+        self.stdout.write(f"Génération de {remaining} jeu(x) avec {options['workers']} worker(s) (backend: {backend})")
+
+        started = time.monotonic()
+        generated = 0
+        tokens = 0
+        batch = []
+
+        def flush():
+            nonlocal batch
+            if not batch:
+                return
+            games = save_games_content(batch, random=True)
+            # Les images du lot doivent être écrites avant le point de reprise
+            storage.flush_writes()
+            checkpoint["completed"] += len(games)
+            checkpoint["game_ids"] += [game.pk for game in games]
+            self._save_checkpoint(checkpoint_path, checkpoint)
+            batch = []
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {}
+            for _ in range(remaining):
+                game = self._new_game(user)
+                futures[executor.submit(self._build, game)] = game
+
+            for future in as_completed(futures):
+                try:
+                    content = future.result()
+                except Exception as e:
+                    self.stderr.write(f"Échec de la génération d'un jeu: {e}")
+                    continue
+
+                batch.append((futures[future], content))
+                generated += 1
+                tokens += content["metrics"]["completion_tokens"]
+
+                if len(batch) >= options['batch_size']:
+                    flush()
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(f"{checkpoint['completed']}/{options['count']} jeux "
+                                      f"({generated / elapsed * 60:.1f} jeux/min)")
+            flush()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{generated} jeu(x) générés en {elapsed:.1f}s: "
+            f"{generated / elapsed * 60:.1f} jeux/min, {tokens / elapsed:.1f} tokens/s"
+        ))
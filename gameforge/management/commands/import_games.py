@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import tarfile
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from gameforge.catalog import imported_image_name, open_text, record_to_rows
+from gameforge.models import Game, Character, Location, GameImage
+
+SHA256_NAME = re.compile(r'[0-9a-f]{64}')
+# Taille au-delà de laquelle une image en cours de vérification passe de la mémoire au disque
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = "Importe des jeux depuis un export NDJSON, par lots et à mémoire constante"
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="Fichier NDJSON à importer (.gz accepté, - pour stdin)")
+        parser.add_argument('--images', help="Archive tar d'images produite par export_games")
+        parser.add_argument('--user', help="Créateur à utiliser quand celui de l'export n'existe pas")
+        parser.add_argument('--batch-size', type=int, default=500, help="Nombre de jeux écrits par lot")
+        parser.add_argument('--allow-duplicates', action='store_true',
+                            help="Importer aussi les jeux déjà présents (même créateur, titre et date de création)")
+
+    def handle(self, *args, **options):
+        self.default_user = None
+        if options['user']:
+            try:
+                self.default_user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"Utilisateur introuvable: {options['user']}")
+        self.users = {}
+        self.allow_duplicates = options['allow_duplicates']
+        self.skipped = 0
+
+        if options['images']:
+            self._import_images(options['images'])
+
+        source = sys.stdin if options['input'] == '-' else open_text(options['input'], 'r')
+        imported = 0
+        batch = []
+        try:
+            for line in source:
+                if not line.strip():
+                    continue
+                batch.append(json.loads(line))
+                if len(batch) >= options['batch_size']:
+                    imported += self._import_batch(batch)
+                    batch = []
+            imported += self._import_batch(batch)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        if self.skipped:
+            self.stdout.write(f"{self.skipped} jeu(x) déjà présents ignorés (--allow-duplicates pour les importer)")
+        self.stdout.write(self.style.SUCCESS(f"{imported} jeu(x) importés"))
+
+    def _creator(self, username):
+        if username not in self.users:
+            user = User.objects.filter(username=username).first() or self.default_user
+            if user is None:
+                raise CommandError(f"Créateur introuvable: {username} (utilisez --user)")
+            self.users[username] = user
+        return self.users[username]
+
+    def _import_batch(self, records):
+        if not records:
+            return 0
+
+        games, characters, locations, images = [], [], [], []
+        for record in records:
+            game, game_characters, game_locations, game_images = record_to_rows(
+                record, self._creator(record['creator'])
+            )
+            games.append(game)
+            characters += game_characters
+            locations += game_locations
+            images += game_images
+
+        if not self.allow_duplicates:
+            games, characters, locations, images = self._without_existing(games, characters, locations, images)
+            if not games:
+                return 0
+
+        created_at = [game.created_at for game in games]
+        with transaction.atomic():
+            Game.objects.bulk_create(games)
+            # bulk_create applique auto_now_add: les dates de l'export sont rétablies ensuite
+            dated = []
+            for game, created in zip(games, created_at):
+                if created is not None:
+                    game.created_at = created
+                    dated.append(game)
+            Game.objects.bulk_update(dated, ['created_at'])
+            # Les objets enfants référencent les jeux, qui ont maintenant une clé primaire
+            for obj in characters + locations + images:
+                obj.game_id = obj.game.pk
+            Character.objects.bulk_create(characters)
+            Location.objects.bulk_create(locations)
+            GameImage.objects.bulk_create(images)
+        return len(games)
+
+    def _without_existing(self, games, characters, locations, images):
+        """
+        Écarte les jeux déjà importés: un jeu est reconnu à son créateur, son
+        titre et sa date de création, conservés d'un export à l'autre. Sans
+        date dans l'export, un jeu ne peut pas être reconnu et est importé.
+        """
+        dates = [game.created_at for game in games if game.created_at is not None]
+        existing = set(
+            Game.objects.filter(created_at__in=dates, creator__in={game.creator_id for game in games})
+            .values_list('creator_id', 'title', 'created_at')
+        )
+        kept = [game for game in games if (game.creator_id, game.title, game.created_at) not in existing]
+        self.skipped += len(games) - len(kept)
+        if len(kept) == len(games):
+            return games, characters, locations, images
+
+        kept_ids = {id(game) for game in kept}
+        return (kept, *([obj for obj in objects if id(obj.game) in kept_ids]
+                        for objects in (characters, locations, images)))
+
+    def _import_images(self, path):
+        """
+        Copie les images de l'archive dans le stockage, en flux, sans doublons.
+        Chaque image est hachée pendant sa lecture et n'est enregistrée que si
+        son contenu correspond au hash qui lui sert de nom.
+        """
+        copied = rejected = 0
+        with tarfile.open(path, 'r|') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                basename = os.path.basename(member.name)
+                sha256 = os.path.splitext(basename)[0]
+                if not SHA256_NAME.fullmatch(sha256):
+                    self.stderr.write(self.style.WARNING(f"Image ignorée, nom sans hash: {member.name}"))
+                    rejected += 1
+                    continue
+                # Les images sont nommées d'après leur hash: une image déjà présente est identique
+                name = imported_image_name(sha256, basename)
+                if default_storage.exists(name):
+                    continue
+                with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+                    if self._copy_hashed(archive.extractfile(member), spool) != sha256:
+                        self.stderr.write(self.style.WARNING(
+                            f"Image ignorée, contenu différent de son hash: {member.name}"))
+                        rejected += 1
+                        continue
+                    spool.seek(0)
+                    default_storage.save(name, File(spool))
+                copied += 1
+        self.stdout.write(f"{copied} image(s) copiées dans le stockage")
+        if rejected:
+            self.stderr.write(self.style.WARNING(f"{rejected} image(s) rejetées"))
+
+    @staticmethod
+    def _copy_hashed(source, target, chunk_size=64 * 1024):
+        """Copie un flux par blocs et retourne le hash SHA-256 de ce qui a été copié."""
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            digest.update(chunk)
+            target.write(chunk)
+        return digest.hexdigest()
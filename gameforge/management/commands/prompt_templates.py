@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from gameforge import ai_utils, prompts
+
+# Appels de generate_text par jeu et par prompt (voir generation.build_game_content)
+CALLS_PER_GAME = {
+    **{f"story.{section}": 1 for section in ai_utils.STORY_SECTION_PARAMS},
+    "story.context": len(ai_utils.STORY_SECTION_PARAMS),
+    "character.protagonist.background": 1,
+    "character.protagonist.gameplay": 1,
+    "character.antagonist.background": 1,
+    "character.antagonist.gameplay": 1,
+    "character.name": 2,
+    "character.class": 2,
+    "location.name": 2,
+    "location.description": 2,
+}
+
+
+class Command(BaseCommand):
+    help = "Liste les prompts enregistrés et leur coût en tokens (texte fixe) avec le tokenizer actif"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prompt-version', help="N'afficher qu'une version des prompts")
+
+    def handle(self, *args, **options):
+        all_versions = [options['prompt_version']] if options['prompt_version'] else prompts.versions()
+        self.stdout.write(f"Version active: {prompts.active_version()}")
+
+        for version in all_versions:
+            self.stdout.write(f"\nVersion {version}")
+            for template in prompts.templates():
+                if template.version != version:
+                    continue
+                tokens = template.token_count()
+                fields = ", ".join(sorted(template.fields)) or "-"
+                self.stdout.write(f"  {template.name:<36} {tokens:>5} tokens  champs: {fields}")
+
+            # Les prompts non redéfinis dans la version reprennent ceux de la précédente
+            per_game = sum(
+                prompts.get(name, version).token_count() * calls for name, calls in CALLS_PER_GAME.items()
+            )
+            self.stdout.write(self.style.SUCCESS(f"  Texte fixe des prompts par jeu: {per_game} tokens"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from gameforge.favorites import reconcile_favorite_counts
+from gameforge.trending import refresh_trending
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs de favoris et reconstruit le classement des tendances"
+
+    def handle(self, *args, **options):
+        fixed = reconcile_favorite_counts()
+        ranked = refresh_trending(full=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"{fixed} compteur(s) de favoris corrigé(s), {ranked} jeu(x) dans les tendances"
+        ))
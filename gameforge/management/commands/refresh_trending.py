@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from gameforge.trending import refresh_trending
+
+
+class Command(BaseCommand):
+    help = "Met à jour de façon incrémentale le classement des jeux tendance"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Reconstruire entièrement le classement")
+
+    def handle(self, *args, **options):
+        ranked = refresh_trending(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f"{ranked} jeu(x) dans les tendances"))
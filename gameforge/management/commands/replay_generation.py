@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gameforge.generation import build_game_content
+from gameforge.models import Game
+
+
+class Command(BaseCommand):
+    help = ("Rejoue la génération du texte d'un jeu avec sa graine enregistrée et compare chaque "
+            "section à sa provenance (rien n'est écrit en base)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('game_id', type=int, help="Identifiant du jeu")
+
+    def handle(self, *args, **options):
+        try:
+            game = Game.objects.select_related('creator').get(pk=options['game_id'])
+        except Game.DoesNotExist:
+            raise CommandError(f"Jeu {options['game_id']} introuvable")
+        if game.generation_seed is None:
+            raise CommandError(f"Le jeu {game.pk} n'a pas de graine de génération enregistrée")
+
+        stored = {record.section: record for record in game.generation_records.all()}
+        content = build_game_content(game, seed=game.generation_seed, images=False)
+
+        identical = 0
+        for record in content["provenance"]:
+            previous = stored.get(record["section"])
+            if previous is None:
+                status = "nouvelle section"
+            elif previous.prompt_hash != record["prompt_hash"]:
+                status = "prompt modifié"
+            elif previous.output_hash == record["output_hash"]:
+                identical += 1
+                status = "identique (cache)" if record["cache_hit"] else "identique"
+            else:
+                status = "texte différent"
+            self.stdout.write(f"{record['section']:<32} {record['backend'] or '-':<12} {status}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{identical}/{len(content['provenance'])} section(s) identique(s) avec la graine {game.generation_seed}"
+        ))
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gameforge import ai_utils
+from gameforge.llm_server import UnixCompletionServer
+from gameforge.model_server import BatchingGenerator
+
+
+class Command(BaseCommand):
+    help = ("Charge le modèle local une seule fois et le sert aux workers web sur un socket Unix "
+            "(/v1/completions compatible OpenAI, requêtes regroupées en lots)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=settings.LOCAL_MODEL_SERVER_SOCKET,
+                            help="Chemin du socket Unix (LOCAL_MODEL_SERVER_SOCKET par défaut)")
+        parser.add_argument('--max-batch-size', type=int, default=8, help="Taille maximale d'un lot")
+        parser.add_argument('--max-wait-ms', type=float, default=20,
+                            help="Attente maximale avant d'envoyer un lot incomplet")
+
+    def handle(self, *args, **options):
+        if not options['socket']:
+            raise CommandError("Indiquez --socket ou LOCAL_MODEL_SERVER_SOCKET")
+        if not ai_utils.TRANSFORMERS_AVAILABLE:
+            raise CommandError("transformers n'est pas installé")
+
+        model_name = ai_utils.BACKEND_MODELS['LOCAL']
+        text_generator, mode = ai_utils.text_generator, ai_utils.LOCAL_INFERENCE_MODE
+        if text_generator is None:
+            # Cas normal: avec LOCAL_MODEL_SERVER_SOCKET, ai_utils ne charge pas le modèle à l'import
+            mode = ai_utils.local_inference_mode()
+            tokenizer, model = ai_utils.load_local_model(model_name, mode)
+            pipeline_options = {} if mode == 'ONNX' else {'device': -1}
+            text_generator = ai_utils.pipeline("text-generation", model=model, tokenizer=tokenizer, **pipeline_options)
+
+        batcher = BatchingGenerator(text_generator, max_batch_size=options['max_batch_size'],
+                                    max_wait=options['max_wait_ms'] / 1000)
+        server = UnixCompletionServer(options['socket'], batcher.complete, model_name=model_name)
+        self.stdout.write(self.style.SUCCESS(
+            f"Modèle {model_name} ({mode}) servi sur unix:{options['socket']}"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from gameforge.ai_stubs import get_text_backend
+from gameforge.llm_server import CompletionServer
+
+
+class Command(BaseCommand):
+    help = "Lance un faux LLM compatible OpenAI (/v1/completions, /health) pour les tests de performance"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help="Adresse d'écoute")
+        parser.add_argument('--port', type=int, default=1234, help="Port d'écoute")
+
+    def handle(self, *args, **options):
+        backend = get_text_backend()
+
+        def complete(payload):
+            return backend.complete(payload.get("prompt", ""), max_tokens=payload.get("max_tokens"))
+
+        server = CompletionServer((options['host'], options['port']), complete, model_name="stub")
+        self.stdout.write(self.style.SUCCESS(
+            f"Faux LLM à l'écoute sur http://{options['host']}:{options['port']}"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
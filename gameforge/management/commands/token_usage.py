@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from django.utils import timezone
+
+from gameforge.models import GenerationRecord
+
+
+class Command(BaseCommand):
+    help = ("Résume les tokens consommés par section et par jeu (GenerationRecord), "
+            "pour ajuster les budgets de tokens")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help="Générations des N derniers jours")
+
+    def handle(self, *args, **options):
+        records = GenerationRecord.objects.filter(
+            created_at__gte=timezone.now() - timedelta(days=options['days']),
+            cache_hit=False,
+        )
+
+        sections = {}
+        rows = records.values_list('section', 'prompt_tokens', 'completion_tokens', 'latency', 'fallback', 'params')
+        for section, prompt_tokens, completion_tokens, latency, fallback, params in rows.iterator(chunk_size=2000):
+            # location:name#2 est comptée avec location:name
+            stats = sections.setdefault(section.split('#')[0], [0, 0, 0, 0.0, 0, 0])
+            stats[0] += 1
+            stats[1] += prompt_tokens
+            stats[2] += completion_tokens
+            stats[3] += latency
+            stats[4] += int(fallback)
+            # Génération coupée par son budget plutôt que par une séquence d'arrêt
+            stats[5] += int(bool(params.get('max_new_tokens')) and completion_tokens >= params['max_new_tokens'])
+
+        if not sections:
+            self.stdout.write("Aucune génération enregistrée sur la période")
+            return
+
+        self.stdout.write(f"{'Section':<32} {'Appels':>7} {'Prompt':>7} {'Généré':>7} {'Latence':>8} "
+                          f"{'Coupés':>7} {'Replis':>7}")
+        for section, (calls, prompt_tokens, completion_tokens, latency, fallbacks, capped) in sorted(sections.items()):
+            self.stdout.write(
+                f"{section:<32} {calls:>7} {prompt_tokens / calls:>7.0f} {completion_tokens / calls:>7.0f} "
+                f"{latency / calls:>7.2f}s {capped / calls:>6.0%} {fallbacks / calls:>6.0%}"
+            )
+
+        games = records.values('game').annotate(tokens=Sum('prompt_tokens') + Sum('completion_tokens'))
+        totals = [game['tokens'] for game in games]
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(totals)} jeu(x): {sum(totals) / len(totals):.0f} tokens en moyenne, {max(totals)} au plus "
+            f"(budget: {settings.GENERATION_TOKEN_BUDGET or 'illimité'})"
+        ))
@@ -0,0 +1,430 @@
+import contextvars
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Bornes des histogrammes de latence, en secondes
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+_current_call = contextvars.ContextVar('gameforge_current_call', default=None)
+_current_job = contextvars.ContextVar('gameforge_current_job', default=None)
+_section_occurrence = contextvars.ContextVar('gameforge_section_occurrence', default=None)
+_budget_lock = threading.Lock()
+
+COUNTER_HELP = {
+    'gameforge_generate_text_calls_total': "Appels à generate_text",
+    'gameforge_prompt_tokens_total': "Tokens de prompt envoyés aux backends",
+    'gameforge_completion_tokens_total': "Tokens générés par les backends",
+    'gameforge_generate_text_retries_total': "Nouvelles tentatives après une génération insuffisante",
+    'gameforge_generate_text_cache_hits_total': "Générations servies depuis le cache",
+    'gameforge_generate_text_fallbacks_total': "Générations remplacées par un texte de repli",
+    'gameforge_image_generations_total': "Générations d'images",
+}
+HISTOGRAM_HELP = {
+    'gameforge_generate_text_seconds': "Latence totale de generate_text",
+    'gameforge_generate_text_ttft_seconds': "Temps jusqu'au premier token de generate_text",
+    'gameforge_image_generation_seconds': "Latence de génération d'image",
+}
+
+
+class GenerationCall:
+    """Mesures d'un appel à generate_text, nouvelles tentatives comprises."""
+
+    def __init__(self, backend, model, prompt_tokens):
+        self.backend = backend or 'NONE'
+        self.model = model or 'none'
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = 0
+        self.reserved = 0
+        self.occurrence = None
+        self.ttft = None
+        self.latency = None
+        self.retries = 0
+        self.cache_hit = False
+        self.fallback = False
+        self.section = None
+        self.seed = None
+        self.template_version = None
+        self.params = None
+        self.prompt_hash = None
+        self.output = None
+        self.started = time.perf_counter()
+
+    def record(self, section, seed, template_version, params, prompt):
+        """Renseigne la provenance de la génération."""
+        self.section = section
+        self.seed = seed
+        self.template_version = template_version
+        self.params = params
+        self.prompt_hash = short_hash(prompt)
+        self.occurrence = _section_occurrence.get()
+
+    def first_token(self):
+        """Note l'arrivée du premier token (backends qui le signalent, voir metrics.first_token)."""
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+
+    def provenance(self):
+        """Provenance de la génération, telle qu'enregistrée dans GenerationRecord."""
+        return {
+            'section': self.section,
+            'backend': self.backend,
+            'model': self.model,
+            'template_version': self.template_version or '',
+            'seed': self.seed,
+            'params': self.params or {},
+            'prompt_hash': self.prompt_hash or '',
+            'output_hash': short_hash(self.output or ''),
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'latency': self.latency,
+            'cache_hit': self.cache_hit,
+            'fallback': self.fallback,
+        }
+
+    def as_dict(self):
+        return {
+            'backend': self.backend,
+            'model': self.model,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'ttft': self.ttft,
+            'latency': self.latency,
+            'retries': self.retries,
+            'cache_hit': self.cache_hit,
+            'fallback': self.fallback,
+        }
+
+
+def short_hash(text):
+    """Empreinte courte d'un texte, pour comparer prompts et sorties."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def _inc(name, labels, value=1):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def _observe(name, labels, value):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                histogram['buckets'][i] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+def _record(call):
+    labels = {'backend': call.backend, 'model': call.model}
+    _inc('gameforge_generate_text_calls_total', labels)
+    _inc('gameforge_prompt_tokens_total', labels, call.prompt_tokens)
+    _inc('gameforge_completion_tokens_total', labels, call.completion_tokens)
+    _inc('gameforge_generate_text_retries_total', labels, call.retries)
+    _inc('gameforge_generate_text_cache_hits_total', labels, int(call.cache_hit))
+    _inc('gameforge_generate_text_fallbacks_total', labels, int(call.fallback))
+    _observe('gameforge_generate_text_seconds', labels, call.latency)
+    if call.ttft is not None:
+        # Backends sans streaming: le premier token n'est pas mesurable, rien n'est observé
+        _observe('gameforge_generate_text_ttft_seconds', labels, call.ttft)
+
+    job = _current_job.get()
+    if job is not None:
+        job.add(call)
+
+    logger.debug("generate_text", extra={'generation': call.as_dict()})
+
+
+@contextmanager
+def track_call(backend, model, prompt_tokens):
+    """
+    Mesure un appel à generate_text.
+
+    Les appels imbriqués (nouvelles tentatives récursives) sont comptés comme
+    des tentatives de l'appel englobant au lieu d'appels séparés.
+
+    Yields:
+        GenerationCall: L'appel en cours, à compléter par l'appelant
+    """
+    parent = _current_call.get()
+    if parent is not None:
+        parent.retries += 1
+        yield parent
+        return
+
+    call = GenerationCall(backend, model, prompt_tokens)
+    token = _current_call.set(call)
+    try:
+        yield call
+    finally:
+        _current_call.reset(token)
+        call.latency = time.perf_counter() - call.started
+        _record(call)
+
+
+def current_call():
+    """Retourne l'appel à generate_text en cours dans ce contexte, s'il y en a un."""
+    return _current_call.get()
+
+
+def current_job():
+    """Retourne la génération de jeu en cours dans ce contexte, s'il y en a une."""
+    return _current_job.get()
+
+
+def first_token():
+    """Signale l'arrivée du premier token de l'appel en cours (sans effet hors appel)."""
+    call = _current_call.get()
+    if call is not None:
+        call.first_token()
+
+
+def mark_fallback():
+    """Signale que l'appel en cours retourne un texte de repli."""
+    call = _current_call.get()
+    if call is not None:
+        call.fallback = True
+
+
+def record_image(backend, latency, fallback=False):
+    """Enregistre une génération d'image."""
+    labels = {'backend': backend}
+    _inc('gameforge_image_generations_total', dict(labels, fallback=str(fallback).lower()))
+    _observe('gameforge_image_generation_seconds', labels, latency)
+
+    job = _current_job.get()
+    if job is not None:
+        job.add_image(latency)
+
+
+class GenerationJob:
+    """Agrégat des mesures d'une génération de jeu complète."""
+
+    def __init__(self, name, parent=None, seed=None, budget=None):
+        self.name = name
+        self.parent = parent
+        self.seed = seed if seed is not None else random.getrandbits(31)
+        self.budget = budget
+        self.spent = 0
+        self.reserved = 0
+        self.records = []
+        self.recorded = {}
+        self.occurrences = {}
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.fallbacks = 0
+        self.text_seconds = 0.0
+        self.images = 0
+        self.image_seconds = 0.0
+        self.started = time.perf_counter()
+        self.duration = None
+
+    def add(self, call):
+        self.calls += 1
+        self.prompt_tokens += call.prompt_tokens
+        self.completion_tokens += call.completion_tokens
+        self.retries += call.retries
+        self.cache_hits += int(call.cache_hit)
+        self.fallbacks += int(call.fallback)
+        self.text_seconds += call.latency
+        with _budget_lock:
+            # La réservation de l'appel est remplacée par ce qu'il a réellement coûté
+            self.reserved -= call.reserved
+            if not call.cache_hit:
+                # Tokens réellement facturés par les backends
+                self.spent += call.prompt_tokens + call.completion_tokens
+        if call.section is not None:
+            # Les sections générées plusieurs fois sont numérotées: location:name, location:name#2...
+            count = self.recorded[call.section] = self.recorded.get(call.section, 0) + 1
+            if call.occurrence is not None:
+                count = call.occurrence
+            section = call.section if count == 1 else f"{call.section}#{count}"
+            self.records.append(dict(call.provenance(), section=section))
+        if self.parent is not None:
+            self.parent.add(call)
+
+    def next_seed(self, section):
+        """
+        Graine de la prochaine génération d'une section: dérivée de la graine
+        du job, du nom de la section et de son rang, pour qu'un job rejoué
+        avec la même graine retrouve les mêmes graines.
+        """
+        occurrence = _section_occurrence.get()
+        if occurrence is None:
+            occurrence = self.occurrences[section] = self.occurrences.get(section, 0) + 1
+        digest = hashlib.sha256(f"{self.seed}:{section}:{occurrence}".encode('utf-8')).hexdigest()
+        return int(digest[:8], 16) & 0x7fffffff
+
+    def remaining_tokens(self):
+        """
+        Tokens restants avant d'atteindre le budget le plus serré de ce job et
+        des englobants (None sans budget), réservations des appels en cours déduites.
+        """
+        remaining, job = None, self
+        while job is not None:
+            if job.budget:
+                left = job.budget - job.spent - job.reserved
+                remaining = left if remaining is None else min(remaining, left)
+            job = job.parent
+        return remaining
+
+    def add_image(self, latency):
+        self.images += 1
+        self.image_seconds += latency
+        if self.parent is not None:
+            self.parent.add_image(latency)
+
+    def as_dict(self):
+        return {key: value for key, value in vars(self).items()
+                if key not in ('started', 'parent', 'records', 'recorded', 'occurrences')}
+
+
+def remaining_tokens():
+    """Tokens restants dans le budget de la génération en cours (None sans budget)."""
+    job = _current_job.get()
+    return job.remaining_tokens() if job is not None else None
+
+
+def reserve_tokens(call, max_new_tokens):
+    """
+    Plafonne la génération d'un appel au budget restant de la génération en
+    cours et lui réserve ses tokens (prompt compris) jusqu'à sa fin: des
+    appels lancés en parallèle ne peuvent pas dépenser ensemble plus que le
+    budget.
+
+    Returns:
+        int: Le nombre maximum de tokens à générer (0 ou moins: budget épuisé)
+    """
+    job = _current_job.get()
+    if job is None:
+        return max_new_tokens
+    with _budget_lock:
+        remaining = job.remaining_tokens()
+        if remaining is None:
+            return max_new_tokens
+        max_new_tokens = min(max_new_tokens, remaining - call.prompt_tokens)
+        if max_new_tokens > 0:
+            call.reserved = call.prompt_tokens + max_new_tokens
+            parent = job
+            while parent is not None:
+                parent.reserved += call.reserved
+                parent = parent.parent
+    return max_new_tokens
+
+
+@contextmanager
+def section_occurrence(occurrence):
+    """
+    Fixe le rang des sections générées dans le bloc (location:name#2...),
+    pour que leurs graines ne dépendent pas de l'ordre dans lequel des
+    générations parallèles se terminent.
+
+    Args:
+        occurrence (int): Rang des sections, à partir de 1
+    """
+    token = _section_occurrence.set(occurrence)
+    try:
+        yield
+    finally:
+        _section_occurrence.reset(token)
+
+
+def next_seed(section):
+    """Graine de la prochaine génération d'une section dans le job en cours (aléatoire hors job)."""
+    job = _current_job.get()
+    if job is None:
+        return random.getrandbits(31)
+    return job.next_seed(section)
+
+
+@contextmanager
+def generation_job(name, log=True, seed=None, budget=None):
+    """
+    Agrège les mesures de tous les appels de génération faits dans le bloc.
+    Les blocs peuvent s'imbriquer: chaque appel compte aussi pour les agrégats
+    englobants.
+
+    Args:
+        name (str): Nom de la génération, pour les logs
+        log (bool, optional): Journaliser le résumé à la sortie du bloc
+        seed (int, optional): Graine du job, pour rejouer une génération
+        budget (int, optional): Tokens (prompt et génération) au plus pour le job
+
+    Yields:
+        GenerationJob: L'agrégat, complété à la sortie du bloc
+    """
+    job = GenerationJob(name, parent=_current_job.get(), seed=seed, budget=budget)
+    token = _current_job.set(job)
+    try:
+        yield job
+    finally:
+        _current_job.reset(token)
+        job.duration = time.perf_counter() - job.started
+        if log:
+            logger.info(
+                f"Génération {name}: {job.calls} appels, {job.prompt_tokens} tokens de prompt, "
+                f"{job.completion_tokens} tokens générés, {job.retries} nouvelles tentatives, "
+                f"{job.fallbacks} replis, {job.images} images en {job.duration:.1f}s",
+                extra={'generation_job': job.as_dict()},
+            )
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def render_prometheus():
+    """
+    Rend toutes les mesures de ce processus au format texte de Prometheus.
+
+    Returns:
+        str: Les mesures au format d'exposition Prometheus
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: dict(value, buckets=list(value['buckets'])) for key, value in _histograms.items()}
+
+    lines = []
+    for name, help_text in COUNTER_HELP.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for name, help_text in HISTOGRAM_HELP.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, count in zip(LATENCY_BUCKETS, histogram['buckets']):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,208 @@
+import contextvars
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+
+from . import metrics
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+
+    PYINSTRUMENT_AVAILABLE = True
+except ImportError:
+    PYINSTRUMENT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_current_profile = contextvars.ContextVar('gameforge_request_profile', default=None)
+_original_template_render = None
+_instrument_lock = threading.Lock()
+
+
+class RequestProfile:
+    """Mesures d'une requête profilée."""
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+
+def _instrument_templates():
+    """
+    Mesure le temps de rendu des templates. Installé à la première requête
+    profilée seulement (une fois par processus): sans profilage, le rendu
+    des templates n'est pas modifié.
+    """
+    global _original_template_render
+    if _original_template_render is not None:
+        return
+    with _instrument_lock:
+        if _original_template_render is not None:
+            return
+        _original_template_render = original = Template.render
+
+        def render(self, context):
+            profile = _current_profile.get()
+            # Les templates inclus ou étendus sont comptés dans le template de premier niveau
+            if profile is None or profile.template_depth:
+                return original(self, context)
+            profile.template_depth += 1
+            started = time.perf_counter()
+            try:
+                return original(self, context)
+            finally:
+                profile.template_seconds += time.perf_counter() - started
+                profile.template_depth -= 1
+
+        Template.render = render
+
+
+class ProfilingMiddleware:
+    """
+    Profilage optionnel des requêtes: temps total, requêtes SQL, rendu des
+    templates et temps passé dans les appels d'ai_utils.
+
+    Une requête est profilée si elle est tirée au sort (`PROFILING_SAMPLE_RATE`)
+    ou si elle porte l'en-tête `X-Profile` et vient d'un membre du staff,
+    y compris avec DEBUG. Les mesures sont renvoyées dans l'en-tête
+    `Server-Timing`, et un profil cProfile (ou pyinstrument) est écrit dans
+    `PROFILING_DUMP_DIR` si ce dossier est configuré.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        self.dump_dir = getattr(settings, 'PROFILING_DUMP_DIR', None)
+        self.use_pyinstrument = getattr(settings, 'PROFILING_USE_PYINSTRUMENT', False) and PYINSTRUMENT_AVAILABLE
+
+    def _sampled(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _should_profile(self, request):
+        if 'HTTP_X_PROFILE' in request.META:
+            user = getattr(request, 'user', None)
+            return user is not None and user.is_staff
+        return self._sampled()
+
+    async def _ashould_profile(self, request):
+        # request.user ferait une requête SQL synchrone depuis la boucle
+        if 'HTTP_X_PROFILE' in request.META:
+            if not hasattr(request, 'auser'):
+                return False
+            user = await request.auser()
+            return user.is_staff
+        return self._sampled()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._should_profile(request):
+            return self.get_response(request)
+        with self._profiling(request) as profiled:
+            profiled['response'] = self.get_response(request)
+        return profiled['response']
+
+    async def __acall__(self, request):
+        if not await self._ashould_profile(request):
+            return await self.get_response(request)
+        with self._profiling(request) as profiled:
+            profiled['response'] = await self.get_response(request)
+        return profiled['response']
+
+    @contextmanager
+    def _profiling(self, request):
+        """
+        Mesure la réponse placée dans le dictionnaire produit, commune aux
+        chemins synchrone et asynchrone. Les contextvars sont recopiées par
+        sync_to_async, donc les requêtes SQL et les rendus exécutés dans un
+        thread sont bien comptés pour une vue asynchrone.
+        """
+        _instrument_templates()
+        profile = RequestProfile()
+        profiler = None
+        if self.dump_dir:
+            profiler = PyinstrumentProfiler() if self.use_pyinstrument else cProfile.Profile()
+
+        profiled = {}
+        token = _current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.db_wrapper))
+                job = stack.enter_context(metrics.generation_job(request.path, log=False))
+                if profiler is not None:
+                    stack.enter_context(self._running(profiler))
+                yield profiled
+        finally:
+            _current_profile.reset(token)
+        total = time.perf_counter() - started
+        ai_seconds = job.text_seconds + job.image_seconds
+
+        profiled['response']['Server-Timing'] = ', '.join([
+            f'total;dur={total * 1000:.1f}',
+            f'db;dur={profile.db_seconds * 1000:.1f};desc="{profile.db_queries} queries"',
+            f'tpl;dur={profile.template_seconds * 1000:.1f}',
+            f'ai;dur={ai_seconds * 1000:.1f};desc="{job.calls} calls"',
+        ])
+        logger.info(
+            f"{request.method} {request.path}: {total * 1000:.1f}ms, {profile.db_queries} requêtes SQL "
+            f"({profile.db_seconds * 1000:.1f}ms), templates {profile.template_seconds * 1000:.1f}ms, "
+            f"IA {ai_seconds * 1000:.1f}ms"
+        )
+
+        if profiler is not None:
+            self._dump(request, profiler)
+
+    @contextmanager
+    def _running(self, profiler):
+        if self.use_pyinstrument:
+            profiler.start()
+        else:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if self.use_pyinstrument:
+                profiler.stop()
+            else:
+                profiler.disable()
+
+    def _dump(self, request, profiler):
+        os.makedirs(self.dump_dir, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'root'
+        base = os.path.join(self.dump_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{request.method}_{slug}")
+        try:
+            if self.use_pyinstrument:
+                with open(f"{base}.html", 'w') as f:
+                    f.write(profiler.output_html())
+            else:
+                profiler.dump_stats(f"{base}.prof")
+        except OSError as e:
+            logger.error(f"Impossible d'écrire le profil de {request.path}: {e}")
@@ -0,0 +1,40 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_favorites(apps, schema_editor):
+    Game = apps.get_model('gameforge', 'Game')
+    Favorite = apps.get_model('gameforge', 'Favorite')
+    counts = (Favorite.objects.filter(game=OuterRef('pk')).order_by()
+              .values('game').annotate(n=Count('pk')).values('n'))
+    Game.objects.update(favorite_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gameforge', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='favorite_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Nombre de favoris'),
+        ),
+        migrations.RunPython(count_favorites, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='GameTrend',
+            fields=[
+                ('game', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='gameforge.game', verbose_name='Jeu')),
+                ('score', models.FloatField(db_index=True, default=0, verbose_name='Score')),
+                ('refreshed_at', models.DateTimeField(verbose_name='Rafraîchi le')),
+            ],
+            options={
+                'verbose_name': 'Tendance',
+                'verbose_name_plural': 'Tendances',
+            },
+        ),
+    ]
@@ -0,0 +1,231 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_aisettings_table(apps, schema_editor):
+    model = apps.get_model('gameforge', 'AISettings')
+    if model._meta.db_table not in schema_editor.connection.introspection.table_names():
+        schema_editor.create_model(model)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gameforge', '0002_game_favorite_count_gametrend'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Les bases existantes ont déjà la table gameforge_aisettings, sans
+        # migration qui la décrive: le modèle n'est créé que dans l'état, et la
+        # table seulement si elle manque (nouvelle base)
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='AISettings',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('use_remote_llm', models.BooleanField(default=False, help_text='Utiliser un LLM distant au lieu du modèle local', verbose_name='Utiliser LLM distant')),
+                        ('remote_llm_url', models.CharField(default='http://127.0.0.1:1234', help_text="URL de l'API LLM distante", max_length=255, verbose_name='URL du LLM distant')),
+                        ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Créé le')),
+                        ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Mis à jour le')),
+                    ],
+                    options={
+                        'verbose_name': "Paramètres d'IA",
+                        'verbose_name_plural': "Paramètres d'IA",
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_aisettings_table, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='aisettings',
+            name='local_inference_mode',
+            field=models.CharField(choices=[('FLOAT32', 'Float32 (référence)'), ('INT8', 'Int8 quantifié dynamiquement'), ('ONNX', 'ONNX Runtime')], default='FLOAT32', help_text='Format du modèle local sur CPU (pris en compte au redémarrage)', max_length=10, verbose_name="Mode d'inférence locale"),
+        ),
+        migrations.CreateModel(
+            name='UserAISettings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ai_service', models.CharField(choices=[('LOCAL', 'IA Locale'), ('HUGGINGFACE', 'Hugging Face'), ('LMSTUDIO', 'LM Studio'), ('CHATGPT', 'ChatGPT')], default='LOCAL', help_text="Choisissez le service d'IA à utiliser pour la génération", max_length=20, verbose_name="Service d'IA")),
+                ('huggingface_token', models.CharField(blank=True, help_text="Token d'API pour Hugging Face", max_length=255, null=True, verbose_name='Token Hugging Face')),
+                ('chatgpt_token', models.CharField(blank=True, help_text="Token d'API pour ChatGPT", max_length=255, null=True, verbose_name='Token ChatGPT')),
+                ('lmstudio_url', models.CharField(blank=True, default='http://127.0.0.1:1234', help_text="URL de l'API LM Studio locale", max_length=255, null=True, verbose_name='URL LM Studio')),
+                ('generate_images', models.BooleanField(default=True, help_text="Activer la génération d'images", verbose_name='Générer des images')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Créé le')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Mis à jour le')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ai_settings', to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur')),
+            ],
+            options={
+                'verbose_name': "Paramètres d'IA utilisateur",
+                'verbose_name_plural': "Paramètres d'IA utilisateurs",
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='character',
+            options={'verbose_name': 'Personnage', 'verbose_name_plural': 'Personnages'},
+        ),
+        migrations.AlterModelOptions(
+            name='favorite',
+            options={'verbose_name': 'Favori', 'verbose_name_plural': 'Favoris'},
+        ),
+        migrations.AlterModelOptions(
+            name='gameimage',
+            options={'verbose_name': 'Image de jeu', 'verbose_name_plural': 'Images de jeu'},
+        ),
+        migrations.AlterModelOptions(
+            name='location',
+            options={'verbose_name': 'Lieu', 'verbose_name_plural': 'Lieux'},
+        ),
+        migrations.AlterField(
+            model_name='character',
+            name='background',
+            field=models.TextField(verbose_name='Histoire'),
+        ),
+        migrations.AlterField(
+            model_name='character',
+            name='character_class',
+            field=models.CharField(max_length=100, verbose_name='Classe'),
+        ),
+        migrations.AlterField(
+            model_name='character',
+            name='game',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='characters', to='gameforge.game', verbose_name='Jeu'),
+        ),
+        migrations.AlterField(
+            model_name='character',
+            name='gameplay',
+            field=models.TextField(verbose_name='Gameplay'),
+        ),
+        migrations.AlterField(
+            model_name='character',
+            name='name',
+            field=models.CharField(max_length=100, verbose_name='Nom'),
+        ),
+        migrations.AlterField(
+            model_name='character',
+            name='role',
+            field=models.CharField(max_length=100, verbose_name='Rôle'),
+        ),
+        migrations.AlterField(
+            model_name='favorite',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Créé le'),
+        ),
+        migrations.AlterField(
+            model_name='favorite',
+            name='game',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorited_by', to='gameforge.game', verbose_name='Jeu'),
+        ),
+        migrations.AlterField(
+            model_name='favorite',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='ambiance',
+            field=models.CharField(choices=[('POST_APOCALYPTIC', 'Post-Apocalyptique'), ('FANTASY', 'Fantaisie'), ('SCI_FI', 'Science-Fiction'), ('CYBERPUNK', 'Cyberpunk'), ('HORROR', 'Horreur'), ('MYSTERY', 'Mystère'), ('HISTORICAL', 'Historique'), ('STEAMPUNK', 'Steampunk'), ('DREAMLIKE', 'Onirique'), ('DARK_FANTASY', 'Fantasy Sombre'), ('MEDIEVAL', 'Médiéval'), ('WESTERN', 'Western'), ('NOIR', 'Film Noir'), ('SUPERHERO', 'Super-héros'), ('COMEDY', 'Comédie'), ('DYSTOPIAN', 'Dystopique'), ('UTOPIAN', 'Utopique'), ('MYTHOLOGICAL', 'Mythologique'), ('LOVECRAFTIAN', 'Lovecraftien'), ('SPACE_OPERA', 'Space Opera'), ('MILITARY', 'Militaire'), ('UNDERWATER', 'Sous-marin'), ('TROPICAL', 'Tropical'), ('ARCTIC', 'Arctique'), ('DESERT', 'Désertique'), ('URBAN', 'Urbain'), ('RURAL', 'Rural'), ('OTHER', 'Autre')], max_length=20, verbose_name='Ambiance'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Créé le'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='creator',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='games', to=settings.AUTH_USER_MODEL, verbose_name='Créateur'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='genre',
+            field=models.CharField(choices=[('RPG', 'Jeu de Rôle'), ('FPS', 'Tir à la Première Personne'), ('ADVENTURE', 'Aventure'), ('STRATEGY', 'Stratégie'), ('SIMULATION', 'Simulation'), ('PUZZLE', 'Puzzle'), ('PLATFORMER', 'Plateforme'), ('METROIDVANIA', 'Metroidvania'), ('VISUAL_NOVEL', 'Roman Visuel'), ('MMORPG', 'Jeu de Rôle en Ligne Massivement Multijoueur'), ('MOBA', 'Arène de Bataille en Ligne Multijoueur'), ('BATTLE_ROYALE', 'Battle Royale'), ('SURVIVAL', 'Survie'), ('RACING', 'Course'), ('SPORTS', 'Sports'), ('FIGHTING', 'Combat'), ('RHYTHM', 'Rythme'), ('ROGUELIKE', 'Roguelike'), ('SANDBOX', 'Bac à Sable'), ('TOWER_DEFENSE', 'Défense de Tour'), ('CARD_GAME', 'Jeu de Cartes'), ('BOARD_GAME', 'Jeu de Plateau'), ('IDLE', 'Jeu Incrémental'), ('EDUCATIONAL', 'Éducatif'), ('OTHER', 'Autre')], max_length=20, verbose_name='Genre'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='is_public',
+            field=models.BooleanField(default=True, verbose_name='Public'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='keywords',
+            field=models.CharField(help_text='Mots-clés séparés par des virgules', max_length=200, verbose_name='Mots-clés'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='references',
+            field=models.CharField(blank=True, help_text='Références séparées par des virgules', max_length=200, verbose_name='Références'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='story_act1',
+            field=models.TextField(verbose_name='Acte 1'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='story_act2',
+            field=models.TextField(verbose_name='Acte 2'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='story_act3',
+            field=models.TextField(verbose_name='Acte 3'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='story_premise',
+            field=models.TextField(verbose_name="Prémisse de l'histoire"),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='story_twist',
+            field=models.TextField(verbose_name='Rebondissement'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='title',
+            field=models.CharField(max_length=100, verbose_name='Titre'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Mis à jour le'),
+        ),
+        migrations.AlterField(
+            model_name='gameimage',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Créée le'),
+        ),
+        migrations.AlterField(
+            model_name='gameimage',
+            name='game',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='gameforge.game', verbose_name='Jeu'),
+        ),
+        migrations.AlterField(
+            model_name='gameimage',
+            name='image_type',
+            field=models.CharField(choices=[('CHARACTER', 'Personnage'), ('LOCATION', 'Lieu'), ('CONCEPT', 'Art Conceptuel')], max_length=20, verbose_name="Type d'image"),
+        ),
+        migrations.AlterField(
+            model_name='gameimage',
+            name='prompt',
+            field=models.TextField(help_text='Le prompt utilisé pour générer cette image', verbose_name='Prompt'),
+        ),
+        migrations.AlterField(
+            model_name='location',
+            name='description',
+            field=models.TextField(verbose_name='Description'),
+        ),
+        migrations.AlterField(
+            model_name='location',
+            name='game',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='locations', to='gameforge.game', verbose_name='Jeu'),
+        ),
+        migrations.AlterField(
+            model_name='location',
+            name='name',
+            field=models.CharField(max_length=100, verbose_name='Nom'),
+        ),
+    ]
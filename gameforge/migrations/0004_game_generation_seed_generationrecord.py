@@ -0,0 +1,42 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gameforge', '0003_aisettings_useraisettings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='generation_seed',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='Graine de génération'),
+        ),
+        migrations.CreateModel(
+            name='GenerationRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('section', models.CharField(max_length=64, verbose_name='Section')),
+                ('backend', models.CharField(blank=True, max_length=20, verbose_name='Backend')),
+                ('model', models.CharField(blank=True, max_length=100, verbose_name='Modèle')),
+                ('template_version', models.CharField(blank=True, max_length=20, verbose_name='Version du prompt')),
+                ('seed', models.BigIntegerField(verbose_name='Graine')),
+                ('params', models.JSONField(default=dict, verbose_name='Paramètres')),
+                ('prompt_hash', models.CharField(max_length=16, verbose_name='Empreinte du prompt')),
+                ('output_hash', models.CharField(blank=True, max_length=16, verbose_name='Empreinte du texte')),
+                ('prompt_tokens', models.PositiveIntegerField(default=0, verbose_name='Tokens du prompt')),
+                ('completion_tokens', models.PositiveIntegerField(default=0, verbose_name='Tokens générés')),
+                ('latency', models.FloatField(default=0, verbose_name='Latence (s)')),
+                ('cache_hit', models.BooleanField(default=False, verbose_name='Depuis le cache')),
+                ('fallback', models.BooleanField(default=False, verbose_name='Génération de repli')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Créé le')),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='generation_records', to='gameforge.game', verbose_name='Jeu')),
+            ],
+            options={
+                'verbose_name': 'Provenance de génération',
+                'verbose_name_plural': 'Provenances de génération',
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gameforge', '0004_game_generation_seed_generationrecord'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='gameimage',
+            name='image',
+            field=models.ImageField(db_index=True, upload_to='game_images/', verbose_name='Image'),
+        ),
+    ]
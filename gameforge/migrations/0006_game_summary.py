@@ -0,0 +1,34 @@
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+SUMMARY_LENGTH = 100
+BATCH_SIZE = 500
+
+
+def backfill_summaries(apps, schema_editor):
+    Game = apps.get_model('gameforge', 'Game')
+    batch = []
+    for game in Game.objects.only('id', 'story_premise').iterator(chunk_size=BATCH_SIZE):
+        game.summary = Truncator(game.story_premise or '').chars(SUMMARY_LENGTH)
+        batch.append(game)
+        if len(batch) >= BATCH_SIZE:
+            Game.objects.bulk_update(batch, ['summary'])
+            batch = []
+    if batch:
+        Game.objects.bulk_update(batch, ['summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gameforge', '0005_gameimage_image_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='summary',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Résumé'),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,124 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+from .ai_utils import truncate_at_stop
+
+logger = logging.getLogger(__name__)
+
+# Paramètres de génération par défaut, identiques à ceux de generate_text
+DEFAULT_OPTIONS = {
+    'max_tokens': 80,
+    'temperature': 0.9,
+    'top_p': 0.9,
+    'repetition_penalty': 1.2,
+}
+
+
+class BatchingGenerator:
+    """
+    File d'attente devant le pipeline du modèle local: les complétions
+    reçues en même temps sont regroupées en lots pour un seul appel au
+    modèle. Un lot part dès qu'il est plein ou que la plus ancienne requête
+    a attendu `max_wait` secondes.
+
+    Seules les requêtes ayant les mêmes paramètres de génération partagent
+    un lot. Une requête avec graine est générée seule, après torch.manual_seed:
+    son texte ne dépend pas des autres requêtes reçues en même temps, et la
+    rejouer avec la même graine donne le même texte.
+    """
+
+    def __init__(self, text_generator, max_batch_size=8, max_wait=0.02):
+        self.text_generator = text_generator
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.pending = queue.Queue()
+
+        # Les modèles décodeurs se complètent à droite: le remplissage doit être à gauche
+        tokenizer = text_generator.tokenizer
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+
+        self.worker = threading.Thread(target=self._run, name="gameforge-model-batcher", daemon=True)
+        self.worker.start()
+
+    def complete(self, payload):
+        """
+        Met une complétion en file et attend son résultat.
+
+        Args:
+            payload (dict): Requête au format /v1/completions
+
+        Returns:
+            str: Le texte généré, sans le prompt
+        """
+        options = tuple(payload.get(key) or default for key, default in DEFAULT_OPTIONS.items())
+        future = Future()
+        self.pending.put((payload.get("prompt", ""), options, payload.get("seed"), future))
+        # Les séquences d'arrêt ne raccourcissent pas un lot: elles s'appliquent au texte de chaque requête
+        return truncate_at_stop(future.result(), payload.get("stop"))
+
+    def _next_batch(self):
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            groups = {}
+            seeded = []
+            for prompt, options, seed, future in self._next_batch():
+                if seed is None:
+                    groups.setdefault(options, []).append((prompt, future))
+                else:
+                    seeded.append((options, [(prompt, future)], seed))
+            for options, requests in groups.items():
+                self._generate(options, requests)
+            for options, requests, seed in seeded:
+                self._generate(options, requests, seed)
+
+    def _generate(self, options, requests, seed=None):
+        max_tokens, temperature, top_p, repetition_penalty = options
+        prompts = [prompt for prompt, _ in requests]
+        started = time.perf_counter()
+        try:
+            if seed is not None and torch is not None:
+                torch.manual_seed(seed)
+            outputs = self.text_generator(
+                prompts,
+                batch_size=len(prompts),
+                return_full_text=False,
+                max_new_tokens=max_tokens,
+                do_sample=True,
+                temperature=temperature,
+                top_p=top_p,
+                top_k=50,
+                repetition_penalty=repetition_penalty,
+                no_repeat_ngram_size=3,
+                pad_token_id=self.text_generator.tokenizer.pad_token_id,
+            )
+        except Exception as e:
+            logger.error(f"Erreur lors de la génération d'un lot de {len(prompts)} requêtes: {e}")
+            for _, future in requests:
+                future.set_exception(e)
+            return
+
+        logger.debug(f"Lot de {len(prompts)} requêtes généré en {time.perf_counter() - started:.2f}s")
+        for (_, future), output in zip(requests, outputs):
+            future.set_result(output[0]["generated_text"])
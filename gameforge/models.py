@@ -1,8 +1,52 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.cache import cache
+from django.db.models import BooleanField, Exists, OuterRef, Prefetch, Value
+from django.utils.text import Truncator
+
+# Longueur du résumé affiché sur les cartes de jeu
+SUMMARY_LENGTH = 100
+
+# Colonnes lues par les listes de jeux (cartes): ni les textes de l'histoire, ni les paramètres de génération
+GAME_LISTING_FIELDS = ('id', 'title', 'creator__username', 'genre', 'ambiance', 'summary', 'is_public',
+                       'created_at', 'favorite_count')
+
+
+def summarize(text, length=SUMMARY_LENGTH):
+    """Résumé court d'un texte, tronqué comme le filtre truncatechars."""
+    return Truncator(text or '').chars(length)
+
+def card_image_prefetch(lookup='images'):
+    """
+    Prefetch only the first image of each game, the one its card shows, in a
+    single query for the whole list (see Game.card_image).
+    """
+    first_image = GameImage.objects.only('id', 'game', 'image').order_by('id')[:1]
+    return Prefetch(lookup, queryset=first_image, to_attr='card_images')
 
 # Create your models here.
+class GameQuerySet(models.QuerySet):
+    def with_detail(self, user=None):
+        """
+        Load games with everything the detail page and the API need: the creator
+        in the same query, characters/locations/images prefetched, and an
+        `is_favorite` annotation for the given user.
+        """
+        qs = self.select_related('creator').prefetch_related('characters', 'locations', 'images')
+        if user is not None and user.is_authenticated:
+            return qs.annotate(is_favorite=Exists(
+                Favorite.objects.filter(user=user, game=OuterRef('pk'))
+            ))
+        return qs.annotate(is_favorite=Value(False, output_field=BooleanField()))
+
+    def for_listing(self):
+        """
+        Load only what the game cards render: the creator in the same query, the
+        precomputed `summary` and the first image in one more query, leaving the
+        large story columns in the database.
+        """
+        return self.select_related('creator').only(*GAME_LISTING_FIELDS).prefetch_related(card_image_prefetch())
+
 class Game(models.Model):
     GENRE_CHOICES = [
         ('RPG', 'Jeu de Rôle'),
@@ -76,15 +120,37 @@ class Game(models.Model):
     story_act2 = models.TextField(verbose_name="Acte 2")
     story_act3 = models.TextField(verbose_name="Acte 3")
     story_twist = models.TextField(verbose_name="Rebondissement")
+    # Début de la prémisse, calculé à la génération pour les listes (voir refresh_summary)
+    summary = models.CharField(max_length=SUMMARY_LENGTH, blank=True, verbose_name="Résumé")
 
     # Paramètres du jeu
     is_public = models.BooleanField(default=True, verbose_name="Public")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Créé le")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Mis à jour le")
 
+    # Compteur dénormalisé, maintenu avec des expressions F() (voir toggle_favorite)
+    favorite_count = models.PositiveIntegerField(default=0, verbose_name="Nombre de favoris")
+
+    # Graine de la génération, pour la rejouer (voir GenerationRecord)
+    generation_seed = models.BigIntegerField(null=True, blank=True, verbose_name="Graine de génération")
+
+    objects = GameQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
+    def refresh_summary(self):
+        """Recalcule le résumé des cartes à partir de la prémisse."""
+        self.summary = summarize(self.story_premise)
+
+    @property
+    def card_image(self):
+        """Image affichée sur la carte du jeu (préchargée par for_listing), ou None."""
+        images = getattr(self, 'card_images', None)
+        if images is None:
+            return self.images.order_by('id').first()
+        return images[0] if images else None
+
 class Character(models.Model):
     game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='characters', verbose_name="Jeu")
     name = models.CharField(max_length=100, verbose_name="Nom")
@@ -121,7 +187,8 @@ class GameImage(models.Model):
 
     game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='images', verbose_name="Jeu")
     image_type = models.CharField(max_length=20, choices=IMAGE_TYPE_CHOICES, verbose_name="Type d'image")
-    image = models.ImageField(upload_to='game_images/', verbose_name="Image")
+    # Indexé: les images dédupliquées par contenu sont partagées, gc_media compte leurs références
+    image = models.ImageField(upload_to='game_images/', db_index=True, verbose_name="Image")
     prompt = models.TextField(help_text="Le prompt utilisé pour générer cette image", verbose_name="Prompt")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Créée le")
 
@@ -132,6 +199,31 @@ class GameImage(models.Model):
     def __str__(self):
         return f"{self.get_image_type_display()} pour {self.game.title}"
 
+class GenerationRecord(models.Model):
+    """Provenance d'une section générée: de quoi expliquer ou rejouer la génération."""
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='generation_records', verbose_name="Jeu")
+    section = models.CharField(max_length=64, verbose_name="Section")
+    backend = models.CharField(max_length=20, blank=True, verbose_name="Backend")
+    model = models.CharField(max_length=100, blank=True, verbose_name="Modèle")
+    template_version = models.CharField(max_length=20, blank=True, verbose_name="Version du prompt")
+    seed = models.BigIntegerField(verbose_name="Graine")
+    params = models.JSONField(default=dict, verbose_name="Paramètres")
+    prompt_hash = models.CharField(max_length=16, verbose_name="Empreinte du prompt")
+    output_hash = models.CharField(max_length=16, blank=True, verbose_name="Empreinte du texte")
+    prompt_tokens = models.PositiveIntegerField(default=0, verbose_name="Tokens du prompt")
+    completion_tokens = models.PositiveIntegerField(default=0, verbose_name="Tokens générés")
+    latency = models.FloatField(default=0, verbose_name="Latence (s)")
+    cache_hit = models.BooleanField(default=False, verbose_name="Depuis le cache")
+    fallback = models.BooleanField(default=False, verbose_name="Génération de repli")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Créé le")
+
+    class Meta:
+        verbose_name = "Provenance de génération"
+        verbose_name_plural = "Provenances de génération"
+
+    def __str__(self):
+        return f"{self.section} ({self.game.title})"
+
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorites', verbose_name="Utilisateur")
     game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='favorited_by', verbose_name="Jeu")
@@ -145,14 +237,38 @@ class Favorite(models.Model):
     def __str__(self):
         return f"{self.user.username} a ajouté {self.game.title} aux favoris"
 
+class GameTrend(models.Model):
+    """Classement précalculé des jeux tendance (favoris pondérés par leur ancienneté)."""
+    game = models.OneToOneField(Game, on_delete=models.CASCADE, primary_key=True, related_name='trend',
+                                verbose_name="Jeu")
+    score = models.FloatField(default=0, db_index=True, verbose_name="Score")
+    refreshed_at = models.DateTimeField(verbose_name="Rafraîchi le")
+
+    class Meta:
+        verbose_name = "Tendance"
+        verbose_name_plural = "Tendances"
+
+    def __str__(self):
+        return f"{self.game.title} ({self.score:.2f})"
+
 class AISettings(models.Model):
     """Modèle pour stocker les paramètres d'IA globaux pour l'application."""
+
+    LOCAL_INFERENCE_MODE_CHOICES = [
+        ('FLOAT32', 'Float32 (référence)'),
+        ('INT8', 'Int8 quantifié dynamiquement'),
+        ('ONNX', 'ONNX Runtime'),
+    ]
+
     use_remote_llm = models.BooleanField(default=False, 
                                         help_text="Utiliser un LLM distant au lieu du modèle local", 
                                         verbose_name="Utiliser LLM distant")
     remote_llm_url = models.CharField(max_length=255, default="http://127.0.0.1:1234",
                                      help_text="URL de l'API LLM distante",
                                      verbose_name="URL du LLM distant")
+    local_inference_mode = models.CharField(max_length=10, choices=LOCAL_INFERENCE_MODE_CHOICES, default='FLOAT32',
+                                            help_text="Format du modèle local sur CPU (pris en compte au redémarrage)",
+                                            verbose_name="Mode d'inférence locale")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Créé le")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Mis à jour le")
 
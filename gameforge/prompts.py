@@ -0,0 +1,239 @@
+import hashlib
+import random
+import string
+import textwrap
+
+from django.conf import settings
+
+from . import metrics
+
+_formatter = string.Formatter()
+
+
+def compact(text):
+    """
+    Réduit un texte de prompt au minimum d'espaces: indentation, espaces en
+    fin de ligne et lignes vides supprimés, sauts de ligne conservés.
+
+    Args:
+        text (str): Le texte du prompt
+
+    Returns:
+        str: Le texte compacté
+    """
+    lines = (" ".join(line.split()) for line in textwrap.dedent(text).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+class PromptTemplate:
+    """
+    Prompt compilé une seule fois à l'enregistrement: le texte est compacté
+    et découpé en morceaux littéraux et champs à remplacer.
+    """
+
+    def __init__(self, name, version, text):
+        self.name = name
+        self.version = version
+        self.text = compact(text)
+        self.parts = []
+        for literal, field, format_spec, conversion in _formatter.parse(self.text):
+            if format_spec or conversion:
+                raise ValueError(f"Prompt {name}@{version}: format non supporté pour le champ {field}")
+            self.parts.append((literal, field))
+        self.fields = frozenset(field for _, field in self.parts if field is not None)
+        self._tokens = None
+
+    def render(self, **values):
+        """
+        Remplit le prompt.
+
+        Args:
+            **values: Valeur de chaque champ du prompt
+
+        Returns:
+            str: Le prompt prêt à être envoyé
+
+        Raises:
+            KeyError: Si un champ du prompt n'a pas de valeur
+        """
+        return "".join(
+            literal if field is None else f"{literal}{values[field]}"
+            for literal, field in self.parts
+        )
+
+    def token_count(self):
+        """Tokens du texte fixe du prompt (hors champs), avec le tokenizer actif."""
+        if self._tokens is None:
+            from .ai_utils import count_tokens
+
+            self._tokens = count_tokens("".join(literal for literal, _ in self.parts))
+        return self._tokens
+
+    def __repr__(self):
+        return f"<PromptTemplate {self.name}@{self.version}>"
+
+
+# Prompts enregistrés, par nom puis par version (dans l'ordre d'enregistrement)
+_registry = {}
+
+
+def register(name, version, text):
+    """Enregistre une version d'un prompt et la retourne compilée."""
+    template = PromptTemplate(name, version, text)
+    _registry.setdefault(name, {})[version] = template
+    return template
+
+
+def versions():
+    """Toutes les versions enregistrées, de la plus ancienne à la plus récente."""
+    seen = {}
+    for by_version in _registry.values():
+        seen.update(dict.fromkeys(by_version))
+    return list(seen)
+
+
+def templates():
+    """Tous les prompts enregistrés, toutes versions confondues."""
+    return [template for by_version in _registry.values() for template in by_version.values()]
+
+
+def active_version():
+    """
+    Version des prompts à utiliser pour la génération en cours.
+
+    Avec PROMPT_TEMPLATE_AB (poids par version), la version est tirée au sort
+    à partir de la graine de la génération: tous les prompts d'un jeu
+    utilisent la même version, et un jeu rejoué avec sa graine la retrouve.
+    Hors génération, ou sans test A/B, c'est PROMPT_TEMPLATE_VERSION (la
+    plus récente par défaut).
+
+    Returns:
+        str: La version des prompts
+    """
+    weights = {version: weight for version, weight in settings.PROMPT_TEMPLATE_AB.items()
+               if weight > 0 and version in versions()}
+    job = metrics.current_job()
+    if weights and job is not None:
+        digest = hashlib.sha256(f"{job.seed}:prompts".encode('utf-8')).hexdigest()
+        return random.Random(int(digest[:8], 16)).choices(list(weights), weights=list(weights.values()))[0]
+    return settings.PROMPT_TEMPLATE_VERSION or versions()[-1]
+
+
+def get(name, version=None):
+    """
+    Retourne un prompt dans la version demandée (active par défaut). Une
+    version qui ne redéfinit pas un prompt reprend celui de la version
+    précédente.
+
+    Args:
+        name (str): Nom du prompt
+        version (str, optional): Version des prompts
+
+    Returns:
+        PromptTemplate: Le prompt compilé
+
+    Raises:
+        KeyError: Si le prompt n'existe dans aucune version antérieure
+    """
+    version = version or active_version()
+    by_version = _registry[name]
+    if version in by_version:
+        return by_version[version]
+    all_versions = versions()
+    earlier = all_versions[:all_versions.index(version)] if version in all_versions else all_versions
+    for candidate in reversed(earlier):
+        if candidate in by_version:
+            return by_version[candidate]
+    raise KeyError(f"{name}@{version}")
+
+
+def render(name, version=None, /, **values):
+    """
+    Remplit un prompt dans la version demandée (active par défaut). Le nom et
+    la version sont positionnels: un champ du prompt peut s'appeler `name`.
+    """
+    return get(name, version).render(**values)
+
+
+# Prompts en français pour de meilleurs résultats avec les modèles multilingues
+
+register("story.context", "v1", """
+    CONSIGNE DE REPONSE : AUCUN SMILEY, AUCUN TEXTE GRAS , AUCUNE MISE EN FORME, JE VEUX UN TEXTE PLAT
+    Génération pour un jeu vidéo avec les caractéristiques suivantes:
+    - Titre: {title}
+    - Genre: {genre}
+    - Ambiance: {ambiance}
+    - Mots-clés: {keywords}
+    - Inspirations/Références: {refs}
+""")
+
+register("story.title", "v1", """
+    Propose un titre original, accrocheur et mémorable qui capture parfaitement l'essence de ce jeu.
+    Le titre doit être court (2-5 mots maximum) et évocateur.
+""")
+
+register("story.premise", "v1", """
+    Rédige un synopsis captivant pour ce jeu qui présente:
+    - L'univers et son ambiance {ambiance}
+    - Le concept central du gameplay
+    - La situation initiale qui lance l'aventure
+    - Ce qui rend ce jeu unique dans le genre {genre}
+    (Entre 3 et 5 phrases maximum)
+""")
+
+register("story.act1", "v1", """
+    Décris le premier acte du jeu qui doit inclure:
+    - L'introduction du protagoniste et sa situation initiale
+    - Les événements déclencheurs qui lancent l'aventure
+    - Les premiers objectifs/missions du joueur
+    - Les mécaniques de base introduites
+    - L'ambiance {ambiance} mise en place
+    (Entre 4 et 6 phrases)
+""")
+
+register("story.act2", "v1", """
+    Décris le deuxième acte du jeu qui doit détailler:
+    - L'évolution des enjeux et l'intensification du conflit principal
+    - Les défis croissants auxquels le joueur fait face
+    - Les nouvelles mécaniques/capacités débloquées
+    - Les rebondissements qui complexifient l'histoire
+    - Comment l'ambiance {ambiance} évolue
+    (Entre 4 et 6 phrases)
+""")
+
+register("story.act3", "v1", """
+    Décris le climax et la conclusion du jeu, incluant:
+    - La confrontation finale ou défi ultime
+    - Comment les mécaniques et l'histoire convergent
+    - L'utilisation des capacités complètes du joueur
+    - La résolution des principaux arcs narratifs
+    - L'impact émotionnel final fidèle à l'ambiance {ambiance}
+    (Entre 4 et 6 phrases)
+""")
+
+register("story.twist", "v1", """
+    Propose un rebondissement narratif ou ludique inattendu qui:
+    - Surprend le joueur à un moment clé de l'aventure
+    - Transforme sa perception de l'histoire ou des mécaniques
+    - Reste cohérent avec l'univers et le genre {genre}
+    - Ajoute une profondeur supplémentaire à l'expérience
+    (Entre 2 et 3 phrases percutantes)
+""")
+
+register("character.protagonist.background", "v1",
+         "Histoire et motivations d'un protagoniste héroïque dans un jeu {genre}:")
+register("character.protagonist.gameplay", "v1",
+         "Les capacités et le style de jeu d'un protagoniste dans un jeu {genre}:")
+register("character.antagonist.background", "v1",
+         "Histoire et motivations d'un antagoniste mémorable dans un jeu {genre}:")
+register("character.antagonist.gameplay", "v1",
+         "Les capacités et les tactiques d'un antagoniste dans un jeu {genre}:")
+register("character.other.background", "v1",
+         "Histoire et motivations d'un personnage {role} dans un jeu {genre}:")
+register("character.other.gameplay", "v1",
+         "Les capacités et l'utilité d'un personnage {role} dans un jeu {genre}:")
+register("character.name", "v1", "Un nom original pour un {role} dans un jeu {genre}:")
+register("character.class", "v1", "Une classe typique pour un {role} dans un jeu {genre}:")
+
+register("location.name", "v1", "Un nom évocateur pour un lieu avec ambiance {ambiance}:")
+register("location.description", "v1", "Description atmosphérique d'un lieu {ambiance} nommé {name}:")
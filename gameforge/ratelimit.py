@@ -0,0 +1,199 @@
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache_utils import CacheLockTimeout, cache_lock
+
+
+class RateLimited(Exception):
+    """La limite de générations est atteinte; réessayer après `retry_after` secondes."""
+
+    def __init__(self, scope, retry_after):
+        super().__init__(f"Limite de génération atteinte ({scope}), réessayer dans {retry_after}s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def _bucket_key(scope):
+    return f"gameforge:ratelimit:{scope}"
+
+
+def _refill(state, limit, now):
+    """Retourne le nombre de jetons d'un seau, remis à niveau à l'instant `now`."""
+    if state is None:
+        return limit['capacity']
+    tokens, updated = state
+    return min(limit['capacity'], tokens + (now - updated) * limit['per_hour'] / 3600)
+
+
+def take_tokens(buckets, cost=1):
+    """
+    Prend `cost` jetons dans chacun des seaux, ou dans aucun si l'un d'eux
+    n'en a pas assez. Les seaux sont stockés dans le cache Django et
+    partagés entre processus.
+
+    Args:
+        buckets (dict): Limite ({'capacity', 'per_hour'}) de chaque seau, par nom
+        cost (int, optional): Nombre de jetons à prendre
+
+    Raises:
+        RateLimited: Si un seau est vide, avec le délai avant qu'il suffise
+    """
+    # Verrous pris dans un ordre fixe pour ne pas s'interbloquer
+    scopes = sorted(buckets)
+    with ExitStack() as stack:
+        try:
+            for scope in scopes:
+                stack.enter_context(cache_lock(f"ratelimit:{scope}", timeout=5))
+        except CacheLockTimeout:
+            # Seau trop disputé: autant faire patienter le client
+            raise RateLimited(scope, 1)
+
+        now = time.time()
+        states = cache.get_many([_bucket_key(scope) for scope in scopes])
+        levels = {}
+        for scope in scopes:
+            limit = buckets[scope]
+            levels[scope] = _refill(states.get(_bucket_key(scope)), limit, now)
+            if levels[scope] < cost:
+                missing = cost - levels[scope]
+                retry_after = math.ceil(missing * 3600 / limit['per_hour']) if limit['per_hour'] else 3600
+                raise RateLimited(scope, retry_after)
+
+        # Passé ce délai les seaux sont pleins: inutile de les conserver
+        refill_time = max(math.ceil(limit['capacity'] * 3600 / limit['per_hour']) if limit['per_hour'] else 86400
+                          for limit in buckets.values())
+        cache.set_many({_bucket_key(scope): (levels[scope] - cost, now) for scope in scopes}, timeout=refill_time)
+
+
+def check_generation_rate(user, backend):
+    """
+    Consomme une génération de jeu dans le seau de l'utilisateur et dans
+    celui du backend qui la servira.
+
+    Args:
+        user (User): L'utilisateur qui lance la génération
+        backend (str): Backend résolu par ai_utils.resolve_backend
+
+    Raises:
+        RateLimited: Si l'utilisateur ou le backend a atteint sa limite
+    """
+    buckets = {}
+    if settings.GENERATION_RATE_LIMIT_USER and user.is_authenticated:
+        buckets[f"user:{user.id}"] = settings.GENERATION_RATE_LIMIT_USER
+    backend_limit = settings.GENERATION_RATE_LIMIT_BACKEND.get(backend)
+    if backend_limit:
+        buckets[f"backend:{backend}"] = backend_limit
+    if buckets:
+        take_tokens(buckets)
+
+
+class FairSlots:
+    """
+    Créneaux d'exécution d'un backend, attribués par file équitable pondérée
+    (start-time fair queuing): chaque utilisateur reçoit une part des
+    créneaux proportionnelle à son poids, quel que soit le nombre de
+    requêtes qu'il met en file. Un utilisateur qui en envoie beaucoup ne
+    fait attendre que lui-même.
+
+    Les threads (acquire) et les coroutines (aacquire, sans bloquer de
+    thread, quelle que soit leur boucle d'événements) partagent la même
+    file et les mêmes créneaux.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.virtual_time = 0.0
+        self.last_finish = {}
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        # Coroutines en attente: (boucle, future) par entrée de la file
+        self.async_waiters = {}
+
+    def _enqueue(self, flow, weight):
+        start = max(self.virtual_time, self.last_finish.get(flow, 0.0))
+        self.last_finish[flow] = start + 1 / weight
+        entry = (start, next(self.sequence))
+        heapq.heappush(self.waiting, entry)
+        return entry
+
+    def _admit(self, entry):
+        heapq.heappop(self.waiting)
+        self.active += 1
+        self.virtual_time = entry[0]
+        # Les utilisateurs dont la dernière requête est déjà servie repartent à zéro
+        if len(self.last_finish) > 1000:
+            self.last_finish = {f: t for f, t in self.last_finish.items() if t > self.virtual_time}
+
+    def _wake(self):
+        # Appelé avec la condition: sert les coroutines en tête de file, puis réveille les threads
+        while self.active < self.limit and self.waiting and self.waiting[0] in self.async_waiters:
+            entry = self.waiting[0]
+            loop, future = self.async_waiters.pop(entry)
+            self._admit(entry)
+            loop.call_soon_threadsafe(self._resolve, future)
+        self.condition.notify_all()
+
+    def _resolve(self, future):
+        # Dans la boucle de la coroutine: si elle a été annulée entre-temps, rendre son créneau
+        if future.done():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def acquire(self, flow, weight=1):
+        with self.condition:
+            entry = self._enqueue(flow, weight)
+            while self.active >= self.limit or self.waiting[0] is not entry:
+                self.condition.wait()
+            self._admit(entry)
+            self._wake()
+
+    async def aacquire(self, flow, weight=1):
+        """Variante asynchrone de acquire: l'attente n'occupe aucun thread."""
+        loop = asyncio.get_running_loop()
+        with self.condition:
+            entry = self._enqueue(flow, weight)
+            if self.active < self.limit and self.waiting[0] is entry:
+                self._admit(entry)
+                self._wake()
+                return
+            future = loop.create_future()
+            self.async_waiters[entry] = (loop, future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self.condition:
+                if self.async_waiters.pop(entry, None) is not None:
+                    # Pas encore servie: quitter la file
+                    self.waiting.remove(entry)
+                    heapq.heapify(self.waiting)
+                    self._wake()
+                elif not future.cancelled():
+                    # Servie juste avant l'annulation: le créneau est à nous
+                    self.active -= 1
+                    self._wake()
+                # Sinon _resolve rendra le créneau
+            raise
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self._wake()
+
+
+def queue_weight(user):
+    """Poids d'un utilisateur dans la file équitable des backends."""
+    weights = settings.GENERATION_QUEUE_WEIGHTS
+    if user is not None and getattr(user, 'is_staff', False):
+        return weights.get('staff', 1)
+    return weights.get('default', 1)
@@ -0,0 +1,55 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Game, Character, Location, GameImage
+
+_touched_games = contextvars.ContextVar('gameforge_touched_games', default=None)
+
+
+@contextmanager
+def touching_games():
+    """
+    Regroupe les mises à jour de `updated_at` des jeux dont le contenu change
+    dans le bloc: une seule requête à la sortie, au lieu d'une par élément
+    enregistré ou supprimé.
+    """
+    if _touched_games.get() is not None:
+        yield
+        return
+    touched = set()
+    token = _touched_games.set(touched)
+    try:
+        yield
+    finally:
+        _touched_games.reset(token)
+    if touched:
+        Game.objects.filter(pk__in=touched).update(updated_at=timezone.now())
+
+
+def _deletes_game(origin):
+    if isinstance(origin, QuerySet):
+        return origin.model is Game
+    return isinstance(origin, Game)
+
+
+@receiver([post_save, post_delete], sender=Character)
+@receiver([post_save, post_delete], sender=Location)
+@receiver([post_save, post_delete], sender=GameImage)
+def touch_parent_game(sender, instance, origin=None, **kwargs):
+    """
+    Met à jour `updated_at` du jeu parent quand un de ses éléments change: la
+    page mise en cache est indexée par cette date (voir game_detail_cache_key).
+    """
+    if _deletes_game(origin):
+        # Suppression en cascade du jeu lui-même: rien à mettre à jour
+        return
+    touched = _touched_games.get()
+    if touched is not None:
+        touched.add(instance.game_id)
+    else:
+        Game.objects.filter(pk=instance.game_id).update(updated_at=timezone.now())
@@ -0,0 +1,298 @@
+import atexit
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+
+from .cache_utils import CacheLockTimeout, cache_lock
+
+logger = logging.getLogger(__name__)
+
+# Dossier des images générées et importées dans le stockage
+IMAGES_DIR = 'game_images'
+
+_writer = None
+_writer_lock = threading.Lock()
+
+# Écritures en arrière-plan pas encore confirmées, par nom d'image
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+class AtomicFileSystemStorage(FileSystemStorage):
+    """
+    Stockage sur disque dont les écritures sont atomiques: le fichier est
+    écrit dans un fichier temporaire du même dossier puis renommé, si bien
+    qu'aucun lecteur ne voit jamais d'image à moitié écrite, même si le
+    processus s'arrête pendant l'écriture.
+
+    Les dossiers déjà créés sont mémorisés pour ne pas appeler os.makedirs
+    à chaque fichier.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._known_dirs = set()
+
+    def _ensure_dir(self, directory):
+        if directory in self._known_dirs:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self._known_dirs.add(directory)
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        self._ensure_dir(directory)
+
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        except FileNotFoundError:
+            # Dossier supprimé depuis qu'il a été mémorisé (nettoyage, restauration)
+            self._known_dirs.discard(directory)
+            self._ensure_dir(directory)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if hasattr(content, 'chunks'):
+                    for chunk in content.chunks():
+                        f.write(chunk)
+                else:
+                    f.write(content.read())
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            # Remplace un éventuel fichier existant: les noms sont dérivés du contenu
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return str(name).replace('\\', '/')
+
+
+def sharded_name(sha256, extension='.jpg', directory=IMAGES_DIR):
+    """
+    Chemin de stockage d'un fichier nommé d'après le hash de son contenu,
+    réparti dans deux niveaux de sous-dossiers (65 536 au total) pour
+    qu'aucun dossier ne contienne des millions de fichiers.
+
+    Args:
+        sha256 (str): Hash SHA-256 hexadécimal du contenu
+        extension (str, optional): Extension du fichier, point compris
+        directory (str, optional): Dossier racine dans le stockage
+
+    Returns:
+        str: Par exemple game_images/ab/cd/abcd….jpg
+    """
+    return f"{directory}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+def image_name(data, filename):
+    """Nom de stockage d'une image d'après son contenu (l'extension vient de filename)."""
+    return sharded_name(hashlib.sha256(data).hexdigest(), os.path.splitext(filename)[1] or '.jpg')
+
+
+def _get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ThreadPoolExecutor(max_workers=settings.MEDIA_WRITE_WORKERS,
+                                         thread_name_prefix='gameforge-media')
+            atexit.register(_writer.shutdown, wait=True)
+        return _writer
+
+
+def _media_lock(name):
+    # Sérialise l'écriture d'une image et sa suppression par gc_media
+    return cache_lock(f"media:{name}", timeout=60, wait=30)
+
+
+def _touch(name):
+    # Une image réutilisée redevient récente: gc_media ne la supprime pas avant
+    # que la ligne GameImage qui la référence soit enregistrée. Sans disque
+    # local (S3), l'image est réécrite, ce qui a le même effet.
+    if not isinstance(default_storage, FileSystemStorage):
+        return False
+    try:
+        os.utime(default_storage.path(name))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _write(name, data):
+    try:
+        with _media_lock(name):
+            # Même nom, même contenu: une image déjà présente n'est pas réécrite
+            if default_storage.exists(name) and _touch(name):
+                return name
+            saved = default_storage.save(name, ContentFile(data))
+            if saved != name:
+                # Écriture concurrente de la même image: le stockage a choisi un autre nom
+                default_storage.delete(saved)
+    except Exception as e:
+        logger.error(f"Erreur lors de l'écriture de l'image {name}: {e}")
+        raise
+    return name
+
+
+def save_image(data, filename, background=None):
+    """
+    Enregistre une image dans le stockage par défaut (voir STORAGES), sous un
+    nom dérivé de son contenu: les images identiques ne sont stockées qu'une
+    fois.
+
+    Args:
+        data (bytes): L'image encodée
+        filename (str): Nom d'origine, dont seule l'extension est gardée
+        background (bool, optional): Écrire dans un thread d'arrière-plan et
+            rendre la main tout de suite (par défaut MEDIA_BACKGROUND_WRITES)
+
+    Returns:
+        str: Le nom de l'image dans le stockage, connu avant la fin de
+        l'écriture (voir wait_for_write)
+    """
+    name = image_name(data, filename)
+    if background is None:
+        background = settings.MEDIA_BACKGROUND_WRITES
+    if background:
+        future = _get_writer().submit(_write, name, data)
+        with _pending_lock:
+            _pending[name] = future
+        future.add_done_callback(partial(_forget, name))
+    else:
+        _write(name, data)
+    return name
+
+
+def _forget(name, future):
+    # Les écritures réussies n'ont plus besoin d'être attendues; les échecs
+    # restent jusqu'à wait_for_write, qui les signale
+    if future.exception() is None:
+        with _pending_lock:
+            if _pending.get(name) is future:
+                del _pending[name]
+
+
+def wait_for_write(name):
+    """
+    Attend la fin de l'écriture en arrière-plan d'une image, à appeler avant
+    d'enregistrer la ligne qui la référence.
+
+    Raises:
+        Exception: L'erreur de l'écriture, si elle a échoué
+    """
+    with _pending_lock:
+        future = _pending.pop(name, None)
+    if future is not None:
+        future.result()
+
+
+def flush_writes():
+    """Attend la fin des écritures d'images en arrière-plan (commandes, tests)."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.shutdown(wait=True)
+    with _pending_lock:
+        failed = list(_pending)
+        _pending.clear()
+    for name in failed:
+        logger.warning(f"Écriture de l'image {name} échouée")
+
+
+def iter_files(directory=IMAGES_DIR):
+    """Parcourt les fichiers d'un dossier du stockage, sous-dossiers compris, sans tout charger en mémoire."""
+    try:
+        dirs, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for filename in files:
+        yield f"{directory}/{filename}"
+    for subdirectory in dirs:
+        yield from iter_files(f"{directory}/{subdirectory}")
+
+
+def _batches(names, size):
+    batch = []
+    for name in names:
+        batch.append(name)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def orphaned_images(batch_size=1000, grace=3600, directory=IMAGES_DIR):
+    """
+    Fichiers d'images qu'aucune ligne GameImage ne référence: images des jeux
+    supprimés, images écrites dont l'enregistrement en base a échoué, fichiers
+    temporaires abandonnés. Le stockage est comparé à la base par lots.
+
+    Args:
+        batch_size (int, optional): Nombre de fichiers comparés par requête
+        grace (int, optional): Âge minimum en secondes: les images plus
+            récentes peuvent appartenir à un jeu en cours d'enregistrement
+        directory (str, optional): Dossier parcouru dans le stockage
+
+    Yields:
+        str: Le nom de chaque image orpheline
+    """
+    from .models import GameImage
+
+    for batch in _batches(iter_files(directory), batch_size):
+        referenced = set(GameImage.objects.filter(image__in=batch).values_list('image', flat=True))
+        for name in batch:
+            if name not in referenced and not _is_recent(name, grace):
+                yield name
+
+
+def _is_recent(name, grace):
+    from django.utils import timezone
+
+    try:
+        return default_storage.get_modified_time(name) > timezone.now() - timedelta(seconds=grace)
+    except (FileNotFoundError, NotImplementedError):
+        # Déjà supprimée, ou âge inconnu: ne pas y toucher
+        return True
+
+
+def delete_orphan(name, grace=3600):
+    """
+    Supprime une image si plus aucune ligne GameImage ne la référence. Les
+    images étant dédupliquées par contenu, le compte et l'âge sont revérifiés
+    sous le verrou de l'image, que prend aussi son écriture: une image
+    réutilisée entre-temps par un nouveau jeu est soit rajeunie avant (et
+    gardée), soit réécrite après la suppression.
+
+    Args:
+        name (str): Nom de l'image dans le stockage
+        grace (int, optional): Âge minimum en secondes (voir orphaned_images)
+
+    Returns:
+        int: La taille libérée en octets (0 si l'image a été gardée)
+    """
+    from .models import GameImage
+
+    try:
+        with _media_lock(name):
+            if GameImage.objects.filter(image=name).exists() or _is_recent(name, grace):
+                return 0
+            size = default_storage.size(name)
+            default_storage.delete(name)
+            return size
+    except CacheLockTimeout:
+        # Image en cours d'écriture: elle sera revue au prochain passage
+        return 0
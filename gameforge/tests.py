@@ -1,3 +1,1058 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (
+    AsyncRequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import escape
+
+from . import ai_async, ai_stubs, ai_utils, health, metrics, middleware, model_server, prompts, ratelimit, storage
+from .favorites import toggle_favorite
+from .ai_utils import LINE_STOP, PARAGRAPH_STOP, STORY_SECTION_PARAMS
+from .generation import (
+    STORY_SECTIONS, abuild_game_content, build_game_content, generate_game_content, regenerate_character,
+    regenerate_story_section, save_games_content,
+)
+from .management.commands import generate_games
+from .ratelimit import FairSlots, RateLimited, take_tokens
+from .models import Game, Character, Location, GameImage, Favorite, GameTrend, GenerationRecord
+
+
+def create_game(creator, **kwargs):
+    fields = {
+        'title': "Test Game",
+        'creator': creator,
+        'genre': 'RPG',
+        'ambiance': 'FANTASY',
+        'keywords': "test",
+        'story_premise': "Prémisse",
+        'story_act1': "Acte 1",
+        'story_act2': "Acte 2",
+        'story_act3': "Acte 3",
+        'story_twist': "Rebondissement",
+    }
+    fields.update(kwargs)
+    return Game.objects.create(**fields)
+
+
+class GameDetailQueriesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="alice", password="secret-password")
+        self.game = create_game(self.user)
+        for name in ("Aria", "Thorne"):
+            Character.objects.create(game=self.game, name=name, character_class="Mage",
+                                     role="Protagonist", background="...", gameplay="...")
+        Location.objects.create(game=self.game, name="Crystal Caverns", description="...")
+        GameImage.objects.create(game=self.game, image_type='CHARACTER',
+                                 image='game_images/test.jpg', prompt="...")
+        Favorite.objects.create(user=self.user, game=self.game)
+
+    def test_with_detail_loads_game_in_four_queries(self):
+        # Game + creator + is_favorite, then one query per prefetched relation
+        with self.assertNumQueries(4):
+            game = Game.objects.with_detail(self.user).get(id=self.game.id)
+            self.assertEqual(game.creator.username, "alice")
+            self.assertTrue(game.is_favorite)
+            self.assertEqual(len(game.characters.all()), 2)
+            self.assertEqual(len(game.locations.all()), 1)
+            self.assertEqual(len(game.images.all()), 1)
+
+    def test_api_game_detail_query_count(self):
+        # One conditional GET lookup, then the same four queries as the loader
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('api_game_detail', args=[self.game.id]))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['characters']), 2)
+        self.assertFalse(data['is_favorite'])
+
+    def test_api_game_detail_not_modified(self):
+        url = reverse('api_game_detail', args=[self.game.id])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class ListingQueriesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="frank", password="secret-password")
+        self.client.force_login(self.user)
+
+    def add_games(self, count):
+        for i in range(count):
+            game = create_game(self.user, title=f"Game {i}")
+            for image_type in ('CHARACTER', 'LOCATION'):
+                GameImage.objects.create(game=game, image_type=image_type,
+                                         image=f'game_images/{game.id}-{image_type}.jpg', prompt="...")
+            Favorite.objects.create(user=self.user, game=game)
+            GameTrend.objects.create(game=game, score=i, refreshed_at=timezone.now())
+
+    def assertListingQueries(self, url_name, count):
+        """The page runs `count` queries, however many cards it shows"""
+        for games in (1, 5):
+            self.add_games(games)
+            cache.clear()
+            # Session and user lookups, then the listing itself
+            with self.assertNumQueries(count):
+                response = self.client.get(reverse(url_name))
+            self.assertEqual(response.status_code, 200)
+        first = GameImage.objects.filter(game__title="Game 0").order_by('id').first()
+        self.assertContains(response, first.image.url)
+
+    def test_home_query_count(self):
+        self.assertListingQueries('home', 4)
+
+    def test_dashboard_query_count(self):
+        self.assertListingQueries('dashboard', 4)
+
+    def test_favorites_query_count(self):
+        self.assertListingQueries('favorites', 4)
+
+    def test_trending_query_count(self):
+        # One more query to read the ranking after the cache is cleared
+        self.assertListingQueries('trending', 5)
+
+
+@override_settings(PROFILING_SAMPLE_RATE=0, PROFILING_DUMP_DIR=None)
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="grace", password="secret-password")
+
+    @override_settings(DEBUG=True)
+    def test_profile_header_is_ignored_for_non_staff_even_in_debug(self):
+        self.client.force_login(self.user)
+        with mock.patch.object(middleware, '_instrument_templates') as instrument:
+            response = self.client.get(reverse('home'), HTTP_X_PROFILE='1')
+        self.assertNotIn('Server-Timing', response)
+        instrument.assert_not_called()
+
+    def test_profile_header_profiles_staff_requests(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('home'), HTTP_X_PROFILE='1')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIsNotNone(middleware._original_template_render)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_async_stack_is_profiled_without_a_sync_adapter(self):
+        """Under ASGI the middleware stays async and still reports Server-Timing."""
+        async def view(request):
+            return HttpResponse('ok')
+
+        profiling = middleware.ProfilingMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(profiling))
+        response = asyncio.run(profiling(AsyncRequestFactory().get('/')))
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+
+class FavoriteTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="bob", password="secret-password")
+        self.game = create_game(self.user)
+
+    def test_concurrent_toggles_never_raise_and_keep_counter_consistent(self):
+        errors = []
+
+        def hammer():
+            try:
+                for _ in range(20):
+                    toggle_favorite(self.user, self.game.id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=hammer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.game.refresh_from_db()
+        favorites = Favorite.objects.filter(user=self.user, game=self.game).count()
+        self.assertLessEqual(favorites, 1)
+        self.assertEqual(self.game.favorite_count, favorites)
+
+    def test_toggle_flips_the_favorite_and_its_counter(self):
+        for expected in (True, False, True):
+            self.assertEqual(toggle_favorite(self.user, self.game.id), expected)
+            self.game.refresh_from_db()
+            self.assertEqual(self.game.favorite_count, int(expected))
+            self.assertEqual(Favorite.objects.filter(user=self.user, game=self.game).exists(), expected)
+
+    def test_put_and_delete_are_idempotent(self):
+        self.client.force_login(self.user)
+        url = reverse('api_favorite', args=[self.game.id])
+        for _ in range(2):
+            self.assertTrue(self.client.put(url).json()['is_favorite'])
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.favorite_count, 1)
+        for _ in range(2):
+            self.assertFalse(self.client.delete(url).json()['is_favorite'])
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.favorite_count, 0)
+
+
+def private_memory_mb(pid):
+    """Private (unshared) resident memory of a process, from /proc/<pid>/smaps_rollup"""
+    private_kb = 0
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                private_kb += int(line.split()[1])
+    return private_kb / 1024
+
+
+@unittest.skipUnless(os.path.exists('/proc/self/smaps_rollup'), "Linux only")
+@unittest.skipUnless(hasattr(ai_utils.model, 'parameters'), "Local PyTorch model not loaded")
+class PreloadForkMemoryTests(SimpleTestCase):
+    def run_workers(self, count):
+        """Fork `count` workers that each generate once, and return their private memory in MB"""
+        ready_read, ready_write = os.pipe()
+        release_read, release_write = os.pipe()
+        pids = []
+        for _ in range(count):
+            pid = os.fork()
+            if pid == 0:
+                os.close(ready_read)
+                os.close(release_write)
+                try:
+                    ai_utils.text_generator("Bonjour, je suis un", max_new_tokens=10, do_sample=False)
+                finally:
+                    os.write(ready_write, b'.')
+                    # Stay alive until every worker has been measured
+                    os.read(release_read, 1)
+                    os._exit(0)
+            pids.append(pid)
+
+        os.close(ready_write)
+        os.close(release_read)
+        for _ in range(count):
+            os.read(ready_read, 1)
+        try:
+            return [private_memory_mb(pid) for pid in pids]
+        finally:
+            os.close(release_write)
+            os.close(ready_read)
+            for pid in pids:
+                os.waitpid(pid, 0)
+
+    def test_worker_memory_stays_flat_as_workers_are_added(self):
+        ai_utils.prepare_for_fork()
+        model_mb = sum(p.numel() * p.element_size() for p in ai_utils.model.parameters()) / 1024 / 1024
+
+        one = max(self.run_workers(1))
+        four = max(self.run_workers(4))
+
+        # Weights stay shared: each worker only owns a fraction of the model size...
+        self.assertLess(four, model_mb / 2)
+        # ...and adding workers does not make any of them bigger
+        self.assertLess(four, one * 1.5 + 50)
+
+
+@unittest.skipUnless(ai_async.HTTPX_AVAILABLE, "httpx not installed")
+@override_settings(AI_TEXT_CACHE_VARIANTS=0, AI_TEXT_CACHE_SEEDED=True, AI_BACKEND_CONCURRENCY={'REMOTE': 2},
+                   USE_REMOTE_LLM=True, REMOTE_LLM_URL='http://llm.test')
+class AsyncGenerationTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.requests = []
+        patches = [
+            mock.patch.object(ai_async, 'get_ai_settings', return_value=None),
+            mock.patch.object(ai_async, 'resolve_backend', return_value='REMOTE'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def serve(self, body, delay=0.0):
+        """Answer every completion with `body`, through an httpx mock transport"""
+        import httpx
+
+        async def handler(request):
+            self.requests.append(request)
+            await asyncio.sleep(delay)
+            return httpx.Response(200, json=body)
+
+        async def client(backend):
+            return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        patch = mock.patch.object(ai_async, '_client', client)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_malformed_completion_falls_back_instead_of_raising(self):
+        self.serve({'choices': []})
+        text = asyncio.run(ai_async.agenerate_text("Un prompt", seed=1))
+        self.assertIn("(erreur", text)
+
+    def test_endpoint_comes_from_the_settings_of_the_call(self):
+        """A URL left in ai_utils by another user's request is not used."""
+        self.serve({'choices': [{'text': "Une cité oubliée sous la pluie"}]})
+        with mock.patch.object(ai_utils, 'REMOTE_LLM_URL', 'http://someone-else.test'):
+            asyncio.run(ai_async.agenerate_text("Un prompt", seed=1))
+        self.assertEqual(self.requests[0].url.host, 'llm.test')
+
+    def test_identical_concurrent_calls_share_one_backend_request(self):
+        self.serve({'choices': [{'text': "Une cité oubliée sous la pluie"}]}, delay=0.05)
+
+        async def generate():
+            return await asyncio.gather(*(ai_async.agenerate_text("Le même prompt", seed=7) for _ in range(5)))
+
+        texts = asyncio.run(generate())
+        self.assertEqual(len(set(texts)), 1)
+        self.assertEqual(len(self.requests), 1)
+
+
+@override_settings(AI_TEXT_CACHE_VARIANTS=0, AI_TEXT_CACHE_SEEDED=True, AI_BACKEND_CONCURRENCY={'REMOTE': 2})
+class TextCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.seeds = []
+        self.lock = threading.Lock()
+        patches = [
+            mock.patch.object(ai_utils, 'get_ai_settings', return_value=None),
+            mock.patch.object(ai_utils, 'resolve_backend', return_value='REMOTE'),
+            mock.patch.object(ai_utils, '_generate_text', side_effect=self.backend),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def backend(self, prompt, max_new_tokens, patience, user, user_settings, prefix=None, seed=None, stop=None):
+        """Slow stand-in for the backend, recording the seed of every call"""
+        with self.lock:
+            self.seeds.append(seed)
+        time.sleep(0.05)
+        return f"Une cité oubliée ({seed})"
+
+    def test_identical_concurrent_calls_share_one_backend_call(self):
+        barrier = threading.Barrier(6)
+        texts = []
+
+        def generate():
+            barrier.wait()
+            texts.append(ai_utils.generate_text("Le même prompt", seed=7))
+
+        threads = [threading.Thread(target=generate) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(texts), 6)
+        self.assertEqual(len(set(texts)), 1)
+        self.assertEqual(self.seeds, [7])
+
+    @override_settings(AI_TEXT_CACHE_VARIANTS=4)
+    def test_variants_keep_explicit_and_job_seeds(self):
+        ai_utils.generate_text("Un prompt", seed=1234)
+        self.assertEqual(self.seeds, [1234])
+
+        for _ in range(2):
+            cache.clear()
+            with metrics.generation_job("replay", log=False, seed=42):
+                ai_utils.generate_text("Un autre prompt", section='intro')
+        self.assertEqual(self.seeds[1], self.seeds[2])
+        self.assertIn(self.seeds[1], range(4))
+
+
+class FakePipeline:
+    """Text generation pipeline stand-in recording the prompts of each call"""
+
+    def __init__(self):
+        self.tokenizer = mock.Mock(pad_token=None, eos_token="</s>", pad_token_id=0)
+        self.calls = []
+
+    def __call__(self, prompts, **kwargs):
+        self.calls.append(prompts)
+        return [[{'generated_text': f" suite de {prompt}"}] for prompt in prompts]
+
+
+class BatchingGeneratorTests(SimpleTestCase):
+    def test_seeded_requests_are_generated_alone_after_seeding(self):
+        pipeline = FakePipeline()
+        batcher = model_server.BatchingGenerator(pipeline, max_batch_size=8, max_wait=0.2)
+        payloads = [{'prompt': f"p{i}"} for i in range(3)] + [{'prompt': "s1", 'seed': 5}, {'prompt': "s2", 'seed': 0}]
+        results = {}
+
+        def complete(payload):
+            results[payload['prompt']] = batcher.complete(payload)
+
+        with mock.patch.object(model_server, 'torch') as torch:
+            threads = [threading.Thread(target=complete, args=(payload,)) for payload in payloads]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results['s1'], " suite de s1")
+        self.assertEqual(sorted(map(sorted, pipeline.calls)), [['p0', 'p1', 'p2'], ['s1'], ['s2']])
+        self.assertEqual(sorted(call.args for call in torch.manual_seed.call_args_list), [(0,), (5,)])
+
+
+class PromptRegistryTests(SimpleTestCase):
+    def test_render_accepts_a_name_field(self):
+        prompt = prompts.render("location.description", ambiance="FANTASY", name="Crystal Caverns")
+        self.assertIn("Crystal Caverns", prompt)
+
+
+class FairSlotsTests(SimpleTestCase):
+    def test_limit_holds_across_threads_and_event_loops(self):
+        slots = FairSlots(2)
+        active, peak, lock = [0], [0], threading.Lock()
+
+        def enter():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+
+        def leave():
+            with lock:
+                active[0] -= 1
+
+        async def coroutine():
+            await slots.aacquire(None)
+            enter()
+            await asyncio.sleep(0.02)
+            leave()
+            slots.release()
+
+        def event_loop():
+            async def main():
+                await asyncio.gather(*(coroutine() for _ in range(4)))
+            asyncio.run(main())
+
+        def thread():
+            for _ in range(3):
+                slots.acquire(None)
+                enter()
+                time.sleep(0.02)
+                leave()
+                slots.release()
+
+        workers = [threading.Thread(target=event_loop) for _ in range(3)]
+        workers += [threading.Thread(target=thread) for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(peak[0], 2)
+        self.assertEqual((slots.active, slots.waiting), (0, []))
+
+    def test_cancelled_coroutine_leaves_the_queue(self):
+        slots = FairSlots(1)
+
+        async def main():
+            await slots.aacquire('a')
+            waiter = asyncio.ensure_future(slots.aacquire('b'))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            slots.release()
+
+        asyncio.run(main())
+        self.assertEqual((slots.active, slots.waiting, slots.async_waiters), (0, [], {}))
+
+    def test_light_user_is_served_ahead_of_a_heavy_users_backlog(self):
+        slots = FairSlots(1)
+        slots.acquire('holder')
+        served = []
+
+        def request(flow):
+            slots.acquire(flow)
+            served.append(flow)
+            slots.release()
+
+        threads = []
+        for flow in ['heavy'] * 5 + ['light']:
+            thread = threading.Thread(target=request, args=(flow,))
+            thread.start()
+            threads.append(thread)
+            # Queue the requests in a known order
+            while len(slots.waiting) < len(threads):
+                time.sleep(0.001)
+
+        slots.release()
+        for thread in threads:
+            thread.join()
+        # The light user waits for one heavy request at most, not for the whole backlog
+        self.assertEqual(served, ['heavy', 'light', 'heavy', 'heavy', 'heavy', 'heavy'])
+
+
+@override_settings(GENERATION_RATE_LIMIT_USER={'capacity': 2, 'per_hour': 3600}, GENERATION_RATE_LIMIT_BACKEND={})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="dave", password="secret-password")
+        self.client.force_login(self.user)
+        self.bucket = {f"user:{self.user.id}": settings.GENERATION_RATE_LIMIT_USER}
+
+    def test_bucket_denies_when_empty_and_refills_over_time(self):
+        now = time.time()
+        with mock.patch.object(ratelimit.time, 'time', return_value=now):
+            take_tokens(self.bucket)
+            take_tokens(self.bucket)
+            with self.assertRaises(RateLimited) as denied:
+                take_tokens(self.bucket)
+        self.assertEqual(denied.exception.retry_after, 1)
+
+        # One token per second at 3600 per hour
+        with mock.patch.object(ratelimit.time, 'time', return_value=now + 1):
+            take_tokens(self.bucket)
+            with self.assertRaises(RateLimited):
+                take_tokens(self.bucket)
+
+    def test_denied_take_consumes_no_bucket(self):
+        buckets = dict(self.bucket, empty={'capacity': 0, 'per_hour': 60})
+        with self.assertRaises(RateLimited) as denied:
+            take_tokens(buckets)
+        self.assertEqual(denied.exception.scope, 'empty')
+        take_tokens(self.bucket)
+        take_tokens(self.bucket)
+
+    def test_random_game_answers_429_with_retry_after(self):
+        take_tokens(self.bucket, cost=2)
+        response = self.client.post(reverse('random_game'))
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(int(response['Retry-After']), range(1, 3))
+        self.assertFalse(Game.objects.exists())
+
+    def test_regeneration_answers_429_json_with_retry_after(self):
+        game = create_game(self.user)
+        take_tokens(self.bucket, cost=2)
+        response = self.client.post(reverse('regenerate_game_section', args=[game.id, 'premise']))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['status'], 'error')
+        self.assertIn(int(response['Retry-After']), range(1, 3))
+
+    def test_test_generation_shares_the_generation_bucket(self):
+        take_tokens(self.bucket, cost=2)
+        with mock.patch('gameforge.views.check_model_status') as check_model_status:
+            response = self.client.post(reverse('ai_test_generation'))
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(int(response['Retry-After']), range(1, 3))
+        check_model_status.assert_not_called()
+
+
+@override_settings(AI_STUB_BACKEND=False, LOCAL_MODEL_SERVER_SOCKET=None, USE_REMOTE_LLM=True,
+                   REMOTE_LLM_URL='http://llm.test', HEALTH_PROBE_INTERVAL=30)
+class HealthTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patches = [
+            mock.patch.object(health, 'start_monitor'),
+            mock.patch.object(ai_utils, 'TRANSFORMERS_AVAILABLE', False),
+            # Global settings come from settings.py, whatever the last user request left in ai_utils
+            mock.patch.object(ai_utils, 'AISettings', None),
+            mock.patch.object(ai_utils, 'USE_REMOTE_LLM', False),
+            mock.patch.object(ai_utils, 'REMOTE_LLM_URL', 'http://someone-elses-lmstudio.test'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def probe(self, status_code):
+        with mock.patch.object(health.requests, 'get', return_value=mock.Mock(status_code=status_code)) as get:
+            health.probe_all()
+        return get
+
+    def test_liveness_answers_without_checking_anything(self):
+        with mock.patch.object(health, 'readiness') as readiness:
+            response = self.client.get(reverse('health_live'))
+        self.assertEqual(response.json(), {'status': 'ok'})
+        readiness.assert_not_called()
+
+    def test_monitor_probes_the_globally_configured_backend(self):
+        get = self.probe(200)
+        get.assert_called_once_with("http://llm.test/health", timeout=5)
+        self.assertTrue(health.backend_status()['REMOTE']['available'])
+
+    def test_readiness_ignores_backends_unless_required(self):
+        self.probe(500)
+        response = self.client.get(reverse('health_ready'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['checks'], {'database': True, 'cache': True, 'backends': {'REMOTE': False}})
+
+        with self.settings(HEALTH_REQUIRE_BACKEND=True):
+            self.assertEqual(self.client.get(reverse('health_ready')).status_code, 503)
+            self.probe(200)
+            self.assertEqual(self.client.get(reverse('health_ready')).status_code, 200)
+
+    def test_monitor_probes_once_per_interval_across_processes(self):
+        with mock.patch.object(health, 'probe_all') as probe_all, \
+                mock.patch.object(health.time, 'sleep', side_effect=[None, StopIteration]):
+            with self.assertRaises(StopIteration):
+                health._run_monitor()
+        # The second round finds the probing lock still held
+        probe_all.assert_called_once_with()
+
+
+class MediaTestCase(TestCase):
+    """Runs against an empty MEDIA_ROOT of its own"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media_root
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media_root)
+            for root, _, names in os.walk(self.media_root) for name in names
+        )
+
+
+class ImageStorageTests(MediaTestCase):
+    def test_names_are_sharded_by_content_hash(self):
+        sha256 = hashlib.sha256(b"image").hexdigest()
+        self.assertEqual(storage.image_name(b"image", "character_1_abc.png"),
+                         f"game_images/{sha256[:2]}/{sha256[2:4]}/{sha256}.png")
+
+    def test_identical_images_are_stored_once(self):
+        first = storage.save_image(b"same bytes", "a.jpg", background=False)
+        second = storage.save_image(b"same bytes", "b.jpg", background=False)
+        self.assertEqual(first, second)
+        self.assertEqual(self.stored_files(), [first])
+
+    def test_interrupted_write_leaves_neither_partial_file_nor_temp_file(self):
+        with mock.patch.object(storage.os, 'replace', side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                storage.save_image(b"image", "a.jpg", background=False)
+        self.assertEqual(self.stored_files(), [])
+
+        name = storage.save_image(b"image", "a.jpg", background=False)
+        self.assertEqual(self.stored_files(), [name])
+        with default_storage.open(name, 'rb') as f:
+            self.assertEqual(f.read(), b"image")
+
+    def test_failed_background_write_falls_back_to_a_placeholder(self):
+        with mock.patch.object(storage, '_write', side_effect=OSError("disk full")):
+            name = storage.save_image(b"image", "a.jpg", background=True)
+        path = ai_utils.ensure_image_written(name, "Un héros", 'CHARACTER')
+        self.assertNotEqual(path, name)
+        self.assertFalse(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(path))
+
+
+class GcMediaTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="carol", password="secret-password")
+
+    def store(self, data, age=7200):
+        """Store an image written `age` seconds ago"""
+        name = storage.save_image(data, "image.jpg", background=False)
+        written = time.time() - age
+        os.utime(default_storage.path(name), (written, written))
+        return name
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command('gc_media', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_deletes_nothing(self):
+        orphan = self.store(b"orphan")
+        output = self.gc('--dry-run')
+        self.assertIn(orphan, output)
+        self.assertTrue(default_storage.exists(orphan))
+
+    def test_recent_images_are_kept_until_the_grace_period_ends(self):
+        old = self.store(b"old orphan")
+        in_flight = self.store(b"image whose game is being saved", age=0)
+        self.gc()
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(in_flight))
+
+    def test_shared_image_is_kept_while_any_game_references_it(self):
+        shared = self.store(b"deduplicated image")
+        games = [create_game(self.user, title=title) for title in ("A", "B")]
+        for game in games:
+            GameImage.objects.create(game=game, image_type='CHARACTER', image=shared, prompt="...")
+
+        games[0].delete()
+        self.gc()
+        self.assertTrue(default_storage.exists(shared))
+
+        games[1].delete()
+        self.gc()
+        self.assertFalse(default_storage.exists(shared))
+
+    def test_image_reused_after_the_scan_is_not_deleted(self):
+        name = self.store(b"reused image")
+        self.assertEqual(list(storage.orphaned_images()), [name])
+        # A new game reuses the same content between the scan and the delete
+        GameImage.objects.create(game=create_game(self.user), image_type='LOCATION', image=name, prompt="...")
+        self.assertEqual(storage.delete_orphan(name), 0)
+        self.assertTrue(default_storage.exists(name))
+
+
+class StubBackendTestCase(MediaTestCase):
+    """Generates through the deterministic stub backends, without latency"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        settings_override = override_settings(AI_STUB_BACKEND=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patches = [
+            mock.patch.object(ai_utils, 'MODEL_LOADED', True),
+            mock.patch.object(ai_stubs, '_text_backend', ai_stubs.StubTextBackend(ttft=0, token_latency=0)),
+            mock.patch.object(ai_stubs, '_image_backend', ai_stubs.StubImageBackend(latency=0, size=64)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+
+class GameDetailCacheTests(StubBackendTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="erin", password="secret-password")
+        self.game = create_game(self.user, title="Cached Game", story_premise="Ancienne prémisse")
+        self.url = reverse('game_detail', args=[self.game.id])
+
+    def test_second_view_is_served_from_cache(self):
+        self.client.get(self.url)
+        # Only the modification date, which is part of the cache key
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertContains(response, "Cached Game")
+
+    def test_change_without_signals_is_not_served_stale(self):
+        self.client.get(self.url)
+        Game.objects.filter(pk=self.game.pk).update(title="Renamed Game", updated_at=timezone.now())
+        self.assertContains(self.client.get(self.url), "Renamed Game")
+
+    def game_updates(self, action):
+        with CaptureQueriesContext(connection) as queries:
+            action()
+        return [query['sql'] for query in queries if query['sql'].startswith('UPDATE "gameforge_game"')]
+
+    def test_replacing_content_touches_the_game_once(self):
+        content = build_game_content(self.game, images=False)
+        save_games_content([(self.game, content)])
+        self.game.refresh_from_db()
+        before = self.game.updated_at
+
+        # One save of the game, then one update for all of its deleted children
+        content = build_game_content(self.game, images=False)
+        updates = self.game_updates(lambda: save_games_content([(self.game, content)]))
+        self.assertEqual(len(updates), 2)
+        self.game.refresh_from_db()
+        self.assertGreater(self.game.updated_at, before)
+
+    def test_deleting_a_game_does_not_touch_it_per_child(self):
+        save_games_content([(self.game, build_game_content(self.game, images=False))])
+        self.assertEqual(self.game_updates(self.game.delete), [])
+
+    def test_edit_invalidates_the_cached_page(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.game.title = "Renamed Game"
+            self.game.save()
+        self.assertContains(self.client.get(self.url), "Renamed Game")
+
+    def test_regeneration_invalidates_the_cached_page(self):
+        self.assertContains(self.client.get(self.url), "Ancienne prémisse")
+        with self.captureOnCommitCallbacks(execute=True):
+            premise = regenerate_story_section(self.game, 'premise')
+        response = self.client.get(self.url)
+        self.assertNotContains(response, "Ancienne prémisse")
+        self.assertContains(response, escape(premise))
+
+    def test_favorite_state_is_not_cached(self):
+        self.client.force_login(self.user)
+        self.assertFalse(self.client.get(self.url).context['is_favorite'])
+        self.client.post(reverse('toggle_favorite', args=[self.game.id]))
+        self.assertTrue(self.client.get(self.url).context['is_favorite'])
+
+
+class CatalogRoundTripTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="heidi", password="secret-password")
+        export_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_dir, ignore_errors=True)
+        self.games_path = os.path.join(export_dir, "games.ndjson.gz")
+        self.images_path = os.path.join(export_dir, "images.tar")
+
+    def make_games(self):
+        # Both games use the same picture: it is stored and archived once
+        shared = storage.save_image(b"shared picture", "image.jpg", background=False)
+        for title, days in (("Old Game", 400), ("Recent Game", 3)):
+            game = create_game(self.user, title=title)
+            Game.objects.filter(id=game.id).update(created_at=timezone.now() - timedelta(days=days))
+            Character.objects.create(game=game, name="Aria", character_class="Mage", role="Protagonist",
+                                     background="...", gameplay="...")
+            GameImage.objects.create(game=game, image_type='CHARACTER', image=shared, prompt="...")
+        return {game.title: game.created_at for game in Game.objects.all()}
+
+    def run_import(self):
+        call_command('import_games', self.games_path, '--images', self.images_path, stdout=StringIO())
+
+    def test_export_then_import_restores_games_dates_and_images(self):
+        created = self.make_games()
+        call_command('export_games', self.games_path, '--images', self.images_path, stderr=StringIO())
+        with tarfile.open(self.images_path) as archive:
+            self.assertEqual(len(archive.getnames()), 1)
+
+        Game.objects.all().delete()
+        shutil.rmtree(os.path.join(self.media_root, storage.IMAGES_DIR))
+        self.run_import()
+
+        self.assertEqual({game.title: game.created_at for game in Game.objects.all()}, created)
+        self.assertEqual(Character.objects.count(), 2)
+        self.assertEqual(len(self.stored_files()), 1)
+        for image in GameImage.objects.all():
+            self.assertTrue(default_storage.exists(image.image.name))
+
+    def test_reimport_skips_existing_games(self):
+        self.make_games()
+        call_command('export_games', self.games_path, '--images', self.images_path, stderr=StringIO())
+
+        self.run_import()
+        self.assertEqual(Game.objects.count(), 2)
+        self.assertEqual(Character.objects.count(), 2)
+
+        call_command('import_games', self.games_path, '--allow-duplicates', stdout=StringIO())
+        self.assertEqual(Game.objects.count(), 4)
+
+    def test_images_not_matching_their_hash_are_rejected(self):
+        good, tampered = b"a genuine picture", b"a swapped picture"
+        members = {
+            f"images/{hashlib.sha256(good).hexdigest()}.jpg": good,
+            f"images/{hashlib.sha256(b'the original').hexdigest()}.jpg": tampered,
+            "images/not-a-hash.jpg": good,
+        }
+        with tarfile.open(self.images_path, 'w') as archive:
+            for name, data in members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, BytesIO(data))
+        games_path = os.path.join(os.path.dirname(self.images_path), "empty.ndjson")
+        open(games_path, 'w').close()
+
+        stderr = StringIO()
+        call_command('import_games', games_path, '--images', self.images_path, stdout=StringIO(), stderr=stderr)
+        self.assertEqual([default_storage.open(name).read() for name in self.stored_files()], [good])
+        self.assertIn("2 image(s) rejetées", stderr.getvalue())
+
+
+class RegenerationTests(StubBackendTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="ivan", password="secret-password")
+        self.game = create_game(self.user)
+        generate_game_content(self.game)
+
+    def counts(self):
+        return [model.objects.filter(game=self.game).count()
+                for model in (Character, Location, GameImage, GenerationRecord)]
+
+    def story(self):
+        game = Game.objects.get(id=self.game.id)
+        return {section: getattr(game, f"story_{section}") for section in STORY_SECTIONS}
+
+    def test_regenerating_a_game_replaces_its_content(self):
+        counts = self.counts()
+        self.assertEqual(counts[:3], [2, 2, 2])
+        generate_game_content(self.game)
+        self.assertEqual(self.counts(), counts)
+
+    def test_section_regeneration_only_touches_that_section(self):
+        before, counts = self.story(), self.counts()
+        text = regenerate_story_section(self.game, 'act2')
+
+        after = self.story()
+        self.assertEqual(after['act2'], text)
+        self.assertEqual({k: v for k, v in after.items() if k != 'act2'},
+                         {k: v for k, v in before.items() if k != 'act2'})
+        # One model call, recorded next to the original generation
+        self.assertEqual(self.counts(), counts[:3] + [counts[3] + 1])
+        self.assertEqual(GenerationRecord.objects.filter(game=self.game, section='story:act2').count(), 2)
+
+    def test_character_regeneration_keeps_its_role(self):
+        character = Character.objects.filter(game=self.game).first()
+        counts = self.counts()
+        regenerated = regenerate_character(character)
+        self.assertEqual(Character.objects.get(id=character.id).role, regenerated.role)
+        self.assertEqual(self.counts()[:3], counts[:3])
+
+    def test_section_endpoint_answers_with_the_new_text(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('regenerate_game_section', args=[self.game.id, 'twist']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['result']['text'], self.story()['twist'])
+
+
+class TokenBudgetTests(StubBackendTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="judy", password="secret-password")
+        self.game = create_game(self.user)
+
+    def use_backend(self, backend):
+        patch = mock.patch.object(ai_stubs, '_text_backend', backend)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    @override_settings(GENERATION_TOKEN_BUDGET=0)
+    def test_each_section_stays_within_its_budget(self):
+        # A backend that always writes far more than any section asks for
+        self.use_backend(ai_stubs.StubTextBackend(ttft=0, token_latency=0, min_tokens=500, max_tokens=500))
+        content = build_game_content(self.game, images=False)
+
+        records = {record['section']: record for record in content['provenance']}
+        for section, params in STORY_SECTION_PARAMS.items():
+            self.assertEqual(records[f"story:{section}"]['params']['max_new_tokens'], params['max_new_tokens'])
+            self.assertLessEqual(len(content['story'][section].split()), params['max_new_tokens'])
+
+    def test_output_is_cut_at_the_first_stop_sequence(self):
+        self.use_backend(mock.Mock(complete=mock.Mock(
+            return_value="Un titre court\nUne seconde ligne\n\nUn autre paragraphe.")))
+        self.assertEqual(ai_utils.generate_text("Titre", seed=1, stop=LINE_STOP), "Un titre court")
+        self.assertEqual(ai_utils.generate_text("Histoire", seed=1, stop=PARAGRAPH_STOP),
+                         "Un titre court\nUne seconde ligne")
+
+    @override_settings(GENERATION_TOKEN_BUDGET=150)
+    def test_game_budget_caps_the_tokens_spent(self):
+        self.use_backend(ai_stubs.StubTextBackend(ttft=0, token_latency=0, min_tokens=80, max_tokens=80))
+        content = build_game_content(self.game, images=False)
+
+        self.assertLessEqual(content['metrics']['spent'], 150)
+        # Once the budget is spent, the remaining sections fall back without calling the backend
+        self.assertTrue(content['story']['twist'].endswith("(budget de tokens épuisé)"))
+
+        # The measured usage is stored with the game
+        save_games_content([(self.game, content)])
+        stored = GenerationRecord.objects.filter(game=self.game)
+        self.assertEqual(sum(record.prompt_tokens + record.completion_tokens for record in stored),
+                         content['metrics']['spent'])
+
+    @override_settings(GENERATION_TOKEN_BUDGET=300)
+    def test_parallel_sections_cannot_overshoot_the_budget(self):
+        """Sections generated concurrently reserve their tokens before calling the backend."""
+        self.use_backend(ai_stubs.StubTextBackend(ttft=0.02, token_latency=0, min_tokens=80, max_tokens=80))
+        content = asyncio.run(abuild_game_content(self.game, images=False))
+        self.assertLessEqual(content['metrics']['spent'], 300)
+        self.assertEqual(content['metrics']['reserved'], 0)
+
+    @override_settings(GENERATION_TOKEN_BUDGET=0)
+    def test_parallel_build_uses_the_sequential_seeds(self):
+        """Repeated sections get their seed from their position, not from completion order."""
+        def seeds(content):
+            return {record['section']: record['seed'] for record in content['provenance']}
+
+        self.use_backend(ai_stubs.StubTextBackend(ttft=0.01, token_latency=0))
+        sequential = build_game_content(self.game, seed=42, images=False)
+        parallel = asyncio.run(abuild_game_content(self.game, seed=42, images=False))
+        self.assertIn('location:name#2', seeds(parallel))
+        self.assertEqual(seeds(parallel), seeds(sequential))
+
+
+class GenerationMetricsTests(StubBackendTestCase):
+    def test_ttft_is_measured_before_the_end_of_the_call(self):
+        """The stub reports its first token, so TTFT is not the total latency."""
+        backend = ai_stubs.StubTextBackend(ttft=0.01, token_latency=0.005, min_tokens=20, max_tokens=20)
+        with mock.patch.object(ai_stubs, '_text_backend', backend), \
+                mock.patch.object(metrics, '_record', wraps=metrics._record) as record:
+            ai_utils.generate_text("Un prompt", seed=1)
+        call = record.call_args.args[0]
+        self.assertIsNotNone(call.ttft)
+        self.assertLess(call.ttft, call.latency - 0.05)
+
+    def test_calls_without_a_first_token_leave_ttft_unobserved(self):
+        with metrics.track_call('REMOTE', 'test-model', 3) as call:
+            pass
+        self.assertIsNone(call.ttft)
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_metrics_are_restricted_to_staff_and_the_scraper_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-me').status_code, 200)
+
+        staff = User.objects.create_user(username="ken", password="secret-password", is_staff=True)
+        self.client.force_login(staff)
+        self.assertIn('gameforge_', self.client.get(url).content.decode())
+
+
+class GenerateGamesCommandTests(StubBackendTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="mallory", password="secret-password")
+        self.checkpoint = os.path.join(self.media_root, "checkpoint.json")
+
+    def generate(self, *extra):
+        stdout = StringIO()
+        call_command('generate_games', '--count', '5', '--workers', '2', '--batch-size', '2', '--user', 'mallory',
+                     '--checkpoint', self.checkpoint, *extra, stdout=stdout, stderr=StringIO())
+        return stdout.getvalue()
+
+    def test_resume_skips_the_games_already_generated(self):
+        saved = []
+
+        def save_then_interrupt(items, random=False):
+            # The second batch is lost, as if the process were killed while writing it
+            if saved:
+                raise KeyboardInterrupt
+            saved.append(len(items))
+            return save_games_content(items, random=random)
+
+        with mock.patch.object(generate_games, 'save_games_content', side_effect=save_then_interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.generate()
+        self.assertEqual(Game.objects.count(), 2)
+
+        output = self.generate('--resume')
+        self.assertIn("Génération de 3 jeu(x)", output)
+        self.assertIn("jeux/min", output)
+        self.assertIn("tokens/s", output)
+        self.assertEqual(Game.objects.count(), 5)
+        with open(self.checkpoint) as f:
+            checkpoint = json.load(f)
+        self.assertEqual(checkpoint['completed'], 5)
+        self.assertEqual(sorted(checkpoint['game_ids']), sorted(Game.objects.values_list('id', flat=True)))
+
+        self.assertIn("Rien à faire", self.generate('--resume'))
+        self.assertEqual(Game.objects.count(), 5)
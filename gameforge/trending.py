@@ -0,0 +1,101 @@
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .models import Game, Favorite, GameTrend
+
+TRENDING_CACHE_KEY = "gameforge:trending"
+
+# Au-delà de ce score, un jeu n'a plus de poids dans le classement
+MIN_SCORE = 0.01
+
+
+def decay_rate():
+    """Taux de décroissance exponentielle (par seconde) des favoris."""
+    return math.log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def _favorite_weights(since, now):
+    """Somme par jeu des poids des favoris créés après `since`."""
+    rate = decay_rate()
+    weights = defaultdict(float)
+    favorites = Favorite.objects.filter(created_at__lte=now)
+    if since is not None:
+        favorites = favorites.filter(created_at__gt=since)
+    for game_id, created_at in favorites.values_list('game_id', 'created_at').iterator(chunk_size=2000):
+        weights[game_id] += math.exp(-rate * (now - created_at).total_seconds())
+    return weights
+
+
+def refresh_trending(full=False):
+    """
+    Met à jour le classement des jeux tendance.
+
+    En mode incrémental, les scores existants sont atténués d'un seul UPDATE
+    puis seuls les favoris créés depuis le dernier rafraîchissement sont
+    ajoutés. Le mode complet reconstruit la table, ce qui prend aussi en
+    compte les favoris retirés.
+
+    Args:
+        full (bool, optional): Reconstruire entièrement le classement
+
+    Returns:
+        int: Nombre de jeux présents dans le classement
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        last_refresh = None if full else GameTrend.objects.aggregate(last=Max('refreshed_at'))['last']
+
+        if last_refresh is None:
+            # Les favoris plus anciens que 20 demi-vies ont un poids négligeable
+            horizon = now - timedelta(hours=20 * settings.TRENDING_HALF_LIFE_HOURS)
+            GameTrend.objects.all().delete()
+            weights = _favorite_weights(horizon, now)
+            existing = {}
+        else:
+            factor = math.exp(-decay_rate() * (now - last_refresh).total_seconds())
+            GameTrend.objects.update(score=F('score') * factor, refreshed_at=now)
+            weights = _favorite_weights(last_refresh, now)
+            existing = GameTrend.objects.in_bulk(list(weights))
+
+        to_create = []
+        for game_id, weight in weights.items():
+            if game_id in existing:
+                existing[game_id].score += weight
+            else:
+                to_create.append(GameTrend(game_id=game_id, score=weight, refreshed_at=now))
+
+        GameTrend.objects.bulk_update(existing.values(), ['score'], batch_size=500)
+        GameTrend.objects.bulk_create(to_create, batch_size=500)
+        GameTrend.objects.filter(score__lt=MIN_SCORE).delete()
+
+    cache.delete(TRENDING_CACHE_KEY)
+    return GameTrend.objects.count()
+
+
+def get_trending_games():
+    """
+    Retourne les jeux publics tendance, dans l'ordre du classement.
+
+    Le classement (identifiants et scores) est mis en cache jusqu'au prochain
+    rafraîchissement, il ne coûte donc qu'une lecture de cache et deux requêtes
+    (les jeux, puis la première image de chacun).
+    """
+    ranking = cache.get(TRENDING_CACHE_KEY)
+    if ranking is None:
+        ranking = list(
+            GameTrend.objects.filter(game__is_public=True)
+            .order_by('-score')
+            .values_list('game_id', 'score')[:settings.TRENDING_SIZE]
+        )
+        cache.set(TRENDING_CACHE_KEY, ranking, settings.TRENDING_CACHE_TIMEOUT)
+
+    games = Game.objects.for_listing().in_bulk([game_id for game_id, _ in ranking])
+    return [games[game_id] for game_id, _ in ranking if game_id in games]
@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import views, api
 
 urlpatterns = [
     # Authentication URLs
@@ -15,12 +15,36 @@ urlpatterns = [
     path('game/create/', views.create_game, name='create_game'),
     path('game/<int:game_id>/edit/', views.edit_game, name='edit_game'),
     path('game/<int:game_id>/delete/', views.delete_game, name='delete_game'),
+    path('game/<int:game_id>/regenerate/<str:section>/', views.regenerate_game_section, name='regenerate_game_section'),
+    path('game/<int:game_id>/characters/<int:character_id>/regenerate/', views.regenerate_game_character,
+         name='regenerate_game_character'),
+    path('game/<int:game_id>/locations/<int:location_id>/regenerate/', views.regenerate_game_location,
+         name='regenerate_game_location'),
+    path('game/<int:game_id>/images/<int:image_id>/regenerate/', views.regenerate_game_image,
+         name='regenerate_game_image'),
 
     path('favorites/', views.favorites, name='favorites'),
+    path('trending/', views.trending, name='trending'),
     path('game/<int:game_id>/toggle-favorite/', views.toggle_favorite, name='toggle_favorite'),
 
     path('random-game/', views.random_game, name='random_game'),
 
     # AI Settings URL
     path('ai-settings/', views.ai_settings, name='ai_settings'),
+    path('ai-settings/test/', views.ai_test_generation, name='ai_test_generation'),
+
+    # Monitoring
+    path('metrics', views.metrics, name='metrics'),
+    path('health/live/', views.health_live, name='health_live'),
+    path('health/ready/', views.health_ready, name='health_ready'),
+
+    # JSON API
+    path('api/v1/games/', api.game_list, name='api_game_list'),
+    path('api/v1/games/<int:game_id>/', api.game_detail, name='api_game_detail'),
+    path('api/v1/games/<int:game_id>/characters/', api.game_characters, name='api_game_characters'),
+    path('api/v1/games/<int:game_id>/locations/', api.game_locations, name='api_game_locations'),
+    path('api/v1/games/<int:game_id>/images/', api.game_images, name='api_game_images'),
+    path('api/v1/favorites/', api.favorite_list, name='api_favorite_list'),
+    path('api/v1/games/<int:game_id>/favorite/', api.favorite, name='api_favorite'),
+    path('api/v1/favorites/batch/', api.favorites_batch, name='api_favorites_batch'),
 ]
@@ -1,16 +1,31 @@
-import uuid
+import hmac
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth import logout
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
-from django.http import JsonResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.views.decorators.http import require_POST
 
-from .ai_utils import generate_story, generate_characters, generate_locations, generate_placeholder_image, check_model_status
-from .models import Game, Character, Location, GameImage, Favorite, UserAISettings
+from .ai_utils import check_model_status, get_ai_settings, resolve_backend
+from .models import Game, Character, Location, GameImage, Favorite, UserAISettings, GAME_LISTING_FIELDS, card_image_prefetch
 from .forms import GameForm, UserAISettingsForm
+from . import health, metrics as generation_metrics
+from .cache_utils import game_detail_cache_key
+from .api import serialize_character, serialize_location, serialize_image
+from .generation import (
+    abuild_game_content, save_games_content, aregenerate_story_section, aregenerate_character, aregenerate_location,
+    regenerate_image, RegenerationUnavailable, STORY_SECTIONS,
+)
+from .favorites import toggle_favorite as toggle_user_favorite
+from .trending import get_trending_games
+from .ratelimit import RateLimited, check_generation_rate
 
 from dotenv import load_dotenv
 
@@ -20,7 +35,7 @@ load_dotenv()
 # Create your views here.
 def home(request):
     """Home page view showing all public games"""
-    games = Game.objects.filter(is_public=True).exclude(is_public=0).order_by('-created_at')
+    games = Game.objects.filter(is_public=True).exclude(is_public=0).for_listing().order_by('-created_at')
     return render(request, 'gameforge/home.html', {'games': games})
 
 def register(request):
@@ -39,54 +54,104 @@ def register(request):
 @login_required
 def dashboard(request):
     """Dashboard view showing all games created by the current user"""
-    games = Game.objects.filter(creator=request.user).order_by('-created_at')
+    games = Game.objects.filter(creator=request.user).for_listing().order_by('-created_at')
     return render(request, 'gameforge/dashboard.html', {'games': games})
 
 def game_detail(request, game_id):
     """Game detail view showing all information about a specific game"""
-    game = get_object_or_404(Game, id=game_id)
+    # The public body of the page is cached under the game's last modification date
+    updated_at = Game.objects.filter(id=game_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        raise Http404("No Game matches the given query.")
+    cache_key = game_detail_cache_key(game_id, updated_at)
+    page = cache.get(cache_key)
+    is_favorite = None
+    if page is None:
+        game = get_object_or_404(Game.objects.with_detail(request.user), id=game_id)
+        is_favorite = game.is_favorite
+        page = {
+            'id': game.id,
+            'title': game.title,
+            'creator_id': game.creator_id,
+            'creator_username': game.creator.username,
+            'created_at': game.created_at,
+            'updated_at': game.updated_at,
+            'is_public': game.is_public,
+            'body': render_to_string('gameforge/game_detail_body.html', {
+                'game': game,
+                'characters': game.characters.all(),
+                'locations': game.locations.all(),
+                'images': game.images.all(),
+            }),
+        }
+        cache.set(cache_key, page, settings.GAME_DETAIL_CACHE_TIMEOUT)
 
     # Check if the game is private and the user is not the creator
-    if not game.is_public and (not request.user.is_authenticated or request.user != game.creator):
+    if not page['is_public'] and (not request.user.is_authenticated or request.user.id != page['creator_id']):
         messages.error(request, "Vous n'avez pas la permission de voir ce jeu.")
         return redirect('home')
 
-    # Check if the game is in the user's favorites
-    is_favorite = False
-    if request.user.is_authenticated:
-        is_favorite = Favorite.objects.filter(user=request.user, game=game).exists()
-
-    characters = game.characters.all()
-    locations = game.locations.all()
-    images = game.images.all()
+    # Check if the game is in the user's favorites (per-user, never cached)
+    if is_favorite is None:
+        is_favorite = (request.user.is_authenticated
+                       and Favorite.objects.filter(user=request.user, game_id=game_id).exists())
 
     return render(request, 'gameforge/game_detail.html', {
-        'game': game,
-        'characters': characters,
-        'locations': locations,
-        'images': images,
+        'game': page,
+        'game_body': mark_safe(page['body']),
         'is_favorite': is_favorite
     })
 
+def _rate_limited(request, error, template, context=None):
+    """Render the form again with a 429 status and a Retry-After header"""
+    messages.error(request, f"Trop de générations en cours, réessayez dans {error.retry_after} secondes.")
+    response = render(request, template, context or {}, status=429)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+def _json_rate_limited(error):
+    """JSON 429 answer with a Retry-After header, for the AJAX views"""
+    response = JsonResponse({'status': 'error', 'message': str(error)}, status=429)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+def _check_generation_rate(user):
+    check_generation_rate(user, resolve_backend(user, get_ai_settings(user)))
+
+def _save_generated_game(request, game, content, message, random=False):
+    """Store the generated content and flash the success message"""
+    save_games_content([(game, content)], random=random)
+    messages.success(request, message.format(title=game.title))
+
+def _start_game_creation(request):
+    """Validate the form and save the game, or return the response to send instead"""
+    form = GameForm(request.POST)
+    if not form.is_valid():
+        return None, render(request, 'gameforge/create_game.html', {'form': form})
+    try:
+        _check_generation_rate(request.user)
+    except RateLimited as e:
+        return None, _rate_limited(request, e, 'gameforge/create_game.html', {'form': form})
+
+    game = form.save(commit=False)
+    game.creator = request.user
+    game.save()
+    return game, None
+
 @login_required
-def create_game(request):
+async def create_game(request):
     """View for creating a new game"""
-    if request.method == 'POST':
-        form = GameForm(request.POST)
-        if form.is_valid():
-            game = form.save(commit=False)
-            game.creator = request.user
-            game.save()
-
-            # Generate game content using AI
-            generate_game_content(game)
+    if request.method != 'POST':
+        return await sync_to_async(render)(request, 'gameforge/create_game.html', {'form': GameForm()})
 
-            messages.success(request, f'Jeu "{game.title}" créé avec succès!')
-            return redirect('game_detail', game_id=game.id)
-    else:
-        form = GameForm()
+    game, response = await sync_to_async(_start_game_creation)(request)
+    if response is not None:
+        return response
 
-    return render(request, 'gameforge/create_game.html', {'form': form})
+    # Generate game content using AI, without holding a thread while the backends answer
+    content = await abuild_game_content(game)
+    await sync_to_async(_save_generated_game)(request, game, content, 'Jeu "{title}" créé avec succès!')
+    return redirect('game_detail', game_id=game.id)
 
 @login_required
 def edit_game(request, game_id):
@@ -129,7 +194,10 @@ def delete_game(request, game_id):
 @login_required
 def favorites(request):
     """View for showing all games favorited by the current user"""
-    favorites = Favorite.objects.filter(user=request.user).select_related('game').order_by('-created_at')
+    favorites = (Favorite.objects.filter(user=request.user).select_related('game__creator')
+                 .only(*(f'game__{field}' for field in GAME_LISTING_FIELDS), 'created_at')
+                 .prefetch_related(card_image_prefetch('game__images'))
+                 .order_by('-created_at'))
     return render(request, 'gameforge/favorites.html', {'favorites': favorites})
 
 @login_required
@@ -142,132 +210,98 @@ def toggle_favorite(request, game_id):
     if not game.is_public and request.user != game.creator:
         return JsonResponse({'status': 'error', 'message': "Vous n'avez pas la permission d'ajouter ce jeu aux favoris."})
 
-    favorite, created = Favorite.objects.get_or_create(user=request.user, game=game)
+    is_favorite = toggle_user_favorite(request.user, game.id)
+    return JsonResponse({'status': 'success', 'is_favorite': is_favorite})
+
+async def _regenerate(request, regenerate, serialize):
+    """Run one regeneration for the game's creator and answer JSON"""
+    try:
+        await sync_to_async(_check_generation_rate)(await request.auser())
+    except RateLimited as e:
+        return _json_rate_limited(e)
+
+    try:
+        result = await regenerate()
+    except RegenerationUnavailable:
+        return JsonResponse({'status': 'error', 'message': "Aucun service d'IA disponible."}, status=503)
+    return JsonResponse({'status': 'success', 'result': serialize(result)})
+
+@login_required
+@require_POST
+async def regenerate_game_section(request, game_id, section):
+    """AJAX view regenerating one section of a game's story"""
+    game = await aget_object_or_404(Game.objects.select_related('creator'), id=game_id, creator=await request.auser())
+    if section not in STORY_SECTIONS:
+        return JsonResponse({'status': 'error', 'message': 'Section inconnue.'}, status=404)
+    return await _regenerate(request, lambda: aregenerate_story_section(game, section),
+                             lambda text: {'section': section, 'text': text})
+
+@login_required
+@require_POST
+async def regenerate_game_character(request, game_id, character_id):
+    """AJAX view regenerating one character of a game"""
+    character = await aget_object_or_404(Character.objects.select_related('game__creator'),
+                                         id=character_id, game_id=game_id, game__creator=await request.auser())
+    return await _regenerate(request, lambda: aregenerate_character(character), serialize_character)
 
-    if not created:
-        # If the favorite already existed, delete it
-        favorite.delete()
-        return JsonResponse({'status': 'success', 'is_favorite': False})
+@login_required
+@require_POST
+async def regenerate_game_location(request, game_id, location_id):
+    """AJAX view regenerating one location of a game"""
+    location = await aget_object_or_404(Location.objects.select_related('game__creator'),
+                                        id=location_id, game_id=game_id, game__creator=await request.auser())
+    return await _regenerate(request, lambda: aregenerate_location(location), serialize_location)
 
-    return JsonResponse({'status': 'success', 'is_favorite': True})
+@login_required
+@require_POST
+async def regenerate_game_image(request, game_id, image_id):
+    """AJAX view regenerating one image of a game"""
+    image = await aget_object_or_404(GameImage.objects.select_related('game__creator'),
+                                     id=image_id, game_id=game_id, game__creator=await request.auser())
+    return await _regenerate(request, lambda: sync_to_async(regenerate_image, thread_sensitive=False)(image),
+                             serialize_image)
+
+def trending(request):
+    """View showing public games ranked by recent favorites"""
+    return render(request, 'gameforge/trending.html', {'games': get_trending_games()})
+
+def _start_random_game(request):
+    """Create the placeholder random game, or return the response to send instead"""
+    try:
+        _check_generation_rate(request.user)
+    except RateLimited as e:
+        return None, _rate_limited(request, e, 'gameforge/random_game.html')
+
+    # Create a new game with random parameters
+    return Game.objects.create(
+        title="Random Game",
+        creator=request.user,
+        genre=Game.GENRE_CHOICES[0][0],  # Default to first genre
+        ambiance=Game.AMBIANCE_CHOICES[0][0],  # Default to first ambiance
+        keywords="random, generated",
+        story_premise="To be generated...",
+        story_act1="To be generated...",
+        story_act2="To be generated...",
+        story_act3="To be generated...",
+        story_twist="To be generated..."
+    ), None
 
 @login_required
-def random_game(request):
+async def random_game(request):
     """View for generating a random game"""
-    if request.method == 'POST':
-        # Create a new game with random parameters
-        game = Game.objects.create(
-            title="Random Game",
-            creator=request.user,
-            genre=Game.GENRE_CHOICES[0][0],  # Default to first genre
-            ambiance=Game.AMBIANCE_CHOICES[0][0],  # Default to first ambiance
-            keywords="random, generated",
-            story_premise="To be generated...",
-            story_act1="To be generated...",
-            story_act2="To be generated...",
-            story_act3="To be generated...",
-            story_twist="To be generated..."
-        )
-
-        # Generate game content using AI
-        generate_game_content(game, random=True)
-
-        messages.success(request, f'Jeu aléatoire "{game.title}" créé avec succès!')
-        return redirect('game_detail', game_id=game.id)
+    if request.method != 'POST':
+        return await sync_to_async(render)(request, 'gameforge/random_game.html')
 
-    return render(request, 'gameforge/random_game.html')
-
-
-def generate_game_content(game, random=False):
-    """Helper function to generate game content using AI"""
-    # Utiliser les fonctions AI pour générer du contenu
-
-    # Get the user from the game
-    user = game.creator
-
-    # Générer l'histoire avec l'IA
-    story = generate_story(
-        title=game.title,
-        genre=game.genre,
-        ambiance=game.ambiance,
-        keywords=game.keywords,
-        refs=game.references,
-        random_mode=random,
-        user=user
-    )
-
-    # Mettre à jour les champs du jeu avec l'histoire générée
-    game.title = story["title"] if random else game.title
-    game.story_premise = story["premise"]
-    game.story_act1 = story["act1"]
-    game.story_act2 = story["act2"]
-    game.story_act3 = story["act3"]
-    game.story_twist = story["twist"]
-    game.save()
+    game, response = await sync_to_async(_start_random_game)(request)
+    if response is not None:
+        return response
+
+    # Generate game content using AI
+    content = await abuild_game_content(game, random=True)
+    await sync_to_async(_save_generated_game)(request, game, content, 'Jeu aléatoire "{title}" créé avec succès!',
+                                              random=True)
+    return redirect('game_detail', game_id=game.id)
 
-    # Générer des personnages avec l'IA (2 par défaut: un protagoniste et un antagoniste)
-    characters = generate_characters(game_genre=game.genre, count=2, user=user)
-
-    # Créer les objets Character dans la base de données
-    for char_data in characters:
-        Character.objects.create(
-            game=game,
-            name=char_data["name"],
-            character_class=char_data["character_class"],
-            role=char_data["role"],
-            background=char_data["background"],
-            gameplay=char_data["gameplay"]
-        )
-
-    # Générer des lieux avec l'IA
-    locations = generate_locations(game_ambiance=game.ambiance, count=2, user=user)
-
-    # Créer les objets Location dans la base de données
-    for loc_data in locations:
-        Location.objects.create(
-            game=game,
-            name=loc_data["name"],
-            description=loc_data["description"]
-        )
-
-    # Générer des images placeholder pour les personnages et les lieux
-    # (dans un déploiement réel, vous appelleriez une API de génération d'images)
-
-    # Image pour le protagoniste
-    char_prompt = f"Un héros de type {game.genre} dans un univers {game.ambiance}"
-    char_filename = f"character_{game.id}_{uuid.uuid4().hex}.jpg"
-    char_image_path = generate_placeholder_image(
-        prompt=char_prompt,
-        image_type="CHARACTER",
-        filename=char_filename,
-        user=user
-    )
-
-    # Créer l'objet GameImage pour le personnage
-    GameImage.objects.create(
-        game=game,
-        image_type="CHARACTER",
-        prompt=char_prompt,
-        image=char_image_path
-    )
-
-    # Image pour un lieu
-    loc_prompt = f"Un lieu d'ambiance {game.ambiance} pour une aventure de type {game.genre}"
-    loc_filename = f"location_{game.id}_{uuid.uuid4().hex}.jpg"
-    loc_image_path = generate_placeholder_image(
-        prompt=loc_prompt,
-        image_type="LOCATION",
-        filename=loc_filename,
-        user=user
-    )
-
-    # Créer l'objet GameImage pour le lieu
-    GameImage.objects.create(
-        game=game,
-        image_type="LOCATION",
-        prompt=loc_prompt,
-        image=loc_image_path
-    )
 
 @login_required
 def ai_settings(request):
@@ -275,8 +309,9 @@ def ai_settings(request):
     # Get or create user AI settings
     user_settings, created = UserAISettings.objects.get_or_create(user=request.user)
 
-    # Check AI model status
-    model_status = check_model_status()
+    # État du modèle sans génération de test, et dernières sondes des backends
+    model_status = check_model_status(run_test=False)
+    model_status['backends'] = health.backend_status()
 
     if request.method == 'POST':
         form = UserAISettingsForm(request.POST, instance=user_settings)
@@ -293,6 +328,39 @@ def ai_settings(request):
         'user_settings': user_settings
     })
 
+@login_required
+@require_POST
+def ai_test_generation(request):
+    """AJAX view running a real test generation, counted like a game generation"""
+    try:
+        _check_generation_rate(request.user)
+    except RateLimited as e:
+        return _json_rate_limited(e)
+    return JsonResponse(check_model_status(run_test=True))
+
+def health_live(request):
+    """Liveness probe: the process answers requests"""
+    return JsonResponse({'status': 'ok'})
+
+def health_ready(request):
+    """Readiness probe for load balancers, served from cached backend probes"""
+    ready, checks = health.readiness()
+    return JsonResponse({'status': 'ok' if ready else 'unavailable', 'checks': checks}, status=200 if ready else 503)
+
+def _is_metrics_scraper(request):
+    """Staff members, or a scraper presenting METRICS_TOKEN as a bearer token"""
+    if request.user.is_staff:
+        return True
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+
+def metrics(request):
+    """Prometheus endpoint exposing the generation metrics of this process, to operators only"""
+    if not _is_metrics_scraper(request):
+        return HttpResponseForbidden()
+    return HttpResponse(generation_metrics.render_prometheus(), content_type='text/plain; version=0.0.4')
+
 def logout_view(request):
     logout(request)
     return redirect('login')
@@ -0,0 +1,68 @@
+"""
+Configuration gunicorn pour le déploiement « charger puis forker ».
+
+Le modèle local est chargé une seule fois dans le processus maître avant la
+création des workers: grâce au copy-on-write de fork(), tous les workers
+partagent les mêmes pages de poids au lieu d'en garder chacun une copie.
+
+    gunicorn -c gunicorn.conf.py NinjaGame.wsgi
+
+Le maître charge le modèle entièrement en mémoire (from_pretrained en FLOAT32,
+torch.load du modèle quantifié en INT8, ONNX Runtime en ONNX): les poids ne
+sont pas lus par mmap. ai_utils.prepare_for_fork() passe le modèle en mode
+inférence et gèle le ramasse-miettes, sans recopier les poids: le partage
+repose sur le seul copy-on-write et tient tant que les workers n'écrivent pas
+dans ces pages. Alternative sans fork: le serveur de modèle partagé
+(manage.py run_model_server).
+
+Avec un backend HTTP (LLM distant, LM Studio, serveur de modèle local), les
+vues de génération sont asynchrones: sous ASGI, un worker garde des centaines
+d'appels en cours sans un thread par requête (manage.py bench_async_concurrency).
+
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker NinjaGame.asgi:application
+
+Variables d'environnement:
+    GUNICORN_WORKERS             nombre de workers (2 par défaut)
+    GUNICORN_PRELOAD             "False" pour revenir à un chargement par worker
+    TORCH_THREADS_PER_WORKER     threads torch par worker (cœurs / workers par défaut)
+"""
+import os
+import random
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True').lower() == 'true'
+
+# Sans limite, chaque worker utiliserait tous les cœurs et ils se gêneraient
+torch_threads = int(os.environ.get('TORCH_THREADS_PER_WORKER', '0')) or max(1, (os.cpu_count() or 1) // workers)
+
+
+def when_ready(server):
+    """Dans le maître, après le chargement de l'application et avant le premier fork."""
+    if not preload_app:
+        return
+
+    # L'application Django est chargée, mais ai_utils ne l'est qu'à la première vue
+    from django.db import connections
+    from django.core.cache import caches
+    from gameforge import ai_utils
+
+    ai_utils.prepare_for_fork()
+
+    # Les connexions ouvertes pendant le chargement ne doivent pas être partagées entre workers
+    connections.close_all()
+    caches.close_all()
+    server.log.info(f"Modèle préchargé dans le maître (chargé: {ai_utils.MODEL_LOADED})")
+
+
+def post_fork(server, worker):
+    """Dans chaque worker, juste après le fork."""
+    # Sinon tous les workers tirent les mêmes identifiants aléatoires
+    random.seed()
+
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(torch_threads)